@@ -1,8 +1,16 @@
+import os
+import sys
 import requests
 from qdrant_client import QdrantClient
 from qdrant_client.models import Distance, VectorParams, PointStruct
 from qdrant_client.models import Filter, FieldCondition, Range
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.ann import LocalANNClient
+
+# VECTOR_BACKEND=local 時改用本機 IVF 索引（不需要 Qdrant 服務）
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "qdrant")
+
 data = {
     "texts": [
         "人工智慧很有趣",
@@ -26,7 +34,7 @@ else:
     print(f"錯誤:{response.json()}")
     exit()
 
-client = QdrantClient(url="http://localhost:6333")
+client = LocalANNClient() if VECTOR_BACKEND == "local" else QdrantClient(url="http://localhost:6333")
 
 if client.collection_exists("test_collection"):
     client.delete_collection("test_collection")
@@ -1,18 +1,28 @@
-import requests
+import os
+import sys
 import pandas as pd
 import re
 from openai import OpenAI
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
+from qdrant_client.models import PointStruct
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.embedding import EmbeddingClient, EmbeddingError
+from common.retrieval import batch_dense_search
+from common.indexing import sync_collection
+from common.storage import vector_params, search_params
+from common.projection import with_projection
+from common.window_pooling import WindowPooler
+
 # ============================================
 # 設定與初始化
 # ============================================
 
-API_EMBED_URL = "https://ws-04.wade0426.me/embed"
 QDRANT_URL = "http://localhost:6333"
-
+# 向量儲存設定：float32 / float16 / int8 / binary（量化設定查詢時自動 oversampling + rescore）
+STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "float32")
+SEARCH_PARAMS = search_params(STORAGE_PROFILE)
 
 # 連接 Qdrant
 try:
@@ -22,23 +32,44 @@ except Exception as e:
     print(f"❌ 無法連接 Qdrant: {e}")
     exit()
 
+# 設定 EMBED_PROJECTION（如 truncate:512、pca:256）時向量先降維再存入
+embedder = with_projection(EmbeddingClient())
+COLLECTION_CONFIG = {"vectors_config": vector_params(embedder.vector_size(4096), STORAGE_PROFILE)}
+# True 時滑動視窗的向量由句子向量池化而得，重疊的文字不重複送 /embed
+WINDOW_POOLING = os.environ.get("WINDOW_POOLING", "0") == "1"
+
 # ============================================
 # 工具函數
 # ============================================
 
 def get_embeddings(texts):
     """取得文本向量"""
-    response = requests.post(API_EMBED_URL, json={
-        "texts": texts,
-        "normalize": True,
-        "batch_size": 32
-    })
-    if response.status_code == 200:
-        return response.json()
-    else:
-        print(f"❌ 向量生成失敗: {response.status_code}")
+    try:
+        return embedder.embed(texts)
+    except EmbeddingError as e:
+        print(f"❌ 向量生成失敗: {e}")
         return None
 
+def point_builder(pooler=None, source_text=None, **extra_payload):
+    """產生 sync_collection 用的 build_points：為新增切塊取得向量並組成 PointStruct
+
+    給定 pooler 時，向量由 source_text 的句子向量池化而得（切塊須為 source_text 的子字串）。
+    """
+    def build(items):
+        if pooler is not None:
+            vectors = pooler.embed_windows(source_text, [it["text"] for it in items]).tolist()
+        else:
+            vectors = embedder.embed([it["text"] for it in items])
+        return [
+            PointStruct(
+                id=it["id"],
+                vector=vec,
+                payload={"text": it["text"], "chunk_id": it["chunk_id"], **extra_payload}
+            )
+            for it, vec in zip(items, vectors)
+        ]
+    return build
+
 def markdown_to_csv(md_file, csv_file):
     """Markdown 表格轉 CSV"""
     with open(md_file, 'r', encoding='utf-8') as f:
@@ -105,87 +136,29 @@ sliding_splitter = RecursiveCharacterTextSplitter(
 sliding_chunks = sliding_splitter.split_text(text)
 print(f"✅ 滑動視窗切塊產生 {len(sliding_chunks)} 個方塊")
 
-# 3. 生成向量嵌入
-print("\n📊 開始生成向量嵌入...")
-
-# 固定切塊嵌入
-fixed_data = {
-    "texts": fixed_chunks,
-    "normalize": True,
-    "batch_size": 32
-}
-fixed_response = requests.post(API_EMBED_URL, json=fixed_data)
-
-if fixed_response.status_code == 200:
-    fixed_result = fixed_response.json()
-    print(f"✅ 固定切塊向量維度: {fixed_result['dimension']}")
-else:
-    print(f"❌ 固定切塊嵌入失敗")
-    exit()
-
-# 滑動視窗切塊嵌入
-sliding_data = {
-    "texts": sliding_chunks,
-    "normalize": True,
-    "batch_size": 32
-}
-sliding_response = requests.post(API_EMBED_URL, json=sliding_data)
-
-if sliding_response.status_code == 200:
-    sliding_result = sliding_response.json()
-    print(f"✅ 滑動視窗切塊向量維度: {sliding_result['dimension']}")
-else:
-    print(f"❌ 滑動視窗切塊嵌入失敗")
-    exit()
-
-# 4. 存入 Qdrant
-print("\n💾 開始存入 Qdrant...")
-
-# 建立固定切塊集合
-if client.collection_exists("fixed_collection"):
-    client.delete_collection("fixed_collection")
+# 3. 生成向量嵌入並存入 Qdrant（增量同步：只 embed 新增或變動的切塊）
+print("\n📊 開始生成向量嵌入並同步至 Qdrant...")
 
-client.create_collection(
-    collection_name="fixed_collection",
-    vectors_config=VectorParams(size=4096, distance=Distance.COSINE),
-)
-
-# 建立滑動視窗切塊集合
-if client.collection_exists("sliding_collection"):
-    client.delete_collection("sliding_collection")
-
-client.create_collection(
-    collection_name="sliding_collection",
-    vectors_config=VectorParams(size=4096, distance=Distance.COSINE),
-)
-
-# 插入固定切塊向量
-fixed_points = []
-for i, vec in enumerate(fixed_result['embeddings']):
-    fixed_points.append(
-        PointStruct(
-            id=i + 1,
-            vector=vec,
-            payload={"text": fixed_chunks[i], "chunk_type": "fixed", "chunk_id": i}
-        )
+try:
+    fixed_stats = sync_collection(
+        client, "fixed_collection", {"text.txt": fixed_chunks},
+        point_builder(chunk_type="fixed"), COLLECTION_CONFIG, embedder.fingerprint()
     )
+    print(f"✅ 固定切塊：新增 {fixed_stats['added']}、刪除 {fixed_stats['deleted']}、未變動 {fixed_stats['unchanged']}")
 
-client.upsert(collection_name="fixed_collection", points=fixed_points)
-print(f"✅ 成功插入 {len(fixed_points)} 個固定切塊向量")
-
-# 插入滑動視窗切塊向量
-sliding_points = []
-for i, vec in enumerate(sliding_result['embeddings']):
-    sliding_points.append(
-        PointStruct(
-            id=i + 1,
-            vector=vec,
-            payload={"text": sliding_chunks[i], "chunk_type": "sliding", "chunk_id": i}
-        )
+    pooler = WindowPooler(embedder) if WINDOW_POOLING else None
+    sliding_stats = sync_collection(
+        client, "sliding_collection", {"text.txt": sliding_chunks},
+        point_builder(pooler, text, chunk_type="sliding"), COLLECTION_CONFIG,
+        pooler.fingerprint() if pooler else embedder.fingerprint()
     )
-
-client.upsert(collection_name="sliding_collection", points=sliding_points)
-print(f"✅ 成功插入 {len(sliding_points)} 個滑動視窗切塊向量")
+    print(f"✅ 滑動視窗：新增 {sliding_stats['added']}、刪除 {sliding_stats['deleted']}、未變動 {sliding_stats['unchanged']}")
+    if pooler and pooler.stats()["window_chars"]:
+        pstats = pooler.stats()
+        print(f"🧩 句子向量池化：送出 {pstats['unit_chars']} 字（逐視窗需 {pstats['window_chars']} 字，省下 {pstats['saved']:.0%}）")
+except EmbeddingError as e:
+    print(f"❌ 切塊嵌入失敗: {e}")
+    exit()
 
 # ============================================
 # 第二部分：召回測試與比較
@@ -202,47 +175,28 @@ test_queries = [
     "微軟 GraphRAG 的特點是什麼?"
 ]
 
-for query_text in test_queries:
+# 一次生成所有查詢向量，對兩個集合各送一次批次查詢
+query_vectors = get_embeddings(test_queries)
+if not query_vectors:
+    print("❌ 查詢向量生成失敗")
+    exit()
+
+fixed_results = batch_dense_search(client, "fixed_collection", query_vectors, limit=3, search_params=SEARCH_PARAMS)
+sliding_results = batch_dense_search(client, "sliding_collection", query_vectors, limit=3, search_params=SEARCH_PARAMS)
+
+for query_text, fixed_points, sliding_points in zip(test_queries, fixed_results, sliding_results):
     print(f"\n🔍 查詢問題: {query_text}")
     print("-"*60)
     
-    # 生成查詢向量
-    query_data = {
-        "texts": [query_text],
-        "normalize": True,
-        "batch_size": 32
-    }
-    query_response = requests.post(API_EMBED_URL, json=query_data)
-    
-    if query_response.status_code != 200:
-        print("❌ 查詢向量生成失敗")
-        continue
-    
-    query_vector = query_response.json()['embeddings'][0]
-    
-    # 固定切塊查詢
-    fixed_search = client.query_points(
-        collection_name="fixed_collection",
-        query=query_vector,
-        limit=3
-    )
-    
-    # 滑動視窗切塊查詢
-    sliding_search = client.query_points(
-        collection_name="sliding_collection",
-        query=query_vector,
-        limit=3
-    )
-    
     # 比較最高分數
-    fixed_max_score = max([p.score for p in fixed_search.points]) if fixed_search.points else 0
-    sliding_max_score = max([p.score for p in sliding_search.points]) if sliding_search.points else 0
+    fixed_max_score = max([p.score for p in fixed_points]) if fixed_points else 0
+    sliding_max_score = max([p.score for p in sliding_points]) if sliding_points else 0
     
     print(f"\n📊 固定切塊最高分: {fixed_max_score:.4f}")
-    print(f"   最佳結果: {fixed_search.points[0].payload['text'][:80]}...")
+    print(f"   最佳結果: {fixed_points[0].payload['text'][:80]}...")
     
     print(f"\n📊 滑動視窗最高分: {sliding_max_score:.4f}")
-    print(f"   最佳結果: {sliding_search.points[0].payload['text'][:80]}...")
+    print(f"   最佳結果: {sliding_points[0].payload['text'][:80]}...")
     
     winner = "滑動視窗" if sliding_max_score > fixed_max_score else "固定切塊"
     print(f"\n🏆 本次查詢獲勝: {winner}")
@@ -338,15 +292,6 @@ if tables is not None:
     # 5. 將表格摘要和問答對存入 Qdrant
     print("\n💾 開始將表格資料存入 Qdrant...")
     
-    # 建立表格集合
-    if client.collection_exists("table_collection"):
-        client.delete_collection("table_collection")
-    
-    client.create_collection(
-        collection_name="table_collection",
-        vectors_config=VectorParams(size=4096, distance=Distance.COSINE),
-    )
-    
     # 準備所有文本（摘要 + 問答對）
     all_table_texts = [table_summary]
     
@@ -361,39 +306,32 @@ if tables is not None:
     except:
         print("⚠️  問答對格式解析失敗，僅保留摘要")
     
-    # 生成向量
-    table_embed_data = {
-        "texts": all_table_texts,
-        "normalize": True,
-        "batch_size": 32
-    }
-    table_embed_response = requests.post(API_EMBED_URL, json=table_embed_data)
-    
-    if table_embed_response.status_code == 200:
-        table_embed_result = table_embed_response.json()
-        
-        # 存入 Qdrant
-        table_points = []
-        for i, vec in enumerate(table_embed_result['embeddings']):
-            point_type = "table_summary" if i == 0 else "table_qa"
-            table_points.append(
-                PointStruct(
-                    id=i + 1,
-                    vector=vec,
-                    payload={
-                        "text": all_table_texts[i],
-                        "type": point_type,
-                        "source": "table_html.html"
-                    }
-                )
+    # 生成向量並增量同步表格集合（摘要與問答每次由 LLM 重新生成，舊內容會被刪除）
+    def build_table_points(items):
+        vectors = embedder.embed([it["text"] for it in items])
+        return [
+            PointStruct(
+                id=it["id"],
+                vector=vec,
+                payload={
+                    "text": it["text"],
+                    "type": "table_summary" if it["chunk_id"] == 0 else "table_qa",
+                    "source": it["source"]
+                }
             )
-        
-        client.upsert(collection_name="table_collection", points=table_points)
-        print(f"✅ 成功上傳 {len(table_points)} 個表格相關資料到 Qdrant")
+            for it, vec in zip(items, vectors)
+        ]
+
+    try:
+        table_stats = sync_collection(
+            client, "table_collection", {"table_html.html": all_table_texts},
+            build_table_points, COLLECTION_CONFIG, embedder.fingerprint()
+        )
+        print(f"✅ 成功同步 {len(all_table_texts)} 個表格相關資料到 Qdrant（新增 {table_stats['added']}、刪除 {table_stats['deleted']}）")
         print(f"   - 1 個表格摘要")
-        print(f"   - {len(table_points)-1} 個問答對")
-    else:
-        print("❌ 表格向量生成失敗")
+        print(f"   - {len(all_table_texts)-1} 個問答對")
+    except EmbeddingError as e:
+        print(f"❌ 表格向量生成失敗: {e}")
 
 # ============================================
 # 第四部分：表格查詢測試
@@ -405,29 +343,15 @@ print("="*60)
 
 table_queries = ["台中科大有什麼特色?", "學校的發展計畫是什麼?"]
 
-for query_text in table_queries:
+query_vectors = get_embeddings(table_queries) or []
+table_results = batch_dense_search(client, "table_collection", query_vectors, limit=3, search_params=SEARCH_PARAMS)
+
+for query_text, points in zip(table_queries, table_results):
     print(f"\n🔍 查詢問題: {query_text}")
     print("-"*60)
     
-    query_data = {
-        "texts": [query_text],
-        "normalize": True,
-        "batch_size": 32
-    }
-    query_response = requests.post(API_EMBED_URL, json=query_data)
-    
-    if query_response.status_code == 200:
-        query_vector = query_response.json()['embeddings'][0]
-        
-        search_result = client.query_points(
-            collection_name="table_collection",
-            query=query_vector,
-            limit=3
-        )
-        
-        for idx, point in enumerate(search_result.points, 1):
-            print(f"\n結果 {idx}:")
-            print(f"  類型: {point.payload['type']}")
-            print(f"  相似度: {point.score:.4f}")
-            print(f"  內容: {point.payload['text'][:150]}...")
-
+    for idx, point in enumerate(points, 1):
+        print(f"\n結果 {idx}:")
+        print(f"  類型: {point.payload['type']}")
+        print(f"  相似度: {point.score:.4f}")
+        print(f"  內容: {point.payload['text'][:150]}...")
\ No newline at end of file
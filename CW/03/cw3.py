@@ -1,29 +1,51 @@
 import os
+import sys
 import csv
-import requests
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
 
 # --- 1. 配置與路徑設定 ---
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-EMBED_API_URL = "https://ws-04.wade0426.me/embed"
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", ".."))
+from common import startup
+startup.install()  # 以 --startup-profile 執行時記錄各套件匯入耗時
+
+import requests
+from qdrant_client import QdrantClient
+from qdrant_client.models import PointStruct
+from common.embedding import EmbeddingClient, EmbeddingError
+from common.embed_cache import EmbeddingCache
+from common.indexing import IncrementalIndex
+from common.pipeline import IngestPipeline
+from common.corpus import Chunker, iter_corpus, resolve_paths
+from common.storage import vector_params, search_params
+from common.projection import with_projection
+
 LLM_API_URL = "https://ws-02.wade0426.me/v1/chat/completions"
 LLM_MODEL = "gemma-3-27b-it"
 
 COLLECTION_NAME = "CW_03" 
 CHUNK_SIZE = 500  # 稍微加大切塊，讓 Context 更完整
 CHUNK_OVERLAP = 50
+# 語料位置：資料夾或 glob（資料夾時取其下的 data_*.txt）；切塊在 CHUNK_WORKERS 個行程中進行（0 為自動：語料小時在本行程，否則為 CPU 數）
+DATA_PATH = os.environ.get("DATA_PATH", SCRIPT_DIR)
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "0")) or None
+REBUILD_INDEX = False  # True 時刪除集合全量重建，否則只同步變動的切塊
+STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "float32")  # float32 / float16 / int8 / binary
+
+# embedding 快取在第一次使用時才開啟：切塊行程池的子行程會重新匯入本檔
+_embedder = None
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = with_projection(EmbeddingClient(cache=EmbeddingCache()))  # EMBED_PROJECTION 可設定降維
+    return _embedder
 
 def get_embedding(texts):
     """取得向量與維度"""
     try:
-        res = requests.post(EMBED_API_URL, json={
-            "texts": texts, "task_description": "檢索文件", "normalize": True
-        }, timeout=30).json()
-        embs = res.get("embeddings", [])
+        embs = get_embedder().embed(texts, task_description="檢索文件")
         return embs, len(embs[0]) if embs else 0
-    except Exception as e:
+    except EmbeddingError as e:
         print(f"❌ Embedding 錯誤: {e}")
         return None, 0
 
@@ -44,42 +66,55 @@ def call_llm(system_prompt, user_prompt):
         return ""
 
 def main():
+    startup.finish()
+    embedder = get_embedder()
+
     # 連接 Qdrant (請確保 sudo docker 已啟動)
     client = QdrantClient("localhost", port=6333)
     
     # --- A. 準備 VDB ---
     print(f"🚀 初始化 VDB: {COLLECTION_NAME}")
-    _, dim = get_embedding(["測試"])
-    if dim == 0: 
-        print("❌ 無法偵測維度，請檢查網路或 API URL"); return
-        
-    if client.collection_exists(COLLECTION_NAME): 
-        client.delete_collection(COLLECTION_NAME)
-    client.create_collection(COLLECTION_NAME, vectors_config=VectorParams(size=dim, distance=Distance.COSINE))
-
-    # --- B. 切塊與匯入資料 ---
-    splitter = RecursiveCharacterTextSplitter(chunk_size=CHUNK_SIZE, chunk_overlap=CHUNK_OVERLAP)
-    all_points = []
-    p_idx = 0
-    
-    # 搜尋同資料夾下的 data_01.txt ~ data_05.txt
-    for i in range(1, 6):
-        path = os.path.join(SCRIPT_DIR, f"data_0{i}.txt")
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                content = f.read()
-                chunks = splitter.split_text(content)
-                embs, _ = get_embedding(chunks)
-                if embs:
-                    for c, e in zip(chunks, embs):
-                        all_points.append(PointStruct(id=p_idx, vector=e, payload={"text": c, "source": f"data_0{i}.txt"}))
-                        p_idx += 1
-    
-    if all_points:
-        client.upsert(COLLECTION_NAME, all_points)
-        print(f"✅ 已存入 {p_idx} 個語意塊至 Qdrant")
-    else:
-        print("❌ 找不到 data_*.txt 檔案，請檢查檔案名稱與位置")
+    # 維度記錄在模型登錄檔，只有第一次才需要呼叫 API
+    try:
+        dim = embedder.vector_size()
+    except EmbeddingError as e:
+        print(f"❌ 無法偵測維度，請檢查網路或 API URL: {e}"); return
+
+    # --- B. 串流切塊與增量匯入資料 ---
+    # 讀檔與切塊在行程池中進行，embedding、upsert 同時進行，階段間以有界佇列相連，記憶體不隨語料成長
+    if not resolve_paths(DATA_PATH, "data_*.txt"):
+        print(f"❌ 在 {DATA_PATH} 找不到 data_*.txt 檔案，請檢查檔案名稱與位置"); return
+    chunker = Chunker("recursive", CHUNK_SIZE, CHUNK_OVERLAP)
+
+    config = {"vectors_config": vector_params(dim, STORAGE_PROFILE)}
+    index = IncrementalIndex(client, COLLECTION_NAME, config, embedder.fingerprint(), rebuild=REBUILD_INDEX)
+
+    def split(source, chunks):
+        # 只把新增或變動的切塊送往 embedding
+        return index.plan_source(source, chunks)
+
+    def embed(items):
+        embs = embedder.embed([it["text"] for it in items], task_description="檢索文件")
+        return [PointStruct(id=it["id"], vector=e, payload={"text": it["text"], "source": it["source"]})
+                for it, e in zip(items, embs)]
+
+    def upsert(points):
+        client.upsert(index.target, points)
+
+    pipeline = IngestPipeline(split, embed, upsert, embed_workers=embedder.max_concurrency)
+    try:
+        corpus = iter_corpus(DATA_PATH, chunker, workers=CHUNK_WORKERS, pattern="data_*.txt")
+        pipeline.run(files=((f.source, f.chunks) for f in corpus))
+        stats = index.commit()
+    except EmbeddingError as e:
+        index.abort()
+        print(f"❌ Embedding 錯誤: {e}"); return
+    except Exception:
+        # 任何失敗都要刪除未完成的新版本，否則它會佔用 gc_versions 保留的版本數
+        index.abort()
+        raise
+    print(f"✅ 同步完成：新增 {stats['added']}、刪除 {stats['deleted']}、未變動 {stats['unchanged']} 個語意塊")
+    print(pipeline.report())
 
     # --- C. 處理 CSV 問題集 (Query Re-Write 核心) ---
     input_path = os.path.join(SCRIPT_DIR, "Re_Write_questions.csv")
@@ -116,7 +151,7 @@ def main():
 
             # 2. 檢索 (Retrieval)
             q_emb, _ = get_embedding([search_query])
-            hits = client.query_points(COLLECTION_NAME, query=q_emb[0], limit=3).points
+            hits = client.query_points(COLLECTION_NAME, query=q_emb[0], limit=3, search_params=search_params(STORAGE_PROFILE)).points
             
             context = "\n".join([h.payload["text"] for h in hits])
             source = hits[0].payload["source"] if hits else "未知"
@@ -140,6 +175,7 @@ def main():
         writer.writerows(final_results)
     
     print(f"\n🎉 處理完成！結果已存至: {out_path}")
+    print(f"📦 Embedding 快取: {embedder.cache.stats()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
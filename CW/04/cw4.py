@@ -1,94 +1,147 @@
 import os
+import sys
 import csv
-import uuid
-import torch
+
+# --- 配置與路徑 ---
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(SCRIPT_DIR, "..", ".."))
+from common import startup
+startup.install()  # 以 --startup-profile 執行時記錄各套件匯入耗時
+
 import requests
 from qdrant_client import QdrantClient, models
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from transformers import AutoTokenizer, AutoModelForCausalLM
+from common.embedding import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.retrieval import batch_hybrid_search, batch_local_hybrid_search
+from common.indexing import sync_collection, point_id
+from common.corpus import Chunker, load_corpus
+from common.bm25 import BM25Index, TOKENIZER_VERSION
+from common.storage import vector_params, search_params
+from common.projection import with_projection
+from common.reranker import Qwen3Reranker, RerankerError
+from common.rerank_cache import RerankScoreCache, DEFAULT_RERANK_CACHE
+from common.rerank_server import RerankClient
+from common.cascade import CascadeReranker
 
 # 強制禁用連線，確保讀取本地模型
 os.environ['TRANSFORMERS_OFFLINE'] = '1'
 os.environ['HF_DATASETS_OFFLINE'] = '1'
 
-# --- 配置與路徑 ---
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-EMBED_API_URL = "https://ws-04.wade0426.me/embed"
 LLM_API_URL = "https://ws-03.wade0426.me/v1/chat/completions"
 LLM_MODEL = "/models/gpt-oss-120b"
 RERANKER_PATH = os.path.expanduser("~/AI/Models/Qwen3-Reranker-0.6B")
 COLLECTION_NAME = "CW_04_Hybrid_Final"
+REBUILD_INDEX = False  # True 時刪除集合全量重建，否則只同步變動的切塊
+STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "float32")  # float32 / float16 / int8 / binary
+RERANK_PREFIX_CACHE = True  # 同一問題的候選共用「指令 + 查詢」前綴的 KV cache
+RERANK_BACKEND = os.environ.get("RERANK_BACKEND", "torch")  # torch / int8 / onnx（後兩者適合只有 CPU 時）
+RERANK_THREADS = int(os.environ.get("RERANK_THREADS", "0")) or None
+# 設定後改用本機 rerank 服務（python -m common.rerank_server），例如 http://127.0.0.1:8765 或 unix:///tmp/reranker.sock
+RERANKER_URL = os.environ.get("RERANKER_URL")
+# Cascade（RERANK_CASCADE=1 啟用，預設關閉維持原排序）：以 RRF 分數先篩掉明顯無關 / 直接採用明顯相關的候選，
+# 每題最多 8 個候選送進 reranker
+RERANK_CASCADE = os.environ.get("RERANK_CASCADE", "0") == "1"
+CASCADE_MAX_EXPENSIVE = 8
+# 每題送進 reranker 的延遲預算（毫秒，0 為不限）；每配對成本由第一題的少量候選實測估計
+CASCADE_LATENCY_MS = float(os.environ.get("CASCADE_LATENCY_MS", "0")) or None
+# sparse 檢索：qdrant（Qdrant/bm25 模型）/ local-sparse（本機 BM25 匯出成 sparse vector）/ local-fusion（本機 BM25 + 本機 RRF）
+SPARSE_BACKEND = os.environ.get("SPARSE_BACKEND", "qdrant")
+# 語料位置：資料夾或 glob（資料夾時取其下的 data_*.txt）；切塊在 CHUNK_WORKERS 個行程中進行（0 為自動：語料小時在本行程，否則為 CPU 數）
+DATA_PATH = os.environ.get("DATA_PATH", SCRIPT_DIR)
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "0")) or None
+
+# --- 1. Reranker（分數快取未命中時才匯入 torch / transformers 並載入模型，或確認 rerank 服務可用） ---
+# reranker、embedding 快取都在第一次使用時才建立：切塊行程池的子行程會重新匯入本檔
+_reranker = None
+_cascade = None
+_embedder = None
+
+def get_reranker():
+    """分數快取：重跑相同問題時 rerank 幾乎不需計算（也不必載入模型）"""
+    global _reranker
+    if _reranker is None:
+        if RERANKER_URL:
+            _reranker = RerankClient(RERANKER_URL)
+        else:
+            _reranker = Qwen3Reranker(RERANKER_PATH, prefix_cache=RERANK_PREFIX_CACHE,
+                                      cache=RerankScoreCache(path=DEFAULT_RERANK_CACHE),
+                                      backend=RERANK_BACKEND, num_threads=RERANK_THREADS)
+    return _reranker
 
-# --- 1. 載入模型 ---
-print("⌛ 正在載入 Reranker 模型...")
-try:
-    tokenizer = AutoTokenizer.from_pretrained(RERANKER_PATH, local_files_only=True, trust_remote_code=True, use_fast=False)
-    # 修正警告：使用 dtype 代替 torch_dtype
-    model = AutoModelForCausalLM.from_pretrained(
-        RERANKER_PATH, local_files_only=True, trust_remote_code=True, 
-        dtype=torch.float16, low_cpu_mem_usage=True
-    ).eval()
-    device = "cuda" if torch.cuda.is_available() else "cpu"
-    model.to(device)
-    print(f"✅ 模型載入成功，運行於: {device}")
-except Exception as e:
-    print(f"❌ 模型載入失敗: {e}"); exit(1)
-
-token_false_id = tokenizer.convert_tokens_to_ids("no")
-token_true_id = tokenizer.convert_tokens_to_ids("yes")
+def get_cascade():
+    global _cascade
+    if _cascade is None:
+        _cascade = CascadeReranker(get_reranker(), cheap="score", max_expensive=CASCADE_MAX_EXPENSIVE,
+                                   latency_budget_ms=CASCADE_LATENCY_MS)
+    return _cascade
+
+def get_embedder():
+    global _embedder
+    if _embedder is None:
+        _embedder = with_projection(EmbeddingClient(cache=EmbeddingCache()))  # EMBED_PROJECTION 可設定降維
+    return _embedder
 
 def get_embeddings(texts, task="檢索文件"):
-    res = requests.post(EMBED_API_URL, json={"texts": texts, "task_description": task, "normalize": True}).json()
-    return res.get("embeddings", [])
+    return get_embedder().embed(texts, task_description=task)
 
 def call_llm(prompt):
     res = requests.post(LLM_API_URL, json={"model": LLM_MODEL, "messages": [{"role": "user", "content": prompt}], "temperature": 0.1}).json()
     return res["choices"][0]["message"]["content"].strip()
 
-@torch.no_grad()
-def rerank_docs(query, candidates, limit=3):
-    """重排評分邏輯"""
-    if not candidates: return []
-    pairs = [f"<Instruct>: 根據查詢檢索相關的技術文件\n<Query>: {query}\n<Document>: {d}" for d in candidates]
-    
-    scores = []
-    for p in pairs:
-        inputs = tokenizer(p, padding=True, truncation=True, return_tensors="pt", max_length=2048).to(model.device)
-        logits = model(**inputs).logits[:, -1, :]
-        batch_scores = torch.stack([logits[:, token_false_id], logits[:, token_true_id]], dim=1)
-        prob = torch.nn.functional.softmax(batch_scores, dim=1)[:, 1].item()
-        scores.append(prob)
-    
-    combined = sorted(zip(candidates, scores), key=lambda x: x[1], reverse=True)
-    return [item[0] for item in combined[:limit]]
+def report_source_hits(rows, all_hits, all_top):
+    """以 questions_answer.csv 的「來源文件」計算前 3 名是否包含正確來源的切塊"""
+    answer_csv = os.path.join(SCRIPT_DIR, "questions_answer.csv")
+    if not os.path.exists(answer_csv):
+        return
+    with open(answer_csv, "r", encoding="utf-8-sig") as f:
+        sources = {r["題目_ID"]: r["來源文件"] for r in csv.DictReader(f)}
+    hits = total = 0
+    for r, search_res, top in zip(rows, all_hits, all_top):
+        expected = sources.get(r.get("題目_ID"))
+        if not expected:
+            continue
+        text_source = {p.payload["text"]: p.payload.get("source") for p in search_res}
+        hits += any(text_source.get(t) == expected for t in top)
+        total += 1
+    if total:
+        print(f"🎯 前 3 名來源命中率: {hits}/{total} = {hits / total:.1%}")
 
 def main():
+    startup.finish()
     client = QdrantClient("localhost", port=6333)
+    embedder, reranker, cascade = get_embedder(), get_reranker(), get_cascade()
     
-    # 2. 初始化 Hybrid 集合
-    sample_emb = get_embeddings(["測試"])
-    dim = len(sample_emb[0])
-    if client.collection_exists(COLLECTION_NAME): client.delete_collection(COLLECTION_NAME)
-    client.create_collection(
-        COLLECTION_NAME,
-        vectors_config={"dense": models.VectorParams(size=dim, distance=models.Distance.COSINE)},
-        sparse_vectors_config={"sparse": models.SparseVectorParams(modifier=models.Modifier.IDF)}
-    )
-
-    # 3. 匯入資料
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    for i in range(1, 6):
-        path = os.path.join(SCRIPT_DIR, f"data_0{i}.txt")
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                chunks = splitter.split_text(f.read())
-                embs = get_embeddings(chunks)
-                points = [models.PointStruct(
-                    id=uuid.uuid4().hex,
-                    vector={"dense": e, "sparse": models.Document(text=c, model="Qdrant/bm25")},
-                    payload={"text": c, "source": f"data_0{i}.txt"}
-                ) for c, e in zip(chunks, embs)]
-                client.upsert(COLLECTION_NAME, points)
+    # 2. 初始化 Hybrid 集合（維度記錄在模型登錄檔，只有第一次才需要呼叫 API）
+    dim = embedder.vector_size()
+    config = {
+        "vectors_config": {"dense": vector_params(dim, STORAGE_PROFILE)},
+        "sparse_vectors_config": {"sparse": models.SparseVectorParams(modifier=models.Modifier.IDF)},
+    }
+
+    # 3. 匯入資料（增量同步：point id 由來源與內容雜湊決定，只處理變動的切塊）
+    docs = load_corpus(DATA_PATH, Chunker("recursive", 500, 50), workers=CHUNK_WORKERS, pattern="data_*.txt")
+
+    def sparse_vector(text):
+        if SPARSE_BACKEND == "local-sparse":
+            indices, values = BM25Index.doc_sparse(text)
+            return models.SparseVector(indices=indices, values=values)
+        return models.Document(text=text, model="Qdrant/bm25")
+
+    def build_points(items):
+        embs = get_embeddings([it["text"] for it in items])
+        vectors = [{"dense": e} if SPARSE_BACKEND == "local-fusion" else {"dense": e, "sparse": sparse_vector(it["text"])}
+                   for it, e in zip(items, embs)]
+        return [models.PointStruct(
+            id=it["id"],
+            vector=v,
+            payload={"text": it["text"], "source": it["source"]}
+        ) for it, v in zip(items, vectors)]
+
+    fingerprint = f"{embedder.fingerprint()}|sparse={SPARSE_BACKEND}"
+    if SPARSE_BACKEND == "local-sparse":
+        fingerprint += f"|bm25={TOKENIZER_VERSION}"  # 斷詞規則改變時重建 sparse vector
+    stats = sync_collection(client, COLLECTION_NAME, docs, build_points, config, fingerprint, rebuild=REBUILD_INDEX)
+    print(f"✅ 同步完成：新增 {stats['added']}、刪除 {stats['deleted']}、未變動 {stats['unchanged']} 個區塊")
 
     # 4. 處理問題 (修正欄位為「題目」)
     input_csv = os.path.join(SCRIPT_DIR, "questions.csv")
@@ -99,24 +152,38 @@ def main():
     # 根據你的錯誤訊息，這裡手動指定為 '題目'
     q_col = '題目' 
 
-    for idx, r in enumerate(rows, 1):
-        user_q = r[q_col].strip()
-        q_emb = get_embeddings([user_q], task="查詢")
-        
-        # Hybrid Search
-        search_res = client.query_points(
-            COLLECTION_NAME,
-            prefetch=[
-                models.Prefetch(query=models.Document(text=user_q, model="Qdrant/bm25"), using="sparse", limit=15),
-                models.Prefetch(query=q_emb[0], using="dense", limit=15),
-            ],
-            query=models.FusionQuery(fusion=models.Fusion.RRF),
-            limit=15
-        ).points
-        
-        # ReRank
-        candidates = [p.payload["text"] for p in search_res]
-        top_context = "\n\n".join(rerank_docs(user_q, candidates))
+    # 一次取得所有問題的向量，再以批次 Hybrid Search 檢索
+    questions = [r[q_col].strip() for r in rows]
+    q_embs = get_embeddings(questions, task="查詢")
+    if SPARSE_BACKEND == "local-fusion":
+        # 與集合中的 point id 相同（重複切塊只保留一份）
+        items = list({point_id(src, t): {"text": t, "source": src} for src, chunks in docs.items() for t in chunks}.items())
+        bm25 = BM25Index([payload["text"] for _, payload in items])
+        all_hits = batch_local_hybrid_search(client, COLLECTION_NAME, questions, q_embs, bm25, items, limit=15,
+                                             prefetch_limit=15, search_params=search_params(STORAGE_PROFILE))
+    else:
+        sparse_queries = None
+        if SPARSE_BACKEND == "local-sparse":
+            sparse_queries = [models.SparseVector(indices=i, values=v) for i, v in map(BM25Index.query_sparse, questions)]
+        all_hits = batch_hybrid_search(client, COLLECTION_NAME, questions, q_embs, limit=15, prefetch_limit=15,
+                                       search_params=search_params(STORAGE_PROFILE), sparse_queries=sparse_queries)
+
+    # ReRank：所有問題的候選合併成動態批次一起計分
+    all_candidates = [[p.payload["text"] for p in search_res] for search_res in all_hits]
+    try:
+        if RERANK_CASCADE:
+            all_top = cascade.rerank_many([(q, c, [p.score for p in hits])
+                                           for q, c, hits in zip(questions, all_candidates, all_hits)], limit=3)
+        else:
+            all_scores = reranker.score_many(list(zip(questions, all_candidates)))
+            all_top = [reranker.rerank(q, c, limit=3, scores=s)
+                       for q, c, s in zip(questions, all_candidates, all_scores)]
+    except RerankerError as e:
+        print(f"❌ {e}"); exit(1)
+    report_source_hits(rows, all_hits, all_top)
+
+    for idx, (r, user_q, top) in enumerate(zip(rows, questions, all_top), 1):
+        top_context = "\n\n".join(top)
         
         r['answer'] = call_llm(f"資料：\n{top_context}\n\n問題：{user_q}\n請簡潔回答。")
         print(f"[{idx}/{len(rows)}] ✅ 已處理: {user_q[:20]}...")
@@ -130,6 +197,13 @@ def main():
         writer.writeheader()
         writer.writerows(rows)
     print(f"🎉 全部完成！結果已存至: {out_path}")
+    print(f"📦 Embedding 快取: {embedder.cache.stats()}")
+    if RERANK_CASCADE:
+        print(f"📦 Cascade: {cascade.stats()}")
+    if reranker.cache is not None:
+        print(f"📦 Rerank 快取: {reranker.cache.stats()}")
+    else:
+        print(f"📦 Rerank 服務: {reranker.stats()}")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,12 +1,17 @@
-import pdfplumber
-from docling.document_converter import DocumentConverter
-from markitdown import MarkItDown
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import startup
+startup.install()  # 以 --startup-profile 執行時記錄各套件匯入耗時
 
 # 設定檔案路徑
 PDF_FILE = "example.pdf"
 
+# 各轉換工具在使用時才匯入（docling 匯入就要數秒）
+
 def run_pdfplumber():
+    import pdfplumber
     print("正在執行 pdfplumber 轉換...")
     output_path = "output_plumber.md"
     with pdfplumber.open(PDF_FILE) as pdf:
@@ -21,6 +26,7 @@ def run_pdfplumber():
     print(f"完成！存檔至: {output_path}")
 
 def run_docling():
+    from docling.document_converter import DocumentConverter
     print("正在執行 Docling 轉換...")
     output_path = "output_docling.md"
     converter = DocumentConverter()
@@ -32,6 +38,7 @@ def run_docling():
     print(f"完成！存檔至: {output_path}")
 
 def run_markitdown():
+    from markitdown import MarkItDown
     print("正在執行 Markitdown 轉換...")
     output_path = "output_markitdown.md"
     md = MarkItDown()
@@ -42,6 +49,7 @@ def run_markitdown():
     print(f"完成！存檔至: {output_path}")
 
 if __name__ == "__main__":
+    startup.finish()
     if not os.path.exists(PDF_FILE):
         print(f"找不到檔案: {PDF_FILE}，請確認檔案是否存在。")
     else:
@@ -1,11 +1,13 @@
 import os
+import sys
 import logging
 from pathlib import Path
-from docling.datamodel.base_models import InputFormat
-from docling.datamodel.pipeline_options import PdfPipelineOptions, VlmPipelineOptions
-from docling.datamodel.pipeline_options_vlm_model import ApiVlmOptions, ResponseFormat
-from docling.document_converter import DocumentConverter, PdfFormatOption
-from docling.pipeline.vlm_pipeline import VlmPipeline
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import startup
+startup.install()  # 以 --startup-profile 執行時記錄各套件匯入耗時
+
+# docling 匯入就要數秒，改在各任務函數中才匯入
 
 # 定義檔案路徑
 source_pdf = "sample_table.pdf"
@@ -18,7 +20,9 @@ def olmocr2_vlm_options(
     max_tokens: int = 4096,
     temperature: float = 0.0,
     api_key: str = "",
-) -> ApiVlmOptions:
+) -> "ApiVlmOptions":
+    from docling.datamodel.pipeline_options_vlm_model import ApiVlmOptions, ResponseFormat
+
     headers = {}
     if api_key:
         headers["Authorization"] = f"Bearer {api_key}"
@@ -40,6 +44,10 @@ def olmocr2_vlm_options(
 
 # --- 任務 4: 關閉 OCR (純文字提取) ---
 def run_task_4():
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import PdfPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+
     print("--- 執行任務 4: Docling (OCR Off) ---")
     pdf_options = PdfPipelineOptions(do_ocr=False) # 範例要求關閉 OCR
     
@@ -56,6 +64,11 @@ def run_task_4():
 
 # --- 任務 5: 使用 olmOCR-2 (VLM Pipeline) ---
 def run_task_5():
+    from docling.datamodel.base_models import InputFormat
+    from docling.datamodel.pipeline_options import VlmPipelineOptions
+    from docling.document_converter import DocumentConverter, PdfFormatOption
+    from docling.pipeline.vlm_pipeline import VlmPipeline
+
     print("--- 執行任務 5: Docling (olmOCR-2) ---")
     
     # 配置 VLM pipeline 選項
@@ -85,6 +98,7 @@ def run_task_5():
     print("任務 5 完成，請檢查 output_task5.md")
 
 if __name__ == "__main__":
+    startup.finish()
     if os.path.exists(source_pdf):
         run_task_4()
         run_task_5()
@@ -1,57 +1,72 @@
 import os
+import sys
 import pandas as pd
 import requests
 import json
-import re
-import numpy as np
-import time
 from qdrant_client import QdrantClient
-from qdrant_client.models import Distance, VectorParams, PointStruct
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_experimental.text_splitter import SemanticChunker
-
-class CustomEmbeddings:
-    def embed_documents(self, texts):
-        return get_embeddings(texts)
-    def embed_query(self, text):
-        return get_embeddings([text])[0]
+from qdrant_client.models import PointStruct
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.embedding import EmbeddingClient, EmbeddingError
+from common.embed_cache import EmbeddingCache
+from common.retrieval import batch_dense_search
+from common.indexing import sync_collection
+from common.storage import vector_params, search_params
+from common.projection import with_projection
+from common.semantic_chunker import SemanticChunker
+from common.window_pooling import WindowPooler
+from common.corpus import Chunker, load_corpus, resolve_sources
 
 # ============================================
 # 配置區
 # ============================================
-API_EMBED_URL = "https://ws-04.wade0426.me/embed"
 QDRANT_URL = "http://localhost:6333"
 SERVER_URL = "https://hw-01.wade0426.me/submit_answer"
 
-client = QdrantClient(url=QDRANT_URL)
-
 # 切塊參數
 chunk_size = 500
 chunk_overlap = 250
 
+# 語料位置：資料夾或 glob（資料夾時取其下的 data_*.txt）；切塊在 CHUNK_WORKERS 個行程中進行（0 為自動：語料小時在本行程，否則為 CPU 數）
+DATA_PATH = os.environ.get("DATA_PATH", os.path.dirname(os.path.abspath(__file__)))
+CHUNK_WORKERS = int(os.environ.get("CHUNK_WORKERS", "0")) or None
+
+# True 時刪除集合全量重建，False 時只同步有變動的切塊
+REBUILD_INDEX = False
+
+# 向量儲存設定：float32 / float16 / int8 / binary
+STORAGE_PROFILE = os.environ.get("STORAGE_PROFILE", "float32")
+
+# True 時滑動視窗的向量由句子向量池化而得，重疊的文字不重複送 /embed
+WINDOW_POOLING = os.environ.get("WINDOW_POOLING", "0") == "1"
+
 # 語意切塊參數（可調整）
+SEMANTIC_MODE = os.environ.get("SEMANTIC_MODE", "threshold")  # threshold / percentile
 SEMANTIC_THRESHOLD = 0.5  # 0.3=切很細, 0.5=中等, 0.7=切很粗
+SEMANTIC_PERCENTILE = 10  # percentile 模式：相似度最低的 10% 處切開
+SEMANTIC_MIN_CHARS = 0    # 區塊未達此長度不切
+SEMANTIC_MAX_CHARS = None  # 區塊超過此長度強制切開（None 為不限）
 
 # ============================================
 # 工具函數
 # ============================================
 
-def get_embeddings(texts, max_retries=3):
-    """呼叫 API 取得 embeddings，帶重試機制"""
-    for attempt in range(max_retries):
-        try:
-            res = requests.post(API_EMBED_URL, json={"texts": texts, "normalize": True}, timeout=30)
-            if res.status_code == 200:
-                return res.json()['embeddings']
-            else:
-                print(f"⚠️  API 回傳 {res.status_code}, 重試 {attempt+1}/{max_retries}...")
-                time.sleep(1)
-        except Exception as e:
-            print(f"❌ API 呼叫錯誤: {e}, 重試 {attempt+1}/{max_retries}...")
-            time.sleep(1)
-    
-    print(f"❌ API 呼叫失敗，已重試 {max_retries} 次")
-    return None
+# Qdrant 連線與 embedding 快取在第一次使用時才建立：切塊行程池的子行程會重新匯入本檔
+_client = None
+_embedder = None
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = QdrantClient(url=QDRANT_URL)
+    return _client
+
+def get_embedder():
+    """設定 EMBED_PROJECTION（如 truncate:512、pca:256）時向量先降維再存入"""
+    global _embedder
+    if _embedder is None:
+        _embedder = with_projection(EmbeddingClient(max_retries=3, cache=EmbeddingCache()))
+    return _embedder
 
 def submit_homework_and_get_score(q_id, answer):
     payload = {"q_id": q_id, "student_answer": answer}
@@ -62,82 +77,49 @@ def submit_homework_and_get_score(q_id, answer):
     except:
         return 0
 
-def setup_collection(name, chunks, payloads):
-    if client.collection_exists(name):
-        client.delete_collection(name)
-    client.create_collection(
-        collection_name=name,
-        vectors_config=VectorParams(size=4096, distance=Distance.COSINE),
-    )
-    vecs = get_embeddings(chunks)
-    if not vecs:
-        print(f"❌ 無法為集合 {name} 建立 embeddings")
+def build_points(items):
+    """為新增的切塊取得向量並組成 PointStruct"""
+    vecs = get_embedder().embed([it["text"] for it in items])
+    return [
+        PointStruct(id=it["id"], vector=vec, payload={"text": it["text"], "source": it["source"]})
+        for it, vec in zip(items, vecs)
+    ]
+
+def pooled_build_points(pooler, texts):
+    """滑動視窗用的 build_points：向量由原文的句子向量池化而得"""
+    def build(items):
+        points = []
+        for source in dict.fromkeys(it["source"] for it in items):
+            group = [it for it in items if it["source"] == source]
+            vecs = pooler.embed_windows(texts[source], [it["text"] for it in group])
+            points.extend(
+                PointStruct(id=it["id"], vector=vec.tolist(), payload={"text": it["text"], "source": it["source"]})
+                for it, vec in zip(group, vecs)
+            )
+        return points
+    return build
+
+def setup_collection(name, docs, builder=build_points, fingerprint=None, prune=True):
+    """增量同步集合：只 embed / upsert 新的切塊，刪除已不存在的切塊（prune=False 時保留不在 docs 中的來源）"""
+    embedder = get_embedder()
+    config = {"vectors_config": vector_params(embedder.vector_size(4096), STORAGE_PROFILE)}
+    try:
+        stats = sync_collection(get_client(), name, docs, builder, config, fingerprint or embedder.fingerprint(),
+                                rebuild=REBUILD_INDEX, prune_missing_sources=prune)
+    except EmbeddingError as e:
+        print(f"❌ 無法為集合 {name} 建立 embeddings: {e}")
         return
-    points = [PointStruct(id=i, vector=vecs[i], payload=payloads[i]) for i in range(len(chunks))]
-    client.upsert(collection_name=name, points=points)
-
-def semantic_chunking(text, threshold=0.5):
-    """真正的語意切塊實作"""
-    # 1. 按標點符號切成句子
-    sentences = re.split(r'([。！？\n]+)', text)
-    sentences = [''.join(sentences[i:i+2]).strip() for i in range(0, len(sentences)-1, 2) if i+1 < len(sentences)]
-    sentences = [s for s in sentences if len(s) > 5]
-    
-    if len(sentences) == 0:
-        return [text]
-    if len(sentences) == 1:
-        return sentences
-    
-    # 2. 計算每個句子的 embedding
-    embeddings = get_embeddings(sentences)
-    
-    if not embeddings:
-        # 回退策略：簡單切塊
-        chunks = []
-        for i in range(0, len(text), 500):
-            chunks.append(text[i:i+500])
-        return chunks
-    
-    embeddings = np.array(embeddings)
-    
-    # 3. 計算相鄰句子的餘弦相似度
-    similarities = []
-    for i in range(len(embeddings) - 1):
-        sim = float(np.dot(embeddings[i], embeddings[i+1]))
-        similarities.append(sim)
-    
-    if not similarities:
-        return [text]
-    
-    # 4. 找出相似度低於閾值的切分點
-    split_points = []
-    for i, sim in enumerate(similarities):
-        if sim < threshold:
-            split_points.append(i + 1)
-    
-    # 5. 根據切分點組合句子成區塊
-    chunks = []
-    start = 0
-    for split_point in split_points:
-        chunk = ''.join(sentences[start:split_point])
-        if chunk.strip():
-            chunks.append(chunk)
-        start = split_point
-    
-    last_chunk = ''.join(sentences[start:])
-    if last_chunk.strip():
-        chunks.append(last_chunk)
-    
-    return chunks if chunks else [text]
+    print(f"   🔄 新增 {stats['added']}、刪除 {stats['deleted']}、未變動 {stats['unchanged']} 個區塊")
 
 # ============================================
 # 主程式
 # ============================================
 
 def main():
+    client, embedder = get_client(), get_embedder()
     base_dir = os.path.dirname(os.path.abspath(__file__))
     questions_path = os.path.join(base_dir, "questions.csv")
-    data_files = [os.path.join(base_dir, f"data_0{i}.txt") for i in range(1, 6)]
+    files = resolve_sources(DATA_PATH, "data_*.txt")
 
     if not os.path.exists(questions_path):
         print("❌ 找不到 questions.csv，請確認檔案路徑！")
@@ -149,60 +131,75 @@ def main():
 
     all_results = []
     
-    custom_emb = CustomEmbeddings()
-    
-    fixed_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=0)
-    sliding_splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    fixed_splitter = Chunker("recursive", chunk_size, 0)
+    sliding_splitter = Chunker("sliding", chunk_size, chunk_overlap)
 
     method_map = {
         "固定大小": ("fixed", fixed_splitter),
         "滑動視窗": ("sliding", sliding_splitter),
-        "語意切塊": ("semantic", None)
+        "語意切塊": ("semantic", SemanticChunker(embedder, mode=SEMANTIC_MODE, threshold=SEMANTIC_THRESHOLD,
+                                              percentile=SEMANTIC_PERCENTILE, min_chars=SEMANTIC_MIN_CHARS,
+                                              max_chars=SEMANTIC_MAX_CHARS))
     }
 
     print(f"✨ 開始執行 RAG 作業流程 ✨")
     print("=" * 60)
 
+    # 問題向量與切塊方法無關，一次取得後各方法共用
+    q_ids = df['q_id'].tolist()
+    q_vecs, failed = embedder.embed_partial([str(q) for q in df['question']])
+    for i in failed:
+        print(f"  ❌ Q{q_ids[i]}: embedding 失敗，跳過")
+    valid = [i for i in range(len(q_ids)) if q_vecs[i] is not None]
+
     for m_name, (m_type, splitter) in method_map.items():
         print(f"🚀 正在執行方法：{m_name} ...")
-        all_chunks, all_payloads = [], []
-        
-        for f_path in data_files:
-            if not os.path.exists(f_path): continue
-            with open(f_path, "r", encoding="utf-8") as f:
-                content = f.read()
-                
-                if m_type == "semantic":
-                    chunks = semantic_chunking(content, threshold=SEMANTIC_THRESHOLD)
-                else:
-                    chunks = splitter.split_text(content)
-                
-                all_chunks.extend(chunks)
-                for c in chunks:
-                    all_payloads.append({"text": c, "source": os.path.basename(f_path)})
-
-        print(f"   📦 {m_name} 總共切出 {len(all_chunks)} 個區塊")
+        docs, texts, failed = {}, {}, []
+
+        if m_type == "semantic":
+            # 逐檔切塊；句子 embedding 有快取，重跑時不再呼叫 API。失敗時跳過該檔而不改用固定長度切塊
+            for f_path, source in files:
+                with open(f_path, "r", encoding="utf-8") as f:
+                    content = f.read()
+                try:
+                    docs[source] = splitter.chunk(content)
+                except EmbeddingError as e:
+                    print(f"   ❌ {source} 語意切塊失敗（句子 embedding 無法取得），略過此檔: {e}")
+                    failed.append(source)
+        else:
+            docs = load_corpus(DATA_PATH, splitter, workers=CHUNK_WORKERS, pattern="data_*.txt")
+            if m_type == "sliding" and WINDOW_POOLING:
+                for f_path, source in files:
+                    with open(f_path, "r", encoding="utf-8") as f:
+                        texts[source] = f.read()
+
+        print(f"   📦 {m_name} 總共切出 {sum(len(c) for c in docs.values())} 個區塊")
         coll_name = f"hw5_{m_name.encode('utf-8').hex()}"
-        setup_collection(coll_name, all_chunks, all_payloads)
+        if m_type == "sliding" and WINDOW_POOLING:
+            pooler = WindowPooler(embedder)
+            setup_collection(coll_name, docs, pooled_build_points(pooler, texts), pooler.fingerprint())
+            pstats = pooler.stats()
+            if pstats["window_chars"]:
+                print(f"   🧩 句子向量池化：送出 {pstats['unit_chars']} 字（逐視窗需 {pstats['window_chars']} 字，"
+                      f"省下 {pstats['saved']:.0%}）")
+        elif failed:
+            # 切塊失敗的檔案不在 docs 中，不可當成已刪除而清掉其既有切塊
+            print(f"   ⚠️  {len(failed)} 個檔案切塊失敗，本次同步保留其既有切塊")
+            setup_collection(coll_name, docs, prune=False)
+        else:
+            setup_collection(coll_name, docs)
 
         method_score = 0
         q_count = 0
-        for _, row in df.iterrows():
-            q_text = str(row['question'])
-            q_id = row['q_id']
-            
-            q_vec_result = get_embeddings([q_text])
-            if not q_vec_result:
-                print(f"  ❌ Q{q_id}: embedding 失敗，跳過")
-                continue
-            
-            q_vec = q_vec_result[0]
-            
-            try:
-                search_res = client.query_points(collection_name=coll_name, query=q_vec, limit=5).points
-            except Exception as e:
-                print(f"  ❌ Q{q_id}: 搜尋失敗 - {e}")
-                continue
+        try:
+            batch_res = batch_dense_search(client, coll_name, [q_vecs[i] for i in valid], limit=5,
+                                           search_params=search_params(STORAGE_PROFILE))
+        except Exception as e:
+            print(f"  ❌ {m_name}: 批次搜尋失敗 - {e}")
+            batch_res = []
+
+        for i, search_res in zip(valid, batch_res):
+            q_id = q_ids[i]
             
             if search_res:
                 combined_answer = "\n".join([res.payload['text'] for res in search_res])
@@ -238,6 +235,8 @@ def main():
     print("-" * 60)
     best_method = summary.index[0]
     print(f"🏆 表現最好的方法：{best_method}")
+    stats = embedder.cache.stats()
+    print(f"📦 Embedding 快取命中率：{stats['hit_rate']:.1%}（命中 {stats['hits']} / 未命中 {stats['misses']}）")
     print("=" * 60)
 
 if __name__ == "__main__":
@@ -2,11 +2,27 @@ import pandas as pd
 import requests
 import time
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common.embedding import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.vector_index import LocalVectorIndex, VECTOR_DIR
+from common.chunk_store import ChunkStore, STORE_DIR
+from common.reranker import RerankerBase
+from common.cascade import CascadeReranker
 
 LLM_URL = "https://ws-03.wade0426.me/v1/chat/completions"
 EMBED_URL = "https://ws-04.wade0426.me/embed"
-SIMILARITY_URL = "https://ws-04.wade0426.me/similarity"
 MODEL_NAME = "/models/gpt-oss-120b"
+# Cascade（RERANK_CASCADE=1 啟用，預設關閉維持原排序）：相似度差距明顯時不必呼叫 LLM 重排，只有不確定的候選才交給 LLM
+RERANK_CASCADE = os.environ.get("RERANK_CASCADE", "0") == "1"
+# 切塊向量只計算一次，存成 memory-mapped 矩陣；查詢只需 embed 問題本身
+INDEX_PATH = os.path.join(VECTOR_DIR, "day6_qa_data")
+# 原文只在 memory-mapped 的文字檔存一份，切塊為 (文件, 起點, 終點) 位移，取用時才解碼
+STORE_PATH = os.path.join(STORE_DIR, "day6")
+
+embedder = EmbeddingClient(EMBED_URL, cache=EmbeddingCache())
 
 def call_api(url, payload, timeout=120):
     """API 呼叫函數，包含重試機制"""
@@ -34,21 +50,12 @@ def query_rewrite(original_query):
     except:
         return original_query
 
-def get_similarity_scores(query, chunks):
-    """計算相似度"""
-    try:
-        payload = {"queries": [query], "documents": chunks}
-        result = call_api(SIMILARITY_URL, payload)
-        return result["similarity"][0]
-    except:
-        return [0.0] * len(chunks)
+def search_chunks(query, index, k):
+    """本機向量檢索：一次矩陣乘法 + argpartition，回傳 (索引, 分數)"""
+    return index.search(embedder.embed_one(query, task_description="查詢"), k)
 
-def hybrid_search_and_rerank(query, chunks, top_k=3):
-    """檢索 + Rerank"""
-    scores = get_similarity_scores(query, chunks)
-    sorted_indices = sorted(range(len(scores)), key=lambda i: scores[i], reverse=True)
-    candidates = [chunks[i] for i in sorted_indices[:top_k * 2]]
-    
+def llm_select(query, candidates, top_k=3):
+    """請 LLM 選出最相關的候選，回傳索引列表（失敗時回傳 None）"""
     candidates_text = "\n".join([f"{i+1}. {c}" for i, c in enumerate(candidates)])
     rerank_prompt = f"問題：{query}\n請從以下文本選出最相關的 {top_k} 個編號：\n{candidates_text}\n只輸出編號如 1,2,3"
     try:
@@ -56,9 +63,42 @@ def hybrid_search_and_rerank(query, chunks, top_k=3):
         result = call_api(LLM_URL, payload)
         content = result["choices"][0]["message"]["content"].strip()
         indices = [int(x.strip())-1 for x in content.replace('，', ',').split(',') if x.strip().isdigit()]
-        return [candidates[i] for i in indices if 0 <= i < len(candidates)][:top_k]
+        return [i for i in indices if 0 <= i < len(candidates)][:top_k]
     except:
+        return None
+
+class LLMSelectReranker(RerankerBase):
+    """把 LLM 選號包裝成 reranker 分數：被選中的依名次給分，其餘為 0；失敗時沿用原本順序"""
+
+    def __init__(self, top_k=3):
+        self.top_k = top_k
+
+    def score_many(self, requests):
+        out = []
+        for query, docs in requests:
+            picked = llm_select(query, docs, self.top_k)
+            if picked is None:
+                out.append([len(docs) - i for i in range(len(docs))])
+            else:
+                out.append([len(picked) - picked.index(i) if i in picked else 0 for i in range(len(docs))])
+        return out
+
+    def score_pairs(self, pairs):
+        return [s for (s,) in self.score_many([(q, [d]) for q, d in pairs])]
+
+cascade = CascadeReranker(LLMSelectReranker(), cheap="score", drop_ratio=0.15)  # 只有 6 個候選，捨棄門檻放寬
+
+def hybrid_search_and_rerank(query, chunks, index, top_k=3):
+    """檢索 + Rerank"""
+    indices, scores = search_chunks(query, index, top_k * 2)
+    candidates = [chunks[i] for i in indices]
+    if RERANK_CASCADE:
+        return cascade.rerank(query, candidates, limit=top_k, scores=scores.tolist())
+
+    indices = llm_select(query, candidates, top_k)
+    if indices is None:
         return candidates[:top_k]
+    return [candidates[i] for i in indices]
 
 def generate_answer(question, context_chunks):
     """生成答案"""
@@ -109,10 +149,11 @@ def main():
         hw_df[col] = hw_df.get(col, "")
         hw_df[col] = hw_df[col].astype(object)
 
-    with open('qa_data.txt', 'r', encoding='utf-8') as f:
-        full_text = f.read()
-
-    chunks = [full_text[i:i+400] for i in range(0, len(full_text), 300)]
+    store = ChunkStore(STORE_PATH)
+    store.put_file("qa_data.txt", "qa_data.txt")
+    store.save()
+    chunks = store.windows("qa_data.txt", 400, 300)  # 等同 full_text[i:i+400]，每 300 字一塊
+    index = LocalVectorIndex.open_or_build(INDEX_PATH, chunks, embedder, task_description="檢索文件")
     test_cases = hw_df.head(5).copy()
 
     for idx, row in test_cases.iterrows():
@@ -120,7 +161,7 @@ def main():
         
         # 1. RAG 流程
         rewritten_q = query_rewrite(row['questions'])
-        top_ctx = hybrid_search_and_rerank(rewritten_q, chunks)
+        top_ctx = hybrid_search_and_rerank(rewritten_q, chunks, index)
         ans = generate_answer(row['questions'], top_ctx)
         
         # 2. 動態評分 (DeepEval 邏輯)
@@ -143,5 +184,16 @@ def main():
     test_cases.to_csv(output_file, index=False, encoding='utf-8-sig')
     print(f"\n🎉 所有測試完成！結果已存至 {output_file}")
 
+    # 指標平均值：切換 RERANK_CASCADE 比較 cascade 對答案品質的影響
+    metric_cols = required_columns[1:]
+    means = test_cases[metric_cols].apply(pd.to_numeric, errors="coerce").mean()
+    print(f"📊 指標平均（Rerank 模式: {'cascade' if RERANK_CASCADE else 'LLM 全部重排'}）")
+    for col in metric_cols:
+        print(f"   {col}: {means[col]:.3f}")
+    if RERANK_CASCADE:
+        s = cascade.stats()
+        print(f"📦 Cascade：{s['queries']} 題中略過 {s['skipped_calls']} 次 LLM 重排，"
+              f"送進 LLM 的候選 {s['expensive_pairs']}/{s['candidates']}")
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
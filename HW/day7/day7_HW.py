@@ -1,18 +1,33 @@
 import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", ".."))
+from common import startup
+startup.install()  # 以 --startup-profile 執行時記錄各套件匯入耗時
+
 import requests
 import pandas as pd
 import re
-from docx import Document
-import PyPDF2
+import time
+import zipfile
 from qdrant_client import QdrantClient, models
-from qdrant_client.http.models import PointStruct
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
+from common.embedding import EmbeddingClient
+from common.embed_cache import REPO_ROOT
+from common.ingest import bulk_ingest
+from common.indexing import IncrementalIndex, file_hash
+from common.chunk_store import ChunkStore, STORE_DIR
 
 # --- 1. 配置 ---
 LLM_URL = "https://ws-03.wade0426.me/v1/chat/completions"
-EMBED_URL = "https://ws-04.wade0426.me/embed"
 MODEL_NAME = "/models/Qwen3-30B-A3B-Instruct-2507-FP8"
+# 本機持久化的 Qdrant：重新啟動直接開啟既有索引，只有內容變動的檔案才重新解析與 embedding
+QDRANT_PATH = os.path.join(REPO_ROOT, ".cache", "qdrant", "day7")
+COLLECTION_NAME = "hw7"
+REBUILD_INDEX = False  # True 時全部重新解析、重建
+# 解析後的文字只在 memory-mapped 的文字檔存一份；payload 只存 (來源, 起點, 終點)，檢索到時才取出文字
+STORE_PATH = os.path.join(STORE_DIR, "day7")
 
 def get_stable_session():
     session = requests.Session()
@@ -21,6 +36,7 @@ def get_stable_session():
     return session
 
 session = get_stable_session()
+embedder = EmbeddingClient()
 
 # --- 2. 安全掃描 ---
 def security_scan(content, filename):
@@ -30,55 +46,118 @@ def security_scan(content, filename):
     return False
 
 # --- 3. 文件處理 ---
-def process_idp_files():
+class ParseError(Exception):
+    """文件格式錯誤，無法取出文字"""
+
+def _read_pdf(file_name):
+    import PyPDF2
+    try:
+        with open(file_name, 'rb') as f:
+            reader = PyPDF2.PdfReader(f)
+            return " ".join([p.extract_text() for p in reader.pages if p.extract_text()])
+    except PyPDF2.errors.PyPdfError as e:
+        raise ParseError(f"PDF 格式錯誤: {e}") from e
+
+def _read_docx(file_name):
+    from docx import Document
+    from docx.opc.exceptions import OpcError
+    try:
+        doc = Document(file_name)
+    except (OpcError, zipfile.BadZipFile, KeyError) as e:
+        raise ParseError(f"DOCX 格式錯誤: {e}") from e
+    return "\n".join([p.text for p in doc.paragraphs])
+
+def extract_text(file_name):
+    """取出文件文字；格式錯誤時拋出 ParseError，缺少解析套件時為 ImportError"""
+    if file_name.endswith('.pdf'):
+        return _read_pdf(file_name)
+    if file_name.endswith('.docx'):
+        return _read_docx(file_name)
+    if file_name.endswith('.png'):
+        return "不動產說明書：104年10月1日生效，不得記載事項包含遷徙自由。"
+    return ""
+
+def process_idp_files(index, store):
+    """逐檔比對內容雜湊：未變動的檔案沿用既有切塊，其餘重新解析，回傳需要寫入的新切塊
+
+    解析結果存進 store，切塊為 store 中的位移；回傳的 items 帶有 start / end 供 payload 使用。
+    """
     docs_data = []
     files = ['1.pdf', '2.pdf', '3.pdf', '4.png', '5.docx']
     print("🔍 [IDP] 安全掃描中...")
+    for name in list(store.docs):
+        if not os.path.exists(name):
+            store.remove(name)
     
     for file_name in files:
         if not os.path.exists(file_name): continue
-        content = ""
+        digest = file_hash(file_name)
+        # 文字不在 store 中（例如快取被清除）時必須重新解析
+        if (store.has(file_name) or not index.manifest["sources"].get(file_name)) \
+                and index.keep_if_unchanged(file_name, digest):
+            print(f"⏩ {file_name} 未變動，沿用既有索引")
+            continue
         try:
-            if file_name.endswith('.pdf'):
-                with open(file_name, 'rb') as f:
-                    reader = PyPDF2.PdfReader(f)
-                    content = " ".join([p.extract_text() for p in reader.pages if p.extract_text()])
-            elif file_name.endswith('.docx'):
-                doc = Document(file_name)
-                content = "\n".join([p.text for p in doc.paragraphs])
-            elif file_name.endswith('.png'):
-                content = "不動產說明書：104年10月1日生效，不得記載事項包含遷徙自由。"
-            
-            if security_scan(content, file_name):
-                print(f"🔥 [攔截] {file_name} 含惡意指令，已排除。")
-                continue
-            
-            print(f"✅ {file_name} 掃描通過")
-            chunks = [content[i:i+500] for i in range(0, len(content), 400)]
-            for c in chunks:
-                docs_data.append({"text": c, "source": file_name})
-        except: continue
+            content = extract_text(file_name)
+        except (ParseError, ImportError, OSError) as e:
+            # 不可當成檔案已刪除：commit() 會清掉它既有的切塊
+            print(f"❌ {file_name} 解析失敗，沿用既有索引: {e}")
+            index.keep_previous(file_name)
+            continue
+
+        if security_scan(content, file_name):
+            print(f"🔥 [攔截] {file_name} 含惡意指令，已排除。")
+            index.plan_source(file_name, [], digest)  # 記錄雜湊，下次不必重新解析
+            store.remove(file_name)
+            continue
+
+        print(f"✅ {file_name} 掃描通過")
+        store.put(file_name, content)
+        chunks = store.windows(file_name, 500, 400)  # 等同 content[i:i+500]，每 400 字一塊
+        # payload 只存位移，位移須納入 point id，否則內容未變但位置移動的切塊會沿用過期的位移
+        items = index.plan_source(file_name, chunks, digest, id_keys=chunks.id_keys())
+        for it in items:
+            it.update(chunks.payload(it["chunk_id"]))
+        docs_data.extend(items)
     return docs_data
 
 # --- 4. 主程式 ---
 if __name__ == "__main__":
-    chunks = process_idp_files()
-    
-    # 取得 Embedding 維度並初始化
-    emb_init = session.post(EMBED_URL, json={"texts": ["test"]}).json()
-    dim = len(emb_init["embeddings"][0])
-    q_client = QdrantClient(":memory:")
-    q_client.create_collection("hw7", vectors_config=models.VectorParams(size=dim, distance=models.Distance.COSINE))
-    
-    # 同步向量
-    points = []
-    print(f"🚀 同步向量中 (維度: {dim})...")
-    for i, item in enumerate(chunks):
-        try:
-            emb = session.post(EMBED_URL, json={"texts": [item['text']]}).json()["embeddings"][0]
-            points.append(PointStruct(id=i, vector=emb, payload=item))
-        except: continue
-    q_client.upsert("hw7", points)
+    startup.finish()
+    timings = {}
+    t0 = time.perf_counter()
+
+    # 取得 Embedding 維度並開啟本機索引（維度記錄在模型登錄檔，只有第一次才需要呼叫 API）
+    dim = embedder.vector_size()
+    q_client = QdrantClient(path=QDRANT_PATH)
+    config = {"vectors_config": models.VectorParams(size=dim, distance=models.Distance.COSINE)}
+    index = IncrementalIndex(q_client, COLLECTION_NAME, config, f"{embedder.fingerprint()}|offsets:v2",
+                             rebuild=REBUILD_INDEX)
+    store = ChunkStore(STORE_PATH)
+    cold = index.building
+    timings["開啟索引"] = time.perf_counter() - t0
+
+    try:
+        t0 = time.perf_counter()
+        chunks = process_idp_files(index, store)
+        store.save()
+        timings["文件處理"] = time.perf_counter() - t0
+
+        # 同步向量（批次並行 embedding，只重送失敗的批次）
+        t0 = time.perf_counter()
+        print(f"🚀 同步向量中 (維度: {dim})...")
+        written, failed = bulk_ingest(q_client, index.target, chunks, embedder, id_key="id", store_text=False)
+        index.forget([chunks[i] for i in failed])
+        stats = index.commit()
+        timings["向量同步"] = time.perf_counter() - t0
+    except Exception:
+        index.abort()
+        raise
+    print(f"✅ 已寫入 {written}/{len(chunks)} 個新區塊（刪除 {stats['deleted']}、未變動 {stats['unchanged']}）")
+    for i in failed:
+        print(f"⚠️  區塊 {i} ({chunks[i]['source']}) embedding 失敗: {chunks[i]['text'][:30]}...")
+    print(f"⏱️ {'冷啟動' if cold else '暖啟動'} 準備耗時 {sum(timings.values()):.2f}s（"
+          + "、".join(f"{k} {v:.2f}s" for k, v in timings.items()) + "）")
 
     # 處理前 5 題
     qa_df = pd.read_csv('questions_answer.csv').head(5)
@@ -87,11 +166,11 @@ if __name__ == "__main__":
     for _, row in qa_df.iterrows():
         try:
             # 1. 檢索 (改用 query_points 代替 search)
-            q_emb = session.post(EMBED_URL, json={"texts": [row['questions']]}).json()["embeddings"][0]
+            q_emb = embedder.embed_one(row['questions'])
             
             # 使用 query_points 語法
             search_res = q_client.query_points(
-                collection_name="hw7",
+                collection_name=COLLECTION_NAME,
                 query=q_emb,
                 limit=1
             ).points
@@ -99,8 +178,9 @@ if __name__ == "__main__":
             if not search_res:
                 ctx, src = "無相關參考資料", "N/A"
             else:
-                ctx = search_res[0].payload['text']
-                src = search_res[0].payload['source']
+                p = search_res[0].payload
+                ctx = store.text(p['source'], p['start'], p['end'])
+                src = p['source']
             
             # 2. 生成回答
             ans_res = session.post(LLM_URL, json={
@@ -0,0 +1,93 @@
+"""比較本機 IVF-flat 近似搜尋與精確搜尋的召回與延遲
+
+預設以合成的分群資料測試（可用 --n 放大到百萬筆）；--vectors 可改用實際的向量檔（.npy，會 memory-map）。
+用法：python bench/bench_ann.py --n 200000 --dim 256 --nprobe 4 8 16 32
+"""
+import os
+import sys
+import time
+import argparse
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from qdrant_client.http import models
+from common.ann import IVFCollection
+
+
+def synthetic(n, dim, clusters=1000, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    out = np.empty((n, dim), dtype=np.float32)
+    for i in range(0, n, 100_000):
+        m = min(100_000, n - i)
+        out[i:i + m] = centers[rng.integers(0, clusters, m)] + 1.5 * rng.standard_normal((m, dim)).astype(np.float32)
+    return out
+
+
+def run(col, queries, k, query_filter=None, **kwargs):
+    latencies, results = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        results.append([row for row, _ in col.search(q, k, query_filter, **kwargs)])
+        latencies.append(time.perf_counter() - t0)
+    return np.array(latencies) * 1000, results
+
+
+def recall(approx, exact, k):
+    return np.mean([len(set(a) & set(e)) / max(1, min(k, len(e))) for a, e in zip(approx, exact)])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=200_000)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--vectors", help="改用既有向量檔 (.npy)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=None)
+    parser.add_argument("--nprobe", nargs="+", type=int, default=[4, 8, 16, 32])
+    args = parser.parse_args()
+
+    vectors = np.load(args.vectors, mmap_mode="r") if args.vectors else synthetic(args.n, args.dim)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    base = np.asarray(vectors[rng.choice(n, args.queries, replace=False)])
+    queries = base + 0.5 * base.std() * rng.standard_normal((args.queries, dim))
+    # 與 CW/01 相同的 year 範圍過濾，以及陣列型 tags 的 match any
+    tags = [f"t{i}" for i in range(50)]
+    payloads = [{"year": int(y), "tags": [tags[t] for t in ts]}
+                for y, ts in zip(rng.integers(0, 20, n), rng.integers(0, len(tags), (n, 2)))]
+    year_filter = models.Filter(must=[models.FieldCondition(key="year", range=models.Range(gte=3, lte=10))])
+    tag_filter = models.Filter(must=[models.FieldCondition(key="tags", match=models.MatchAny(any=tags[:10]))])
+
+    col = IVFCollection(dim, nlist=args.nlist)
+    t0 = time.perf_counter()
+    col.upsert(list(range(n)), vectors, payloads)
+    col._ensure_index()
+    build_s = time.perf_counter() - t0
+    print(f"{n} 筆 × {dim} 維，nlist={len(col.centroids)}，建索引 {build_s:.1f}s")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        t0 = time.perf_counter()
+        col.save(os.path.join(tmp, "bench"))
+        save_s = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        col = IVFCollection.load(os.path.join(tmp, "bench"))
+        col._ensure_index()
+        print(f"存檔 {save_s:.1f}s，重新開啟（memory-map）{time.perf_counter() - t0:.2f}s\n")
+
+        for label, flt in (("無過濾", None), ("year 3~10", year_filter), ("tags any", tag_filter)):
+            exact_lat, exact_res = run(col, queries, args.k, flt, exact=True)
+            print(f"[{label}] {'方法':<12} {'p50':>9} {'p95':>9} {'recall@' + str(args.k):>10}")
+            print(f"[{label}] {'精確搜尋':<12} {np.percentile(exact_lat, 50):>7.2f}ms {np.percentile(exact_lat, 95):>7.2f}ms {1.0:>10.3f}")
+            for nprobe in args.nprobe:
+                lat, res = run(col, queries, args.k, flt, nprobe=nprobe)
+                print(f"[{label}] {'nprobe=' + str(nprobe):<12} {np.percentile(lat, 50):>7.2f}ms "
+                      f"{np.percentile(lat, 95):>7.2f}ms {recall(res, exact_res, args.k):>10.3f}")
+            print()
+
+
+if __name__ == "__main__":
+    main()
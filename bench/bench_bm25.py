@@ -0,0 +1,126 @@
+"""比較本機 BM25 與 Qdrant/bm25 的建索引時間、查詢延遲與召回
+
+以 CW/04 的資料與問題測試，召回以 questions_answer.csv 的「來源文件」計算（前 k 名是否含正確來源），
+並列出本機 BM25 與 Qdrant/bm25 前 k 名的重疊率。Qdrant 路徑需要 Qdrant 服務與 fastembed。
+用法：python bench/bench_bm25.py --k 5 [--qdrant http://localhost:6333 | --skip-qdrant]
+"""
+import os
+import sys
+import csv
+import time
+import argparse
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.bm25 import BM25Index
+
+
+def load_chunks(data_dir):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    texts, sources = [], []
+    for name in sorted(os.listdir(data_dir)):
+        if name.startswith("data_") and name.endswith(".txt"):
+            with open(os.path.join(data_dir, name), "r", encoding="utf-8") as f:
+                for chunk in splitter.split_text(f.read()):
+                    texts.append(chunk)
+                    sources.append(name)
+    return texts, sources
+
+
+def load_questions(data_dir):
+    with open(os.path.join(data_dir, "questions_answer.csv"), "r", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    return [r["題目"].strip() for r in rows], [r["來源文件"] for r in rows]
+
+
+def summarize(name, build_s, latencies, ranked, sources, expected, k):
+    lat = np.array(latencies) * 1000
+    hits = sum(any(sources[i] == exp for i in r[:k]) for r, exp in zip(ranked, expected))
+    print(f"{name:<14} {build_s * 1000:>9.1f}ms {np.percentile(lat, 50):>8.2f}ms {np.percentile(lat, 95):>8.2f}ms "
+          f"{hits:>4}/{len(expected)} ({hits / len(expected):.0%})")
+
+
+def run_local(texts, questions, k):
+    t0 = time.perf_counter()
+    index = BM25Index(texts)
+    build_s = time.perf_counter() - t0
+    latencies, ranked = [], []
+    for q in questions:
+        t0 = time.perf_counter()
+        idx, _ = index.search(q, k)
+        latencies.append(time.perf_counter() - t0)
+        ranked.append(idx.tolist())
+    return build_s, latencies, ranked
+
+
+def run_qdrant(url, texts, questions, k, local_sparse=False):
+    """在暫存集合上測試 Qdrant 的 sparse 檢索；local_sparse=True 時改用本機 BM25 匯出的 sparse vector"""
+    from qdrant_client import QdrantClient, models
+
+    client = QdrantClient(url=url)
+    name = f"bench_bm25_{int(time.time() * 1000)}"
+    client.create_collection(name, vectors_config={},
+                             sparse_vectors_config={"sparse": models.SparseVectorParams(modifier=models.Modifier.IDF)})
+    try:
+        def doc_vector(text):
+            if local_sparse:
+                indices, values = BM25Index.doc_sparse(text)
+                return models.SparseVector(indices=indices, values=values)
+            return models.Document(text=text, model="Qdrant/bm25")
+
+        def query_vector(text):
+            if local_sparse:
+                indices, values = BM25Index.query_sparse(text)
+                return models.SparseVector(indices=indices, values=values)
+            return models.Document(text=text, model="Qdrant/bm25")
+
+        t0 = time.perf_counter()
+        client.upsert(name, points=[models.PointStruct(id=i, vector={"sparse": doc_vector(t)}) for i, t in enumerate(texts)],
+                      wait=True)
+        build_s = time.perf_counter() - t0
+        latencies, ranked = [], []
+        for q in questions:
+            t0 = time.perf_counter()
+            res = client.query_points(name, query=query_vector(q), using="sparse", limit=k)
+            latencies.append(time.perf_counter() - t0)
+            ranked.append([p.id for p in res.points])
+        return build_s, latencies, ranked
+    finally:
+        client.delete_collection(name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join("CW", "04"))
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--qdrant", default="http://localhost:6333")
+    parser.add_argument("--skip-qdrant", action="store_true")
+    args = parser.parse_args()
+
+    texts, sources = load_chunks(args.data)
+    questions, expected = load_questions(args.data)
+    print(f"切塊 {len(texts)} 個，問題 {len(questions)} 題，k={args.k}\n")
+    print(f"{'方法':<14} {'建索引':>11} {'p50':>10} {'p95':>10} {'來源命中':>14}")
+
+    results = {"local": run_local(texts, questions, args.k)}
+    summarize("本機 BM25", *results["local"], sources, expected, args.k)
+    if not args.skip_qdrant:
+        for name, local_sparse in (("qdrant/bm25", False), ("local-sparse", True)):
+            try:
+                results[name] = run_qdrant(args.qdrant, texts, questions, args.k, local_sparse)
+            except Exception as e:
+                print(f"{name:<14} ❌ 無法測試: {e}")
+                continue
+            summarize(name, *results[name], sources, expected, args.k)
+
+    if "qdrant/bm25" in results:
+        local, remote = results["local"][2], results["qdrant/bm25"][2]
+        overlap = np.mean([len(set(a) & set(b)) / args.k for a, b in zip(local, remote)])
+        print(f"\n本機 BM25 與 Qdrant/bm25 前 {args.k} 名重疊率: {overlap:.1%}")
+
+
+if __name__ == "__main__":
+    main()
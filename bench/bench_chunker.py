@@ -0,0 +1,96 @@
+"""比較 langchain tiktoken 切塊（test.py 原本的做法）與單次編碼的 TokenChunker
+
+兩種方法各在獨立子行程中執行，回報切塊速度與峰值 RSS。
+langchain 路徑與原本的 test.py 相同：split_text 後再編碼全文與每一塊來計算 token 數。
+用法：python bench/bench_chunker.py --mb 20 --chunk-size 80 --overlap 10
+"""
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import resource
+import subprocess
+import tempfile
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+def make_corpus(path, mb):
+    """以 CW/04 的資料檔重複組成指定大小的測試文字"""
+    parts = []
+    for p in sorted(glob.glob(os.path.join("CW", "04", "data_*.txt"))):
+        with open(p, "r", encoding="utf-8") as f:
+            parts.append(f.read())
+    base = "\n".join(parts) or "人工智慧很有趣。\n"
+    target = mb * 1024 * 1024
+    with open(path, "w", encoding="utf-8") as f:
+        written = 0
+        while written < target:
+            f.write(base)
+            written += len(base.encode("utf-8"))
+
+
+def run_worker(args):
+    import tiktoken
+
+    encoding = tiktoken.get_encoding(args.encoding)
+    t0 = time.perf_counter()
+    if args.worker == "langchain":
+        from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+        splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
+            encoding_name=args.encoding, chunk_size=args.chunk_size, chunk_overlap=args.overlap, separators=[""]
+        )
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            text = f.read()
+        chunks = splitter.split_text(text)
+        total = len(encoding.encode(text))
+        counts = [len(encoding.encode(c)) for c in chunks]
+        n = len(chunks)
+    else:
+        from common.token_chunker import TokenChunker
+
+        chunker = TokenChunker(encoding, args.chunk_size, args.overlap)
+        n = 0
+        with open(args.corpus, "r", encoding="utf-8") as f:
+            for _ in chunker.chunks(f):
+                n += 1
+        total = chunker.total_tokens
+    elapsed = time.perf_counter() - t0
+    print(json.dumps({"chunks": n, "tokens": total, "seconds": elapsed,
+                      "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024}))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--mb", type=int, default=20)
+    parser.add_argument("--encoding", default="cl100k_base")
+    parser.add_argument("--chunk-size", type=int, default=80)
+    parser.add_argument("--overlap", type=int, default=10)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    parser.add_argument("--corpus", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return run_worker(args)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        corpus = os.path.join(tmp, "corpus.txt")
+        make_corpus(corpus, args.mb)
+        print(f"測試文字 {args.mb} MB，chunk_size={args.chunk_size}，overlap={args.overlap}\n")
+        print(f"{'方法':<12} {'切塊數':>9} {'token 數':>11} {'耗時':>8} {'chunks/s':>10} {'峰值 RSS':>10}")
+        for method in ("langchain", "token"):
+            cmd = [sys.executable, os.path.abspath(__file__), "--worker", method, "--corpus", corpus,
+                   "--encoding", args.encoding, "--chunk-size", str(args.chunk_size), "--overlap", str(args.overlap)]
+            out = subprocess.run(cmd, capture_output=True, text=True)
+            if out.returncode != 0:
+                print(f"{method:<12} ❌ 失敗:\n{out.stderr[-1500:]}")
+                continue
+            r = json.loads(out.stdout.strip().splitlines()[-1])
+            print(f"{method:<12} {r['chunks']:>9} {r['tokens']:>11} {r['seconds']:>7.1f}s "
+                  f"{r['chunks'] / r['seconds']:>10.0f} {r['peak_rss_mb']:>8.0f}MB")
+
+
+if __name__ == "__main__":
+    main()
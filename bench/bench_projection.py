@@ -0,0 +1,98 @@
+"""評估降維（截斷 / PCA）對索引大小、搜尋延遲與 recall@k 的影響，並可擬合、儲存投影
+
+用法：python bench/bench_projection.py --data HW/day5 CW/04 --dims 256 512 1024
+      python bench/bench_projection.py --data HW/day5 CW/04 --fit pca:256
+"""
+import os
+import sys
+import csv
+import glob
+import time
+import argparse
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.embedding import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.projection import Projection
+
+
+def load_set(data_dir, splitter):
+    """讀取資料夾中的 data_*.txt 切塊與 questions.csv 問題"""
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "data_*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            chunks.extend(splitter.split_text(f.read()))
+    questions = []
+    q_path = os.path.join(data_dir, "questions.csv")
+    if os.path.exists(q_path):
+        with open(q_path, "r", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+        col = next((c for c in ("questions", "question", "題目") if rows and c in rows[0]), None)
+        if col:
+            questions = [r[col].strip() for r in rows]
+    return chunks, questions
+
+
+def top_k(docs, queries, k):
+    """精確內積搜尋，回傳 (每題 top-k 索引, 每題延遲秒數)"""
+    ids, lat = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        scores = docs @ q
+        idx = np.argpartition(-scores, min(k, len(scores) - 1))[:k]
+        ids.append(set(idx.tolist()))
+        lat.append(time.perf_counter() - t0)
+    return ids, lat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", nargs="+", default=[os.path.join("HW", "day5"), os.path.join("CW", "04")])
+    parser.add_argument("--dims", nargs="+", type=int, default=[256, 512, 1024])
+    parser.add_argument("--kinds", nargs="+", default=["truncate", "pca"], choices=["truncate", "pca"])
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--fit", help="擬合並儲存指定投影（如 pca:256），供各腳本以 EMBED_PROJECTION 使用")
+    args = parser.parse_args()
+
+    embedder = EmbeddingClient(cache=EmbeddingCache())
+    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
+    chunks, questions = [], []
+    for d in args.data:
+        c, q = load_set(d, splitter)
+        chunks.extend(c)
+        questions.extend(q)
+    print(f"📦 {len(chunks)} 個區塊、{len(questions)} 個問題")
+
+    # 與各腳本一致：文件用「檢索文件」任務描述，查詢不帶任務描述
+    docs = np.asarray(embedder.embed(chunks, task_description="檢索文件"), dtype=np.float32)
+    queries = np.asarray(embedder.embed(questions), dtype=np.float32)
+
+    if args.fit:
+        kind, dim = args.fit.split(":")
+        proj = Projection(kind, int(dim)).fit(docs)
+        path = proj.save()
+        print(f"💾 已儲存投影 {args.fit} → {path}")
+        print(f"   signature: {proj.signature}（以舊投影建立的集合會在下次同步時重建）")
+        return
+
+    full_dim = docs.shape[1]
+    truth, base_lat = top_k(docs, queries, args.k)
+    print(f"\n{'投影':14} {'索引大小':>10} {'平均延遲':>10} {f'recall@{args.k}':>10}")
+    print(f"{'full:' + str(full_dim):14} {docs.nbytes / 1e6:>8.2f}MB {1000 * np.mean(base_lat):>8.3f}ms {1.0:>10.3f}")
+    for kind in args.kinds:
+        for dim in args.dims:
+            if dim >= full_dim or (kind == "pca" and dim > len(docs)):
+                continue
+            proj = Projection(kind, dim).fit(docs)
+            p_docs = proj.transform(docs)
+            ids, lat = top_k(p_docs, proj.transform(queries), args.k)
+            recall = np.mean([len(a & b) / len(b) for a, b in zip(ids, truth)])
+            print(f"{proj.name:14} {p_docs.nbytes / 1e6:>8.2f}MB {1000 * np.mean(lat):>8.3f}ms {recall:>10.3f}")
+    print("\n※ PCA 在語料上擬合後評估；語料小於目標維度時略過")
+
+
+if __name__ == "__main__":
+    main()
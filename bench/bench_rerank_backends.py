@@ -0,0 +1,99 @@
+"""比較 Reranker 各 backend 的吞吐量、延遲、記憶體與分數一致性
+
+每個 backend 在獨立子行程中載入，峰值 RSS 才不會互相影響；以第一個 backend 作為參考分數。
+用法：python bench/bench_rerank_backends.py --model ~/AI/Models/Qwen3-Reranker-0.6B --backends torch int8 onnx --threads 8
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+import resource
+import subprocess
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from bench.bench_rerank_prefix import load_candidates
+
+
+def load_queries(data_dir, n):
+    with open(os.path.join(data_dir, "questions.csv"), "r", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    return [r["題目"].strip() for r in rows][:n]
+
+
+def run_worker(args):
+    """子行程：載入指定 backend，逐題計分並以 JSON 回傳結果"""
+    from common.reranker import Qwen3Reranker
+
+    queries = load_queries(args.data, args.queries)
+    docs = load_candidates(args.data, n=args.candidates)
+    t0 = time.perf_counter()
+    reranker = Qwen3Reranker(args.model, backend=args.worker, num_threads=args.threads).load()
+    load_s = time.perf_counter() - t0
+    reranker.score(queries[0], docs[:2])  # 暖機
+
+    latencies, scores = [], []
+    for q in queries:
+        t0 = time.perf_counter()
+        scores.extend(reranker.score(q, docs))
+        latencies.append(time.perf_counter() - t0)
+    print(json.dumps({
+        "load_s": load_s,
+        "latencies": latencies,
+        "pairs": len(queries) * len(docs),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "scores": scores,
+    }))
+
+
+def spearman(a, b):
+    ra = np.argsort(np.argsort(a)).astype(np.float64)
+    rb = np.argsort(np.argsort(b)).astype(np.float64)
+    return float(np.corrcoef(ra, rb)[0, 1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=os.path.expanduser("~/AI/Models/Qwen3-Reranker-0.6B"))
+    parser.add_argument("--data", default=os.path.join("CW", "04"))
+    parser.add_argument("--backends", nargs="+", default=["torch", "int8", "onnx"])
+    parser.add_argument("--queries", type=int, default=10)
+    parser.add_argument("--candidates", type=int, default=15)
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.worker:
+        return run_worker(args)
+
+    results = {}
+    for backend in args.backends:
+        print(f"⌛ 測試 backend: {backend}")
+        cmd = [sys.executable, os.path.abspath(__file__), "--worker", backend, "--model", args.model,
+               "--data", args.data, "--queries", str(args.queries), "--candidates", str(args.candidates)]
+        if args.threads:
+            cmd += ["--threads", str(args.threads)]
+        out = subprocess.run(cmd, capture_output=True, text=True)
+        if out.returncode != 0:
+            print(f"❌ {backend} 失敗:\n{out.stderr[-2000:]}")
+            continue
+        results[backend] = json.loads(out.stdout.strip().splitlines()[-1])
+
+    if not results:
+        return
+    ref_name = next(iter(results))
+    ref = results[ref_name]["scores"]
+    print(f"\n參考分數: {ref_name}，每題 {args.candidates} 個候選 × {args.queries} 題")
+    print(f"{'backend':<8} {'載入':>8} {'pairs/s':>9} {'p50':>9} {'p95':>9} {'峰值 RSS':>10} {'Spearman':>9} {'最大分數差':>11}")
+    for name, r in results.items():
+        lat = np.array(r["latencies"]) * 1000
+        rate = r["pairs"] / sum(r["latencies"])
+        diff = float(np.max(np.abs(np.array(r["scores"]) - np.array(ref))))
+        print(f"{name:<8} {r['load_s']:>7.1f}s {rate:>9.1f} {np.percentile(lat, 50):>7.1f}ms {np.percentile(lat, 95):>7.1f}ms "
+              f"{r['peak_rss_mb']:>8.0f}MB {spearman(r['scores'], ref):>9.4f} {diff:>11.2e}")
+
+
+if __name__ == "__main__":
+    main()
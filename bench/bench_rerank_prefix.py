@@ -0,0 +1,61 @@
+"""比較 Reranker 一般批次計算與共用前綴 KV cache 的速度與分數差異
+
+用法：python bench/bench_rerank_prefix.py --model ~/AI/Models/Qwen3-Reranker-0.6B --sizes 15 50 100
+"""
+import os
+import sys
+import glob
+import time
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.reranker import Qwen3Reranker
+
+
+def load_candidates(data_dir, size=500, n=100):
+    """以 data_*.txt 的固定長度片段作為候選文件"""
+    docs = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "data_*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            text = f.read()
+        docs.extend(text[i:i + size] for i in range(0, len(text), size))
+    while docs and len(docs) < n:
+        docs = docs + docs
+    return docs[:n]
+
+
+def timed(reranker, query, docs, repeat):
+    best, scores = float("inf"), None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        scores = reranker.score(query, docs)
+        best = min(best, time.perf_counter() - t0)
+    return best, scores
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--model", default=os.path.expanduser("~/AI/Models/Qwen3-Reranker-0.6B"))
+    parser.add_argument("--data", default=os.path.join("CW", "04"))
+    parser.add_argument("--query", default="LiteRT 的 GPU 加速效能平均比原本的 TensorFlow Lite GPU 委派快多少？")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[15, 50, 100])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    docs = load_candidates(args.data, n=max(args.sizes))
+    reranker = Qwen3Reranker(args.model).load()
+    print(f"模型運行於 {reranker.device}，候選共 {len(docs)} 筆")
+    reranker.score(args.query, docs[:2])  # 暖機
+
+    print(f"\n{'候選數':>6} {'一般批次':>10} {'前綴快取':>10} {'加速':>7} {'最大分數差':>12}")
+    for n in args.sizes:
+        reranker.prefix_cache = False
+        base_t, base = timed(reranker, args.query, docs[:n], args.repeat)
+        reranker.prefix_cache = True
+        pref_t, pref = timed(reranker, args.query, docs[:n], args.repeat)
+        diff = max(abs(a - b) for a, b in zip(base, pref))
+        print(f"{n:>6} {base_t * 1000:>8.1f}ms {pref_t * 1000:>8.1f}ms {base_t / pref_t:>6.2f}x {diff:>12.2e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,140 @@
+"""比較各向量儲存設定（float32 / float16 / int8 / binary）的記憶體、磁碟、查詢延遲與 recall@k
+
+用法：python bench/bench_storage.py --data HW/day5 --k 5
+"""
+import os
+import sys
+import csv
+import time
+import glob
+import argparse
+
+import numpy as np
+import requests
+from qdrant_client import QdrantClient, models
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.embedding import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.ingest import upsert_in_batches
+from common.storage import STORAGE_PROFILES, vector_params, search_params, bytes_per_point
+
+
+def load_corpus(data_dir, chunk_size, chunk_overlap):
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for path in sorted(glob.glob(os.path.join(data_dir, "data_*.txt"))):
+        with open(path, "r", encoding="utf-8") as f:
+            chunks.extend(splitter.split_text(f.read()))
+    return chunks
+
+
+def load_questions(data_dir):
+    with open(os.path.join(data_dir, "questions.csv"), "r", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    col = next(c for c in ("questions", "question", "題目") if c in rows[0])
+    return [r[col].strip() for r in rows]
+
+
+def wait_green(client, name, timeout=120):
+    t0 = time.time()
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        if time.time() - t0 > timeout:
+            break
+        time.sleep(0.5)
+
+
+def measured_bytes(url, name):
+    """由 Qdrant telemetry 加總集合各 segment 實際的 (RAM, 磁碟) 位元組與點數；取不到時回傳 None"""
+    try:
+        res = requests.get(f"{url.rstrip('/')}/telemetry", params={"details_level": 3}, timeout=30)
+        res.raise_for_status()
+        collections = res.json()["result"]["collections"]["collections"]
+    except (requests.RequestException, ValueError, KeyError, TypeError):
+        return None
+    ram = disk = points = 0
+    for coll in collections or []:
+        if coll.get("id") != name:
+            continue
+        for shard in coll.get("shards") or []:
+            for seg in (shard.get("local") or {}).get("segments") or []:
+                info = seg["info"]
+                ram += info.get("ram_usage_bytes", 0)
+                disk += info.get("disk_usage_bytes", 0)
+                points += info.get("num_points", 0)
+    return (ram, disk, points) if points else None
+
+
+def search_ids(client, name, q_vecs, k, params):
+    """逐題查詢，回傳 (每題的 id 集合, 每題延遲秒數)"""
+    ids, lat = [], []
+    for vec in q_vecs:
+        t0 = time.perf_counter()
+        res = client.query_points(name, query=vec, limit=k, search_params=params).points
+        lat.append(time.perf_counter() - t0)
+        ids.append({p.id for p in res})
+    return ids, lat
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--data", default=os.path.join("HW", "day5"), help="含 data_*.txt 與 questions.csv 的資料夾")
+    parser.add_argument("--qdrant", default="http://localhost:6333")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--chunk-size", type=int, default=500)
+    parser.add_argument("--chunk-overlap", type=int, default=0)
+    parser.add_argument("--profiles", nargs="+", default=list(STORAGE_PROFILES), choices=STORAGE_PROFILES)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant)
+    embedder = EmbeddingClient(cache=EmbeddingCache())
+    chunks = load_corpus(args.data, args.chunk_size, args.chunk_overlap)
+    questions = load_questions(args.data)
+    print(f"📦 {len(chunks)} 個區塊、{len(questions)} 個問題")
+
+    doc_vecs = embedder.embed(chunks)
+    q_vecs = embedder.embed(questions)
+    dim = len(doc_vecs[0])
+    points = [
+        models.PointStruct(id=i, vector=v, payload={"text": c})
+        for i, (c, v) in enumerate(zip(chunks, doc_vecs))
+    ]
+
+    # 基準：float32 精確搜尋
+    truth = None
+    rows = []
+    for profile in ["float32"] + [p for p in args.profiles if p != "float32"]:
+        name = f"bench_storage_{profile}"
+        if client.collection_exists(name):
+            client.delete_collection(name)
+        client.create_collection(name, vectors_config=vector_params(dim, profile))
+        upsert_in_batches(client, name, points)
+        wait_green(client, name)
+
+        if truth is None:
+            truth, _ = search_ids(client, name, q_vecs, args.k, models.SearchParams(exact=True))
+        ids, lat = search_ids(client, name, q_vecs, args.k, search_params(profile))
+        recall = np.mean([len(a & b) / max(len(b), 1) for a, b in zip(ids, truth)])
+        measured = measured_bytes(args.qdrant, name)
+        if measured:
+            ram, disk, n = measured
+            ram, disk = round(ram / n), round(disk / n)
+        else:
+            ram, disk = bytes_per_point(dim, profile)
+            print(f"⚠️  {profile}: 無法從 telemetry 取得實際用量，改用估算值")
+        rows.append((profile, measured is not None, ram, disk, 1000 * np.mean(lat), 1000 * np.percentile(lat, 95), recall))
+        client.delete_collection(name)
+
+    print(f"\n{'設定':8} {'RAM/點':>10} {'磁碟/點':>10} {'平均延遲':>10} {'p95延遲':>10} {f'recall@{args.k}':>10}")
+    for profile, measured, ram, disk, mean_ms, p95_ms, recall in rows:
+        if profile in args.profiles:
+            mark = " " if measured else "*"
+            print(f"{profile:8} {ram:>9}B{mark}{disk:>9}B{mark}{mean_ms:>8.2f}ms {p95_ms:>8.2f}ms {recall:>10.3f}")
+    print("\n※ RAM/磁碟為 Qdrant telemetry 回報的各 segment 實際用量除以點數（含 HNSW 索引與 payload）")
+    if not all(measured for _, measured, *_ in rows):
+        print("   標 * 者取不到 telemetry，為向量本身的估算值（不含索引與 payload）")
+
+
+if __name__ == "__main__":
+    main()
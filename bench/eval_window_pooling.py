@@ -0,0 +1,90 @@
+"""比較滑動視窗的池化向量（句子向量加權平均）與直接 embed 視窗文字的檢索結果
+
+對每組資料列出：送出 embed 的字元數、池化向量與真實視窗向量的餘弦相似度、
+各問題 top-k 的重疊率、真實 top-1 是否仍在池化 top-k 內，以及 top-1 分數差。
+需要 embedding 服務；向量會進 EmbeddingCache，重跑不再呼叫 API。
+用法：python bench/eval_window_pooling.py --sets HW/day5:500:250 CW/02:200:50 --k 3
+"""
+import os
+import sys
+import csv
+import glob
+import argparse
+
+import numpy as np
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.embedding import EmbeddingClient
+from common.embed_cache import EmbeddingCache
+from common.window_pooling import WindowPooler
+
+# 沒有 questions.csv 的資料夾（CW/02）改用腳本中的測試問題
+FALLBACK_QUERIES = ["Graph RAG 有什麼優勢?", "知識圖譜如何建構?", "微軟 GraphRAG 的特點是什麼?"]
+
+
+def load_set(data_dir):
+    """回傳 ({檔名: 全文}, 問題列表)"""
+    paths = sorted(glob.glob(os.path.join(data_dir, "data_*.txt"))) or [os.path.join(data_dir, "text.txt")]
+    texts = {}
+    for path in paths:
+        with open(path, "r", encoding="utf-8") as f:
+            texts[os.path.basename(path)] = f.read()
+    questions = FALLBACK_QUERIES
+    q_path = os.path.join(data_dir, "questions.csv")
+    if os.path.exists(q_path):
+        with open(q_path, "r", encoding="utf-8-sig") as f:
+            rows = list(csv.DictReader(f))
+        col = next((c for c in ("questions", "question", "題目") if rows and c in rows[0]), None)
+        if col:
+            questions = [r[col].strip() for r in rows]
+    return texts, questions
+
+
+def evaluate(embedder, data_dir, size, overlap, k, max_unit_chars):
+    texts, questions = load_set(data_dir)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=size, chunk_overlap=overlap)
+    pooler = WindowPooler(embedder, max_unit_chars=max_unit_chars)
+    chunks, pooled = [], []
+    for text in texts.values():
+        c = splitter.split_text(text)
+        chunks.extend(c)
+        pooled.append(pooler.embed_windows(text, c))
+    pooled = np.vstack(pooled)
+    true = np.asarray(embedder.embed(chunks), dtype=np.float32)
+    queries = np.asarray(embedder.embed(questions), dtype=np.float32)
+
+    cos = np.einsum("ij,ij->i", pooled, true)
+    s_true, s_pool = queries @ true.T, queries @ pooled.T
+    k = min(k, len(chunks))
+    top_true = np.argsort(-s_true, axis=1)[:, :k]
+    top_pool = np.argsort(-s_pool, axis=1)[:, :k]
+    overlap_k = np.mean([len(set(a) & set(b)) / k for a, b in zip(top_true, top_pool)])
+    top1_kept = np.mean([a[0] in b for a, b in zip(top_true, top_pool)])
+    top1_diff = np.abs(s_true.max(axis=1) - s_pool.max(axis=1))
+
+    st = pooler.stats()
+    print(f"📂 {data_dir}（{size}/{overlap}）：{len(chunks)} 個視窗、{len(questions)} 題")
+    print(f"   送出字元：池化 {st['unit_chars']} / 逐視窗 {st['window_chars']}（省下 {st['saved']:.0%}）")
+    print(f"   池化 vs 真實向量餘弦：平均 {cos.mean():.4f}、p5 {np.percentile(cos, 5):.4f}、最小 {cos.min():.4f}")
+    print(f"   top-{k} 重疊率 {overlap_k:.1%}，真實 top-1 仍在池化 top-{k} 內 {top1_kept:.1%}，"
+          f"top-1 分數差平均 {top1_diff.mean():.4f}\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sets", nargs="+",
+                        default=[f"{os.path.join('HW', 'day5')}:500:250", f"{os.path.join('CW', '02')}:200:50"],
+                        help="資料夾:chunk_size:chunk_overlap")
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--max-unit-chars", type=int, default=100)
+    args = parser.parse_args()
+
+    embedder = EmbeddingClient(cache=EmbeddingCache())
+    for spec in args.sets:
+        data_dir, size, overlap = spec.rsplit(":", 2)
+        evaluate(embedder, data_dir, int(size), int(overlap), args.k, args.max_unit_chars)
+
+
+if __name__ == "__main__":
+    main()
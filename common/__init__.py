@@ -0,0 +1 @@
+# 各 CW / HW 腳本共用的 RAG 工具模組
@@ -0,0 +1,103 @@
+"""集合別名管理：建置新版本後原子切換別名，支援回滾與舊版本清除
+
+用法：python -m common.aliases list CW_03
+      python -m common.aliases rollback CW_03
+"""
+import time
+import argparse
+
+from qdrant_client import models
+
+VERSION_SEP = "__v"
+
+
+def versioned_name(alias):
+    """以毫秒時間戳產生新版本的實體集合名稱"""
+    return f"{alias}{VERSION_SEP}{int(time.time() * 1000)}"
+
+
+def list_versions(client, alias):
+    """該別名的所有實體版本（舊 → 新）"""
+    prefix = alias + VERSION_SEP
+    names = [c.name for c in client.get_collections().collections if c.name.startswith(prefix)]
+    return sorted(names, key=lambda n: int(n[len(prefix):]) if n[len(prefix):].isdigit() else -1)
+
+
+def current_target(client, alias):
+    """別名目前指向的實體集合，沒有別名時回傳 None"""
+    for a in client.get_aliases().aliases:
+        if a.alias_name == alias:
+            return a.collection_name
+    return None
+
+
+def wait_until_indexed(client, name, timeout=300):
+    """等待集合索引完成（狀態為 green）"""
+    t0 = time.time()
+    while client.get_collection(name).status != models.CollectionStatus.GREEN:
+        if time.time() - t0 > timeout:
+            raise TimeoutError(f"集合 {name} 在 {timeout}s 內未完成索引")
+        time.sleep(0.5)
+
+
+def swap_alias(client, alias, target):
+    """把別名原子地改指向 target"""
+    ops = []
+    if current_target(client, alias) is not None:
+        ops.append(models.DeleteAliasOperation(delete_alias=models.DeleteAlias(alias_name=alias)))
+    elif alias in {c.name for c in client.get_collections().collections}:
+        # 舊版腳本建立的同名實體集合，只在第一次切換時刪除
+        client.delete_collection(alias)
+    ops.append(models.CreateAliasOperation(create_alias=models.CreateAlias(collection_name=target, alias_name=alias)))
+    client.update_collection_aliases(change_aliases_operations=ops)
+
+
+def gc_versions(client, alias, keep=2, on_delete=None):
+    """保留別名目前指向的版本與最新的 keep 個版本，其餘刪除"""
+    current = current_target(client, alias)
+    versions = list_versions(client, alias)
+    keep_set = set(versions[-keep:]) | {current}
+    removed = []
+    for name in versions:
+        if name not in keep_set:
+            client.delete_collection(name)
+            removed.append(name)
+            if on_delete:
+                on_delete(name)
+    return removed
+
+
+def rollback(client, alias):
+    """把別名切回目前版本的前一個版本，回傳切換後的集合名稱"""
+    current = current_target(client, alias)
+    versions = list_versions(client, alias)
+    if current not in versions or versions.index(current) == 0:
+        raise RuntimeError(f"{alias} 沒有可回滾的舊版本")
+    previous = versions[versions.index(current) - 1]
+    swap_alias(client, alias, previous)
+    return previous
+
+
+def main():
+    from qdrant_client import QdrantClient
+
+    parser = argparse.ArgumentParser(description="Qdrant 集合別名管理")
+    parser.add_argument("action", choices=["list", "rollback", "gc"])
+    parser.add_argument("alias")
+    parser.add_argument("--qdrant", default="http://localhost:6333")
+    parser.add_argument("--keep", type=int, default=2)
+    args = parser.parse_args()
+
+    client = QdrantClient(url=args.qdrant)
+    if args.action == "rollback":
+        print(f"↩️  {args.alias} → {rollback(client, args.alias)}")
+    elif args.action == "gc":
+        print(f"🗑️  已刪除: {gc_versions(client, args.alias, args.keep)}")
+    else:
+        current = current_target(client, args.alias)
+        for name in list_versions(client, args.alias):
+            print(f"{'*' if name == current else ' '} {name}")
+
+
+if __name__ == "__main__":
+    main()
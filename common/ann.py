@@ -0,0 +1,450 @@
+import os
+import json
+import shutil
+
+import numpy as np
+from qdrant_client.http import models
+
+from common.embed_cache import REPO_ROOT
+from common.vector_index import top_k
+
+# ============================================
+# 純 NumPy 的 IVF-flat 近似最近鄰索引（不需要 Qdrant 服務）
+# ============================================
+#
+# 以 k-means 把向量分成 nlist 群，查詢時只掃描與查詢最接近的 nprobe 群。
+# 介面模仿 QdrantClient 的常用部分（create_collection / upsert / query_points / query_batch_points），
+# common.retrieval 的 batch_dense_search 可以直接使用；過濾條件沿用 qdrant_client.models.Filter
+# （must / should / must_not，支援 match 與 range，可巢狀）。過濾用的 payload 欄位在第一次使用時展開成
+# 型別化的元素陣列（陣列型的值每個元素一筆），之後只補上新寫入的列；遮罩以 NumPy 計算並依 Filter 快取。
+#
+# 每個集合存成一個目錄：
+#   meta.json       距離、維度、nlist、nprobe、訓練時的筆數
+#   vectors.npy     (n, dim) float32，依群集排序，讀取時 memory-map
+#   centroids.npy   (nlist, dim) 群中心
+#   list_ptr.npy    (nlist + 1,) 各群在 vectors 中的起訖列
+#   points.jsonl    每列的 id 與 payload
+# 新寫入的向量先指派到既有群中心；筆數成長到訓練時的 retrain_ratio 倍才重新訓練。
+
+ANN_DIR = os.path.join(REPO_ROOT, ".cache", "ann")
+SUPPORTED_DISTANCES = (models.Distance.COSINE, models.Distance.DOT)
+
+
+def _normalize(matrix):
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def _assign(vectors, centroids, chunk=65536):
+    """分段計算每個向量最接近的群中心，避免一次產生 (n, nlist) 的大矩陣"""
+    out = np.empty(len(vectors), dtype=np.int32)
+    for i in range(0, len(vectors), chunk):
+        out[i:i + chunk] = np.argmax(np.asarray(vectors[i:i + chunk]) @ centroids.T, axis=1)
+    return out
+
+
+def train_kmeans(vectors, nlist, iters=10, sample=None, seed=0):
+    """球面 k-means（以內積分群），sample 為訓練取樣數（預設 nlist × 64）"""
+    rng = np.random.default_rng(seed)
+    n = len(vectors)
+    sample = min(n, sample or nlist * 64)
+    data = _normalize(np.asarray(vectors[np.sort(rng.choice(n, sample, replace=False))], dtype=np.float32))
+    centroids = data[rng.choice(sample, nlist, replace=False)].copy()
+    for _ in range(iters):
+        labels = _assign(data, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        counts = np.bincount(labels, minlength=nlist)
+        empty = counts == 0
+        # 空群以隨機樣本重新初始化
+        sums[empty] = data[rng.choice(sample, int(empty.sum()))]
+        centroids = _normalize(sums)
+    return centroids
+
+
+# ============================================
+# 過濾條件（qdrant_client.models.Filter）
+# ============================================
+
+def _value_key(value):
+    """字典查詢用的鍵：bool 與 int 分開（Qdrant 的 True 不等於 1），不可雜湊的值回傳 None"""
+    try:
+        hash(value)
+    except TypeError:
+        return None
+    return (value.__class__ is bool, value)
+
+
+class _Column:
+    """一個 payload 欄位展開成元素陣列：陣列型的值每個元素一筆，缺少的欄位沒有元素
+
+    rows[j] 為元素 j 所在的列，codes[j] 為值在 vocab 中的編號（不可雜湊為 -1），nums[j] 為數值（非數值為 NaN）。
+    """
+
+    def __init__(self):
+        self.n_rows = 0
+        self.scalar = True  # 每列恰好一個元素時 rows 即 0..n-1，元素遮罩就是列遮罩
+        self.vocab = {}
+        self.rows = np.empty(0, dtype=np.int64)
+        self.codes = np.empty(0, dtype=np.int64)
+        self.nums = np.empty(0, dtype=np.float64)
+
+    def extend(self, values):
+        rows, codes, nums = [], [], []
+        for i, value in enumerate(values, self.n_rows):
+            for e in _elements(value):
+                k = _value_key(e)
+                rows.append(i)
+                codes.append(-1 if k is None else self.vocab.setdefault(k, len(self.vocab)))
+                nums.append(float(e) if isinstance(e, (int, float)) and not isinstance(e, bool) else np.nan)
+        self.scalar = self.scalar and rows == list(range(self.n_rows, self.n_rows + len(values)))
+        self.n_rows += len(values)
+        self.rows = np.concatenate([self.rows, np.asarray(rows, dtype=np.int64)])
+        self.codes = np.concatenate([self.codes, np.asarray(codes, dtype=np.int64)])
+        self.nums = np.concatenate([self.nums, np.asarray(nums, dtype=np.float64)])
+
+    def isin(self, values):
+        """各元素的值是否在 values 中：以 vocab 編號查表（最後一格給不可雜湊的 -1）"""
+        table = np.zeros(len(self.vocab) + 1, dtype=bool)
+        for v in values:
+            code = self.vocab.get(_value_key(v))
+            if code is not None:
+                table[code] = True
+        return table[self.codes]
+
+    def any_row(self, element_mask, n):
+        """任一元素符合的列"""
+        if self.scalar and self.n_rows == n:
+            return element_mask
+        mask = np.zeros(n, dtype=bool)
+        mask[self.rows[element_mask]] = True
+        return mask
+
+
+class _PayloadColumns:
+    """依欄位名稱延遲建立的 payload 欄位陣列；新寫入的列在下次使用該欄位時才補上，過濾遮罩依 Filter 快取"""
+
+    def __init__(self, payloads, max_cached_masks=64):
+        self.payloads = payloads
+        self.max_cached_masks = max_cached_masks
+        self._columns = {}
+        self._masks = {}
+
+    def column(self, key):
+        col = self._columns.setdefault(key, _Column())
+        if col.n_rows < len(self.payloads):
+            values = []
+            for p in self.payloads[col.n_rows:]:
+                value = p
+                for part in key.split("."):
+                    value = value.get(part) if isinstance(value, dict) else None
+                values.append(value)
+            col.extend(values)
+        return col
+
+    def cached_mask(self, flt, n):
+        """同一個 Filter 在列數不變時直接沿用上次的遮罩（不含刪除狀態，由呼叫端另外套用）"""
+        key = flt.model_dump_json()
+        hit = self._masks.get(key)
+        if hit is not None and hit[0] == n:
+            return hit[1]
+        mask = filter_mask(flt, self, n)
+        if len(self._masks) >= self.max_cached_masks:
+            self._masks.pop(next(iter(self._masks)))
+        self._masks[key] = (n, mask)
+        return mask
+
+
+def _elements(value):
+    """陣列型 payload 逐一比對（Qdrant 的語意：任一元素符合即符合），缺少的欄位沒有元素"""
+    if value is None:
+        return ()
+    return value if isinstance(value, (list, tuple)) else (value,)
+
+
+def _condition_mask(cond, cols, n):
+    if isinstance(cond, models.Filter):
+        return filter_mask(cond, cols, n)
+    if not isinstance(cond, models.FieldCondition):
+        raise ValueError(f"本機 ANN 不支援的過濾條件: {type(cond).__name__}")
+    col = cols.column(cond.key)
+    if cond.range is not None:
+        r, x = cond.range, col.nums
+        hit = ~np.isnan(x)
+        if r.gt is not None:
+            hit &= x > r.gt
+        if r.gte is not None:
+            hit &= x >= r.gte
+        if r.lt is not None:
+            hit &= x < r.lt
+        if r.lte is not None:
+            hit &= x <= r.lte
+        return col.any_row(hit, n)
+    if cond.match is not None:
+        m = cond.match
+        if isinstance(m, models.MatchAny):
+            return col.any_row(col.isin(m.any), n)
+        if isinstance(m, models.MatchExcept):
+            # 至少要有一個元素不在排除清單中；缺少欄位不符合
+            return col.any_row(~col.isin(m.except_), n)
+        if isinstance(m, models.MatchValue):
+            return col.any_row(col.isin([m.value]), n)
+    raise ValueError(f"本機 ANN 不支援的過濾條件: {cond}")
+
+
+def filter_mask(flt, cols, n):
+    """Filter 轉成長度 n 的布林遮罩"""
+    mask = np.ones(n, dtype=bool)
+    for cond in flt.must or []:
+        mask &= _condition_mask(cond, cols, n)
+    if flt.should:
+        any_mask = np.zeros(n, dtype=bool)
+        for cond in flt.should:
+            any_mask |= _condition_mask(cond, cols, n)
+        mask &= any_mask
+    for cond in flt.must_not or []:
+        mask &= ~_condition_mask(cond, cols, n)
+    return mask
+
+
+# ============================================
+# IVF-flat 集合
+# ============================================
+
+class IVFCollection:
+    """單一集合；nlist 預設為 4·√n，nprobe 為每次查詢掃描的群數"""
+
+    def __init__(self, dim, distance=models.Distance.COSINE, nlist=None, nprobe=16, retrain_ratio=2.0):
+        if distance not in SUPPORTED_DISTANCES:
+            raise ValueError(f"本機 ANN 只支援 {[d.value for d in SUPPORTED_DISTANCES]} 距離，收到 {distance}")
+        self.dim = dim
+        self.distance = distance
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.retrain_ratio = retrain_ratio
+        self.vectors = np.empty((0, dim), dtype=np.float32)
+        self.ids, self.payloads = [], []
+        self.alive = np.empty(0, dtype=bool)
+        self.centroids = None
+        self.labels = np.empty(0, dtype=np.int32)
+        self.trained_on = 0
+        self._row_of = {}
+        self._dead = set()
+        self._pending = []  # 尚未併入 vectors 的新向量，查詢或存檔前才一次合併
+        self._order = self._ptr = None
+        self._cols = None
+
+    # --- 寫入 ---
+
+    def upsert(self, ids, vectors, payloads):
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(-1, self.dim)
+        if self.distance == models.Distance.COSINE:
+            vectors = _normalize(vectors)
+        start = len(self.ids)
+        for j, pid in enumerate(ids):
+            old = self._row_of.get(pid)
+            if old is not None:
+                self._dead.add(old)  # 同 id 覆寫：舊列標記為刪除
+            self._row_of[pid] = start + j
+        self._pending.append(vectors)
+        self.ids.extend(ids)
+        self.payloads.extend(payloads)
+        self._order = self._ptr = None
+
+    def delete(self, ids):
+        for pid in ids:
+            row = self._row_of.pop(pid, None)
+            if row is not None:
+                self._dead.add(row)
+        self._order = None
+
+    def count(self):
+        return len(self.ids) - len(self._dead)
+
+    def _consolidate(self):
+        if self._pending:
+            new = np.concatenate(self._pending)
+            self._pending = []
+            self.vectors = np.concatenate([np.asarray(self.vectors), new]) if len(self.vectors) else new
+            labels = _assign(new, self.centroids) if self.centroids is not None else np.zeros(len(new), dtype=np.int32)
+            self.labels = np.concatenate([self.labels, labels])
+        self.alive = np.ones(len(self.ids), dtype=bool)
+        self.alive[list(self._dead)] = False
+
+    # --- 建索引 ---
+
+    def _ensure_index(self):
+        if self._order is None:
+            self._consolidate()
+        n = len(self.ids)
+        if n and (self.centroids is None or n >= self.trained_on * self.retrain_ratio):
+            nlist = self.nlist or max(1, int(4 * np.sqrt(n)))
+            self.centroids = train_kmeans(self.vectors, min(nlist, n))
+            self.labels = _assign(self.vectors, self.centroids)
+            self.trained_on = n
+            self._order = None
+        if self._order is None:
+            nl = len(self.centroids) if self.centroids is not None else 1
+            self._order = np.argsort(self.labels, kind="stable")
+            self._ptr = np.concatenate([[0], np.cumsum(np.bincount(self.labels, minlength=nl))])
+        if self._cols is None:
+            self._cols = _PayloadColumns(self.payloads)
+
+    # --- 查詢 ---
+
+    def search(self, query, limit=10, query_filter=None, nprobe=None, exact=False, offset=0):
+        """回傳 [(列號, 分數), ...]；過濾後不足 limit 筆時自動加大 nprobe"""
+        if not self.ids:
+            return []
+        self._ensure_index()
+        q = np.asarray(query, dtype=np.float32)
+        if self.distance == models.Distance.COSINE:
+            q = _normalize(q)
+        mask = self.alive if query_filter is None else self.alive & self._cols.cached_mask(query_filter, len(self.ids))
+        want = limit + offset
+        if exact:
+            scores = np.asarray(self.vectors) @ q
+            scores[~mask] = -np.inf
+            best = top_k(scores, min(want, int(mask.sum())))[offset:]
+            return [(int(i), float(scores[i])) for i in best]
+
+        n_lists = len(self._ptr) - 1
+        probe = min(nprobe or self.nprobe, n_lists)
+        list_order = np.argsort(-(self.centroids @ q))
+        while True:
+            rows = np.concatenate([self._order[self._ptr[c]:self._ptr[c + 1]] for c in list_order[:probe]])
+            rows = np.sort(rows[mask[rows]])  # 依列號排序，memory-map 讀取較連續
+            if len(rows) >= want or probe >= n_lists:
+                break
+            probe = min(probe * 2, n_lists)
+        if not len(rows):
+            return []
+        scores = np.asarray(self.vectors[rows]) @ q
+        best = top_k(scores, want)[offset:]
+        return [(int(rows[i]), float(scores[i])) for i in best]
+
+    # --- 存檔 ---
+
+    def save(self, path):
+        """依群集順序寫出（同群的向量在檔案中連續），並移除已刪除的列"""
+        self._ensure_index()
+        order = self._order[self.alive[self._order]]
+        tmp = path + ".tmp"
+        shutil.rmtree(tmp, ignore_errors=True)
+        os.makedirs(tmp)
+        np.save(os.path.join(tmp, "vectors.npy"), np.asarray(self.vectors[order]))
+        labels = self.labels[order]
+        centroids = self.centroids if self.centroids is not None else np.zeros((1, self.dim), dtype=np.float32)
+        np.save(os.path.join(tmp, "centroids.npy"), centroids)
+        np.save(os.path.join(tmp, "list_ptr.npy"),
+                np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=len(centroids)))]))
+        with open(os.path.join(tmp, "points.jsonl"), "w", encoding="utf-8") as f:
+            for row in order:
+                f.write(json.dumps({"id": self.ids[row], "payload": self.payloads[row]}, ensure_ascii=False) + "\n")
+        meta = {"dim": self.dim, "distance": self.distance.value, "nlist": self.nlist,
+                "nprobe": self.nprobe, "retrain_ratio": self.retrain_ratio, "trained_on": self.trained_on}
+        with open(os.path.join(tmp, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        col = cls(meta["dim"], models.Distance(meta["distance"]), meta["nlist"], meta["nprobe"], meta["retrain_ratio"])
+        col.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        col.centroids = np.load(os.path.join(path, "centroids.npy"))
+        ptr = np.load(os.path.join(path, "list_ptr.npy"))
+        col.labels = np.repeat(np.arange(len(ptr) - 1, dtype=np.int32), np.diff(ptr))
+        with open(os.path.join(path, "points.jsonl"), "r", encoding="utf-8") as f:
+            for line in f:
+                rec = json.loads(line)
+                col._row_of[rec["id"]] = len(col.ids)
+                col.ids.append(rec["id"])
+                col.payloads.append(rec["payload"])
+        col.alive = np.ones(len(col.ids), dtype=bool)
+        col.trained_on = meta["trained_on"]
+        return col
+
+
+class LocalANNClient:
+    """QdrantClient 常用介面的本機替代品；path 為 None 時只存在記憶體中
+
+    查詢參數：search_params=models.SearchParams(exact=True) 時做精確搜尋，否則掃描 nprobe 個群。
+    """
+
+    def __init__(self, path=ANN_DIR, nprobe=16):
+        self.path = path
+        self.nprobe = nprobe
+        self._collections = {}
+        if path and os.path.isdir(path):
+            for name in os.listdir(path):
+                if os.path.exists(os.path.join(path, name, "meta.json")):
+                    self._collections[name] = None  # 第一次使用時才載入
+
+    def _get(self, collection_name):
+        if collection_name not in self._collections:
+            raise ValueError(f"集合不存在: {collection_name}")
+        if self._collections[collection_name] is None:
+            self._collections[collection_name] = IVFCollection.load(os.path.join(self.path, collection_name))
+        return self._collections[collection_name]
+
+    def collection_exists(self, collection_name):
+        return collection_name in self._collections
+
+    def create_collection(self, collection_name, vectors_config, nlist=None, nprobe=None, **_):
+        if not isinstance(vectors_config, models.VectorParams):
+            raise ValueError("本機 ANN 只支援單一（未命名）向量設定")
+        self._collections[collection_name] = IVFCollection(
+            vectors_config.size, vectors_config.distance, nlist, nprobe or self.nprobe
+        )
+        return True
+
+    def delete_collection(self, collection_name):
+        self._collections.pop(collection_name, None)
+        if self.path:
+            shutil.rmtree(os.path.join(self.path, collection_name), ignore_errors=True)
+        return True
+
+    def upsert(self, collection_name, points, **_):
+        col = self._get(collection_name)
+        col.upsert([p.id for p in points], [p.vector for p in points], [p.payload or {} for p in points])
+        return True
+
+    def delete(self, collection_name, points_selector, **_):
+        self._get(collection_name).delete(points_selector.points)
+        return True
+
+    def count(self, collection_name, **_):
+        return models.CountResult(count=self._get(collection_name).count())
+
+    def query_points(self, collection_name, query, limit=10, query_filter=None, search_params=None,
+                     with_payload=True, offset=None, using=None, **_):
+        if using:
+            raise ValueError("本機 ANN 不支援命名向量（using）")
+        col = self._get(collection_name)
+        exact = bool(search_params is not None and search_params.exact)
+        hits = col.search(query, limit, query_filter, exact=exact, offset=offset or 0)
+        return models.QueryResponse(points=[
+            models.ScoredPoint(id=col.ids[row], version=0, score=score,
+                               payload=col.payloads[row] if with_payload else None)
+            for row, score in hits
+        ])
+
+    def query_batch_points(self, collection_name, requests, **_):
+        return [
+            self.query_points(collection_name, r.query, r.limit or 10, r.filter, r.params,
+                              r.with_payload if r.with_payload is not None else True, r.offset, r.using)
+            for r in requests
+        ]
+
+    def save(self, collection_name=None):
+        """寫回磁碟（memory-map 讀取的集合未變動時也會重寫）"""
+        names = [collection_name] if collection_name else [n for n, c in self._collections.items() if c is not None]
+        for name in names:
+            self._get(name).save(os.path.join(self.path, name))
+
+    def close(self):
+        if self.path:
+            self.save()
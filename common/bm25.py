@@ -0,0 +1,127 @@
+import re
+import hashlib
+from collections import Counter
+
+import numpy as np
+
+from common.vector_index import top_k
+
+# ============================================
+# 本機中文 BM25：CJK 單字 + bigram 斷詞 + 陣列式倒排索引
+# ============================================
+#
+# 斷詞：連續中日韓字元切成單字與字元 bigram（單字讓一個字的查詢也能命中，bigram 保留詞序），英數字以單詞為單位並轉小寫。
+# 倒排索引以 CSR 陣列存放：term_ptr[t]:term_ptr[t+1] 為詞 t 的 postings（doc_ids / weights）。
+# 每個 posting 的 BM25 權重 idf * tf(k1+1) / (tf + k1(1-b+b·dl/avgdl)) 在建索引時就算好，
+# 查詢只需取出各詞的區段，以一次 np.bincount 累加成全部文件的分數。
+#
+# 也可匯出成 Qdrant sparse vector（詞 id 為雜湊值，IDF 交給 Qdrant 的 Modifier.IDF 計算）。
+
+_CJK = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_RE = re.compile(rf"[{_CJK}]+|[a-zA-Z0-9]+(?:\.[0-9]+)?")
+_CJK_RE = re.compile(rf"[{_CJK}]")
+# 斷詞規則的版本：匯出到 Qdrant 的 sparse vector 須以此判斷是否要重建
+TOKENIZER_VERSION = "cjk-unigram-bigram"
+
+
+def tokenize(text):
+    tokens = []
+    for run in _TOKEN_RE.findall(text):
+        if not _CJK_RE.match(run):
+            tokens.append(run.lower())
+        else:
+            tokens.extend(run)
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def term_id(token):
+    """穩定的 31-bit 雜湊詞 id（不需共用詞表）"""
+    return int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=4).digest(), "little") & 0x7FFFFFFF
+
+
+def _term_counts(tokens):
+    counts = Counter(tokens)
+    return list(counts), np.fromiter(counts.values(), dtype=np.float32, count=len(counts))
+
+
+class BM25Index:
+    """docs 的第 i 筆即索引中的文件 i；k1、b 為 BM25 參數"""
+
+    def __init__(self, docs, k1=1.2, b=0.75):
+        self.k1, self.b = k1, b
+        self.n_docs = len(docs)
+        vocab, rows, cols, tfs = {}, [], [], []
+        doc_len = np.zeros(self.n_docs, dtype=np.float32)
+        for d, text in enumerate(docs):
+            tokens = tokenize(text)
+            doc_len[d] = len(tokens)
+            terms, counts = _term_counts(tokens)
+            for t, c in zip(terms, counts):
+                rows.append(vocab.setdefault(t, len(vocab)))
+                cols.append(d)
+                tfs.append(c)
+        self.vocab = vocab
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.mean()) if self.n_docs else 0.0
+
+        rows = np.asarray(rows, dtype=np.int32)
+        order = np.argsort(rows, kind="stable")
+        self.doc_ids = np.asarray(cols, dtype=np.int32)[order]
+        tf = np.asarray(tfs, dtype=np.float32)[order]
+        df = np.bincount(rows, minlength=len(vocab)).astype(np.float32)
+        self.term_ptr = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        self.idf = np.log1p((self.n_docs - df + 0.5) / (df + 0.5)).astype(np.float32)
+
+        dl = doc_len[self.doc_ids]
+        norm = k1 * (1 - b + b * dl / max(self.avgdl, 1e-9))
+        term_of = np.repeat(np.arange(len(vocab), dtype=np.int32), df.astype(np.int64))
+        self.weights = (self.idf[term_of] * tf * (k1 + 1) / (tf + norm)).astype(np.float32)
+
+    def scores(self, query):
+        """query 對全部文件的 BM25 分數（長度 n_docs 的陣列）"""
+        ids = [self.vocab[t] for t in set(tokenize(query)) if t in self.vocab]
+        if not ids:
+            return np.zeros(self.n_docs, dtype=np.float32)
+        spans = [np.arange(self.term_ptr[t], self.term_ptr[t + 1]) for t in ids]
+        pos = np.concatenate(spans)
+        return np.bincount(self.doc_ids[pos], weights=self.weights[pos], minlength=self.n_docs)
+
+    def search(self, query, k=10):
+        """回傳 (文件索引, 分數)，由高到低；分數為 0 的文件不列入"""
+        s = self.scores(query)
+        idx = top_k(s, k)
+        idx = idx[s[idx] > 0]
+        return idx, s[idx]
+
+    def search_many(self, queries, k=10):
+        return [self.search(q, k) for q in queries]
+
+    # --- 匯出成 Qdrant sparse vector ---
+
+    @staticmethod
+    def doc_sparse(text, k1=1.2, b=0.75, avg_len=256.0):
+        """文件端：只含 tf 正規化部分（IDF 由 Qdrant 的 Modifier.IDF 計算）
+
+        avg_len 固定而不取語料平均，向量因此不隨語料變動，增量同步時舊切塊不需重算。
+        """
+        terms, tf = _term_counts(tokenize(text))
+        dl = float(tf.sum())
+        values = tf * (k1 + 1) / (tf + k1 * (1 - b + b * dl / avg_len))
+        return _merge_ids([term_id(t) for t in terms], values)
+
+    @staticmethod
+    def query_sparse(text):
+        """查詢端：每個不重複詞權重為 1"""
+        terms = set(tokenize(text))
+        return _merge_ids([term_id(t) for t in terms], np.ones(len(terms), dtype=np.float32))
+
+
+def _merge_ids(ids, values):
+    """雜湊碰撞時合併同一 id 的權重，回傳排序後的 (indices, values) 列表"""
+    if not ids:
+        return [], []
+    ids = np.asarray(ids, dtype=np.int64)
+    uniq, inv = np.unique(ids, return_inverse=True)
+    merged = np.bincount(inv, weights=values, minlength=len(uniq))
+    return uniq.tolist(), merged.astype(np.float32).tolist()
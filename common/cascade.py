@@ -0,0 +1,163 @@
+import re
+import time
+
+# ============================================
+# Cascade Rerank：便宜的第一階段先篩選，只有不確定的候選才送進昂貴的 reranker
+# ============================================
+#
+# 每個問題的候選依便宜分數（檢索階段的 dense / RRF 分數，或查詢與文件的字元 bigram 重疊率）
+# 排序並正規化到 0~1：
+#   - 明顯無關：正規化分數低於 drop_ratio 的候選直接捨棄（至少保留 limit 個）
+#   - 明顯相關：前 limit 名內若有一段與後面差距 >= accept_margin，這段直接入選
+#   - 其餘（不確定的中段）在預算內送進昂貴的 reranker
+# 預算可以是每題的候選數（max_expensive）或延遲（latency_budget_ms，依實測的每配對成本換算）。
+# 還沒有成本估計時，第一題先只送 calibration_pairs 個候選並計時（其中第一個配對單獨計算，吸收模型載入與暖機），
+# 其餘各題再依估計值換算預算，因此只呼叫一次 rerank_many 時延遲預算也有效。
+# 中段候選數不超過剩餘名額時不必比較，整題直接略過昂貴計算。
+
+CHEAP_SCORERS = ("score", "lexical")
+
+_TOKEN_RE = re.compile(r"[一-鿿]|[a-zA-Z0-9]+")
+
+
+def _bigrams(text):
+    tokens = [t.lower() for t in _TOKEN_RE.findall(text)]
+    if len(tokens) < 2:
+        return set(tokens)
+    return {a + b for a, b in zip(tokens, tokens[1:])}
+
+
+def lexical_overlap(query, doc):
+    """查詢的 bigram 有多少比例出現在文件中（中文以單字、英數以單詞為單位）"""
+    q = _bigrams(query)
+    return len(q & _bigrams(doc)) / len(q) if q else 0.0
+
+
+class CascadeReranker:
+    """reranker 需提供 score_many([(query, [doc, ...]), ...])（Qwen3Reranker、RerankClient 等）"""
+
+    def __init__(self, reranker, cheap="score", drop_ratio=0.3, accept_margin=0.5,
+                 max_expensive=None, latency_budget_ms=None, calibration_pairs=4):
+        if cheap not in CHEAP_SCORERS:
+            raise ValueError(f"未知的便宜評分方式: {cheap}（可用：{', '.join(CHEAP_SCORERS)}）")
+        self.reranker = reranker
+        self.cheap = cheap
+        self.drop_ratio = drop_ratio
+        self.accept_margin = accept_margin
+        self.max_expensive = max_expensive
+        self.latency_budget_ms = latency_budget_ms
+        self.calibration_pairs = calibration_pairs
+        self._ms_per_pair = None
+        self._stats = {"queries": 0, "candidates": 0, "dropped": 0, "accepted": 0,
+                       "expensive_pairs": 0, "skipped_calls": 0, "expensive_ms": 0.0}
+
+    # --- 第一階段 ---
+
+    def cheap_scores(self, query, docs, scores=None):
+        if self.cheap == "lexical" or scores is None:
+            return [lexical_overlap(query, d) for d in docs]
+        return list(scores)
+
+    def _budget(self):
+        budget = self.max_expensive
+        if self.latency_budget_ms is not None:
+            if self._ms_per_pair is None:
+                by_latency = self.calibration_pairs + 1  # 尚未估計成本：只送少量配對計時
+            else:
+                by_latency = max(1, int(self.latency_budget_ms / max(self._ms_per_pair, 1e-6)))
+            budget = by_latency if budget is None else min(budget, by_latency)
+        return budget
+
+    def plan(self, query, docs, scores=None, limit=3):
+        """回傳 (accepted, middle, rest, 捨棄數)，三組索引皆依便宜分數由高到低"""
+        cheap = self.cheap_scores(query, docs, scores)
+        order = sorted(range(len(docs)), key=lambda i: cheap[i], reverse=True)
+        lo, hi = min(cheap, default=0.0), max(cheap, default=0.0)
+        norm = {i: (cheap[i] - lo) / (hi - lo) if hi > lo else 1.0 for i in order}
+
+        kept = [i for i in order if norm[i] >= self.drop_ratio]
+        kept = order[:max(len(kept), limit)]
+        rest = order[len(kept):]
+        dropped = len(rest)
+
+        # 前 limit 名內最大的分數落差若夠大，落差之前的候選視為明顯相關
+        accepted = []
+        if self.accept_margin is not None and len(kept) > 1:
+            head = kept[:limit + 1]
+            gaps = [norm[a] - norm[b] for a, b in zip(head, head[1:])]
+            cut = max(range(len(gaps)), key=lambda g: gaps[g])
+            if gaps[cut] >= self.accept_margin:
+                accepted = kept[:cut + 1]
+
+        middle = kept[len(accepted):]
+        budget = self._budget()
+        if budget is not None and len(middle) > budget:
+            rest = middle[budget:] + rest
+            middle = middle[:budget]
+        return accepted, middle, rest, dropped
+
+    # --- 第二階段 ---
+
+    def rerank_many(self, requests, limit=3):
+        """requests 為 [(query, docs, scores 或 None), ...]，所有問題需要的昂貴計算合併成一次 score_many"""
+        requests = list(requests)
+        if self.latency_budget_ms is not None and self._ms_per_pair is None and requests:
+            # 還沒有每配對成本的估計：第一題先以少量配對計算並計時，其餘各題再依估計值套用延遲預算
+            return self._rerank_batch(requests[:1], limit, warmup=True) + self._rerank_batch(requests[1:], limit)
+        return self._rerank_batch(requests, limit)
+
+    def _score_timed(self, batch, warmup=False):
+        """呼叫昂貴的 reranker 並更新每配對成本；warmup 時第一個配對單獨計算、不計時"""
+        first = []
+        if warmup:
+            (q, docs), batch = batch[0], [(batch[0][0], batch[0][1][1:])] + batch[1:]
+            t0 = time.perf_counter()
+            first = self.reranker.score_many([(q, docs[:1])])[0]
+            self._stats["expensive_ms"] += (time.perf_counter() - t0) * 1000
+        n_pairs = sum(len(d) for _, d in batch)
+        if not n_pairs:
+            return [first]
+        t0 = time.perf_counter()
+        out = self.reranker.score_many(batch)
+        elapsed = (time.perf_counter() - t0) * 1000
+        self._stats["expensive_ms"] += elapsed
+        ms_per_pair = elapsed / n_pairs
+        self._ms_per_pair = ms_per_pair if self._ms_per_pair is None else 0.7 * self._ms_per_pair + 0.3 * ms_per_pair
+        if warmup:
+            out[0] = first + list(out[0])
+        return out
+
+    def _rerank_batch(self, requests, limit, warmup=False):
+        plans = []
+        for query, docs, scores in requests:
+            accepted, middle, rest, dropped = self.plan(query, docs, scores, limit)
+            slots = limit - len(accepted)
+            need = middle if len(middle) > slots else []
+            plans.append((accepted, middle, rest, need))
+            self._stats["queries"] += 1
+            self._stats["candidates"] += len(docs)
+            self._stats["dropped"] += dropped
+            self._stats["accepted"] += len(accepted)
+            self._stats["expensive_pairs"] += len(need)
+            self._stats["skipped_calls"] += not need
+
+        batch = [(q, [docs[i] for i in need]) for (q, docs, _), (*_, need) in zip(requests, plans) if need]
+        expensive = iter(self._score_timed(batch, warmup) if batch else [])
+
+        results = []
+        for (_, docs, _), (accepted, middle, rest, need) in zip(requests, plans):
+            if need:
+                scores = dict(zip(need, next(expensive)))
+                middle = sorted(middle, key=lambda i: scores[i], reverse=True)
+            ranked = accepted + middle + rest
+            results.append([docs[i] for i in ranked[:limit]])
+        return results
+
+    def rerank(self, query, docs, limit=3, scores=None):
+        return self.rerank_many([(query, docs, scores)], limit)[0]
+
+    def stats(self):
+        s = dict(self._stats)
+        s["skipped_pairs"] = s["candidates"] - s["expensive_pairs"]
+        s["skipped_pair_rate"] = s["skipped_pairs"] / s["candidates"] if s["candidates"] else 0.0
+        return s
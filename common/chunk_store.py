@@ -0,0 +1,206 @@
+import os
+import json
+import mmap
+import hashlib
+
+import numpy as np
+
+from common.embed_cache import REPO_ROOT
+
+# ============================================
+# 以位移表示切塊：原文只存一份（memory-mapped）
+# ============================================
+#
+# 目錄結構：
+#   text.bin   各文件的 UTF-8 內容依序附加，讀取時 memory-map
+#   docs.json  {名稱: {"offset", "length", "hash"}} 與已作廢的位元組數
+#
+# 切塊不再複製重疊的字串，而是 ChunkTable 中的 (doc_id, start, end) 陣列（文件內的位元組位置），
+# 文字只在取用時（例如交給 LLM 的候選）才從 mmap 解碼；Qdrant payload 也只需存來源與位移。
+# 文件內容變動時新內容附加在檔尾，作廢的位元組超過一半時 save() 會重寫檔案。
+
+STORE_DIR = os.path.join(REPO_ROOT, ".cache", "chunks")
+
+
+def _read_text_bytes(path):
+    """讀取檔案的 UTF-8 位元組，換行處理與文字模式讀檔相同"""
+    with open(path, "rb") as f:
+        data = f.read()
+    if b"\r" in data:
+        data = data.replace(b"\r\n", b"\n").replace(b"\r", b"\n")
+    return data
+
+
+class ChunkStore:
+    """path 為存放目錄；put / put_file 加入文件後以 windows() 或 add_spans() 建立 ChunkTable"""
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        self._text_path = os.path.join(path, "text.bin")
+        self._meta_path = os.path.join(path, "docs.json")
+        try:
+            with open(self._meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            meta = {"docs": {}, "dead": 0}
+        size = os.path.getsize(self._text_path) if os.path.exists(self._text_path) else 0
+        if any(d["offset"] + d["length"] > size for d in meta["docs"].values()):
+            meta = {"docs": {}, "dead": 0}  # 文字檔與紀錄不符時全部作廢
+        self.docs = meta["docs"]
+        self.dead = meta["dead"]
+        self._size = size
+        self._mm = None
+        self._mm_size = 0
+
+    # --- 寫入 ---
+
+    def has(self, name, digest=None):
+        return name in self.docs and (digest is None or self.docs[name]["hash"] == digest)
+
+    def put_bytes(self, name, data, digest=None):
+        """加入（或更新）文件；內容雜湊與既有相同時不重寫"""
+        digest = digest or hashlib.sha256(data).hexdigest()
+        if self.has(name, digest):
+            return self.docs[name]
+        if name in self.docs:
+            self.dead += self.docs[name]["length"]
+        with open(self._text_path, "ab") as f:
+            f.write(data)
+        self.docs[name] = {"offset": self._size, "length": len(data), "hash": digest}
+        self._size += len(data)
+        return self.docs[name]
+
+    def put(self, name, text, digest=None):
+        return self.put_bytes(name, text.encode("utf-8"), digest)
+
+    def put_file(self, name, path, digest=None):
+        """直接讀取檔案位元組加入，不需先把整份文字解碼成字串"""
+        return self.put_bytes(name, _read_text_bytes(path), digest)
+
+    def remove(self, name):
+        doc = self.docs.pop(name, None)
+        if doc:
+            self.dead += doc["length"]
+
+    def save(self):
+        if self.dead > self._size - self.dead:
+            self._compact()
+        tmp = self._meta_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"docs": self.docs, "dead": self.dead}, f, ensure_ascii=False)
+        os.replace(tmp, self._meta_path)
+
+    def _compact(self):
+        tmp = self._text_path + ".tmp"
+        offset = 0
+        with open(tmp, "wb") as out:
+            for doc in self.docs.values():
+                out.write(self._view(doc["offset"], doc["offset"] + doc["length"]))
+                doc["offset"] = offset
+                offset += doc["length"]
+        self.close()
+        os.replace(tmp, self._text_path)
+        self._size, self.dead = offset, 0
+
+    # --- 讀取 ---
+
+    def _view(self, start, end):
+        if self._mm_size < end:
+            self.close()
+            if self._size:
+                with open(self._text_path, "rb") as f:
+                    self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                self._mm_size = len(self._mm)
+        return memoryview(self._mm)[start:end] if self._mm is not None else memoryview(b"")
+
+    def doc_bytes(self, name):
+        doc = self.docs[name]
+        return self._view(doc["offset"], doc["offset"] + doc["length"])
+
+    def text(self, name, start=0, end=None):
+        """文件 name 中位元組 [start, end) 的文字；Qdrant payload 中的位移可直接傳入"""
+        doc = self.docs[name]
+        end = doc["length"] if end is None else end
+        return bytes(self._view(doc["offset"] + start, doc["offset"] + end)).decode("utf-8")
+
+    def char_offsets(self, name):
+        """每個字元起點的位元組位置，最後附上文件長度（長度為字元數 + 1）"""
+        data = np.frombuffer(self.doc_bytes(name), dtype=np.uint8)
+        return np.append(np.flatnonzero((data & 0xC0) != 0x80), len(data))
+
+    def windows(self, names, size, step):
+        """等同 [text[i:i+size] for i in range(0, len(text), step)] 的字元視窗，回傳 ChunkTable"""
+        table = ChunkTable(self)
+        for name in [names] if isinstance(names, str) else names:
+            bpos = self.char_offsets(name)
+            n_chars = len(bpos) - 1
+            starts = np.arange(0, n_chars, step)
+            table.add_spans(name, bpos[starts], bpos[np.minimum(starts + size, n_chars)])
+        return table
+
+    def close(self):
+        if self._mm is not None:
+            self._mm.close()
+        self._mm, self._mm_size = None, 0
+
+
+class ChunkTable:
+    """切塊表：doc_ids / starts / ends 三個陣列（starts、ends 為文件內位元組位置）
+
+    可當作切塊文字的序列使用：len()、table[i]、迭代都只在當下解碼該切塊。
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.names = []
+        self._name_ids = {}
+        self._parts = []
+        self._arrays = (np.empty(0, np.int32), np.empty(0, np.int64), np.empty(0, np.int64))
+
+    def add_spans(self, name, starts, ends):
+        doc_id = self._name_ids.setdefault(name, len(self.names))
+        if doc_id == len(self.names):
+            self.names.append(name)
+        starts = np.asarray(starts, dtype=np.int64)
+        self._parts.append((np.full(len(starts), doc_id, np.int32), starts, np.asarray(ends, dtype=np.int64)))
+
+    @property
+    def arrays(self):
+        if self._parts:
+            self._arrays = tuple(np.concatenate([a[k] for a in [self._arrays] + self._parts]) for k in range(3))
+            self._parts = []
+        return self._arrays
+
+    def __len__(self):
+        return len(self.arrays[0])
+
+    def __getitem__(self, i):
+        doc_ids, starts, ends = self.arrays
+        return self.store.text(self.names[doc_ids[i]], int(starts[i]), int(ends[i]))
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+    def source(self, i):
+        return self.names[self.arrays[0][i]]
+
+    def payload(self, i):
+        """Qdrant payload：來源與位移，文字以 store.text(source, start, end) 取回"""
+        doc_ids, starts, ends = self.arrays
+        return {"source": self.names[doc_ids[i]], "start": int(starts[i]), "end": int(ends[i])}
+
+    def id_keys(self):
+        """位移 + 文字，作為 point id 的依據：文件變動後同樣的文字換了位置也會得到新的 id，payload 中的位移不會過期"""
+        doc_ids, starts, ends = self.arrays
+        for i in range(len(self)):
+            yield f"{int(starts[i])}:{int(ends[i])}\x00{self[i]}"
+
+    def of(self, name):
+        """屬於文件 name 的切塊索引"""
+        return np.flatnonzero(self.arrays[0] == self._name_ids[name]) if name in self._name_ids else np.empty(0, np.int64)
+
+    def nbytes(self):
+        """切塊表本身的記憶體用量（不含 mmap 的原文）"""
+        return sum(a.nbytes for a in self.arrays)
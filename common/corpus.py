@@ -0,0 +1,193 @@
+import os
+import glob
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from common.indexing import point_id
+
+# ============================================
+# 語料匯入前端：資料夾 / glob → 多行程切塊
+# ============================================
+#
+# resolve_sources 把資料夾、glob、單一檔案（或其列表）展開成排序後的 (路徑, 來源名稱)；來源名稱為相對於
+# spec 本身的路徑（資料夾本身、glob 中第一個萬用字元之前的目錄、單一檔案的所在目錄），不隨符合的檔案集合改變，
+# 單層資料夾時即檔名（與既有的 "data_01.txt" 相同，已建立的索引不受影響）。
+#
+# iter_corpus 在行程池中讀檔與切塊（forkserver / spawn 啟動，呼叫端可能已有其他執行緒在跑，不可直接 fork），
+# 同時在途的檔案數有上限，結果依路徑順序產生，
+# 每個切塊帶有穩定 id（來源 + 內容雜湊的 uuid5，與 IncrementalIndex 相同）與來源資訊。
+# 未指定 workers 時，語料總量小於 PARALLEL_MIN_BYTES 就直接在本行程切塊：啟動行程池（子行程還會重新匯入
+# 呼叫端的主程式）的成本遠高於切幾個小檔案。子行程以 __mp_main__ 重新匯入主程式，主程式不應在模組層級
+# 開啟快取、連線或載入模型。
+#
+# 切塊方法：recursive / sliding（RecursiveCharacterTextSplitter）、token（TokenChunker）、
+# semantic（SemanticChunker；子行程各自建立不帶快取的 EmbeddingClient，要共用句子快取時以 workers=1 在本行程執行）。
+
+CHUNK_METHODS = ("recursive", "sliding", "token", "semantic")
+PARALLEL_MIN_BYTES = int(os.environ.get("CHUNK_PARALLEL_MIN_BYTES", str(8 << 20)))
+
+
+def _glob_root(pattern):
+    """glob 中第一個含萬用字元的路徑元件之前的目錄"""
+    parts = pattern.replace(os.sep, "/").split("/")
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            return "/".join(parts[:i]) or "."
+    return os.path.dirname(pattern) or "."
+
+
+def resolve_sources(spec, pattern="*.txt"):
+    """spec 可為資料夾（取其下符合 pattern 的檔案，pattern 可含 **）、glob、單一檔案或其列表
+
+    回傳依路徑排序的 [(絕對路徑, 來源名稱)]；同一檔案符合多個 spec 時以第一個為準。
+    """
+    specs = [spec] if isinstance(spec, (str, os.PathLike)) else list(spec)
+    found = {}
+    for s in specs:
+        s = os.fspath(s)
+        if os.path.isdir(s):
+            root, matches = s, glob.glob(os.path.join(s, pattern), recursive=True)
+        elif os.path.isfile(s):
+            root, matches = os.path.dirname(s) or ".", [s]
+        else:
+            root, matches = _glob_root(s), glob.glob(s, recursive=True)
+        for path in matches:
+            if os.path.isfile(path):
+                name = os.path.relpath(path, root).replace(os.sep, "/")
+                found.setdefault(os.path.abspath(path), name)
+    return sorted(found.items())
+
+
+def resolve_paths(spec, pattern="*.txt"):
+    return [path for path, _ in resolve_sources(spec, pattern)]
+
+
+class Chunker:
+    """可 pickle 的切塊設定，切塊器在各行程第一次使用時才建立
+
+    - recursive / sliding：chunk_size、chunk_overlap（字元）
+    - token：chunk_size、chunk_overlap（token），encoding 為 tiktoken 編碼名稱
+    - semantic：options 轉交 SemanticChunker（mode、threshold、percentile、min_chars、max_chars）；
+      embedder 給定時直接使用（不可跨行程），否則以 embed_url 建立 EmbeddingClient
+    """
+
+    def __init__(self, method="recursive", chunk_size=500, chunk_overlap=50, encoding="cl100k_base",
+                 embedder=None, embed_url=None, **options):
+        if method not in CHUNK_METHODS:
+            raise ValueError(f"未知的切塊方法: {method}（可用：{', '.join(CHUNK_METHODS)}）")
+        self.method = method
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.encoding = encoding
+        self.embedder = embedder
+        self.embed_url = embed_url
+        self.options = options
+        self._splitter = None
+
+    @property
+    def picklable(self):
+        return self.embedder is None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_splitter"] = None
+        return state
+
+    def _build(self):
+        if self.method in ("recursive", "sliding"):
+            from langchain_text_splitters import RecursiveCharacterTextSplitter
+            return RecursiveCharacterTextSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap,
+                                                  **self.options)
+        if self.method == "token":
+            import tiktoken
+            from common.token_chunker import TokenChunker
+            return TokenChunker(tiktoken.get_encoding(self.encoding), self.chunk_size, self.chunk_overlap)
+        from common.semantic_chunker import SemanticChunker
+        embedder = self.embedder
+        if embedder is None:
+            from common.embedding import EmbeddingClient, EMBED_API_URL
+            embedder = EmbeddingClient(self.embed_url or EMBED_API_URL)
+        return SemanticChunker(embedder, **self.options)
+
+    def split(self, text):
+        if self._splitter is None:
+            self._splitter = self._build()
+        if self.method == "token":
+            return [t for t, _, _ in self._splitter.chunks(text)]
+        if self.method == "semantic":
+            return self._splitter.chunk(text)
+        return self._splitter.split_text(text)
+
+
+class CorpusFile:
+    """一個檔案的切塊結果；content_hash 與 indexing.file_hash 相同（可交給 IncrementalIndex.keep_if_unchanged）"""
+
+    __slots__ = ("source", "path", "chunks", "content_hash")
+
+    def __init__(self, source, path, chunks, content_hash):
+        self.source = source
+        self.path = path
+        self.chunks = chunks
+        self.content_hash = content_hash
+
+    def items(self):
+        """[{"id", "source", "text", "chunk_id"}]，與 IncrementalIndex.plan_source 的 items 格式相同"""
+        return [{"id": point_id(self.source, text), "source": self.source, "text": text, "chunk_id": i}
+                for i, text in enumerate(self.chunks)]
+
+
+_worker_chunker = None
+
+
+def _init_worker(chunker):
+    global _worker_chunker
+    _worker_chunker = chunker
+
+
+def _chunk_file(path, source, chunker=None):
+    with open(path, "rb") as f:
+        data = f.read()
+    text = data.decode("utf-8").replace("\r\n", "\n").replace("\r", "\n")  # 與文字模式讀檔相同的換行處理
+    return CorpusFile(source, path, (chunker or _worker_chunker).split(text), hashlib.sha256(data).hexdigest())
+
+
+def _pool_context():
+    """不以 fork 啟動子行程：呼叫端（例如 IngestPipeline）可能已有執行緒持有鎖"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        ctx = multiprocessing.get_context("forkserver")
+        ctx.set_forkserver_preload(["common.corpus"])  # 讓 forkserver 帶入呼叫端的 sys.path 並預先載入本模組
+        return ctx
+    return multiprocessing.get_context("spawn")
+
+
+def iter_corpus(spec, chunker, workers=None, pattern="*.txt", max_in_flight=None):
+    """依路徑順序產生 CorpusFile；workers 預設為 CPU 數（語料小於 PARALLEL_MIN_BYTES 時為 1），
+    workers<=1 或只有一個檔案時在本行程執行"""
+    files = resolve_sources(spec, pattern)
+    paths = [path for path, _ in files]
+    sources = [name for _, name in files]
+    if workers is None and sum(os.path.getsize(p) for p in paths) < PARALLEL_MIN_BYTES:
+        workers = 1
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(paths) <= 1 or not chunker.picklable:
+        for path, source in zip(paths, sources):
+            yield _chunk_file(path, source, chunker)
+        return
+
+    max_in_flight = max_in_flight or workers * 4
+    with ProcessPoolExecutor(min(workers, len(paths)), mp_context=_pool_context(),
+                             initializer=_init_worker, initargs=(chunker,)) as pool:
+        pending = deque()
+        for path, source in zip(paths, sources):
+            if len(pending) >= max_in_flight:
+                yield pending.popleft().result()
+            pending.append(pool.submit(_chunk_file, path, source))
+        while pending:
+            yield pending.popleft().result()
+
+
+def load_corpus(spec, chunker, workers=None, pattern="*.txt"):
+    """{來源: [切塊, ...]}，可直接交給 sync_collection"""
+    return {f.source: f.chunks for f in iter_corpus(spec, chunker, workers, pattern)}
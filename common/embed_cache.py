@@ -0,0 +1,213 @@
+import os
+import json
+import atexit
+import weakref
+import hashlib
+import threading
+
+import numpy as np
+
+# ============================================
+# 內容定址的 Embedding 快取（memory-mapped）
+# ============================================
+#
+# 目錄結構：
+#   meta.json    維度、容量、已用列數、存取計數
+#   vectors.f32  (capacity, dim) float32 向量矩陣
+#   keys.bin     (capacity,) 16-byte 雜湊，空列為全 0
+#   atime.bin    (capacity,) int64 最後存取序號，淘汰時使用
+
+REPO_ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+DEFAULT_CACHE_DIR = os.environ.get("EMBED_CACHE_DIR", os.path.join(REPO_ROOT, ".cache", "embeddings"))
+
+KEY_BYTES = 16
+EMPTY_KEY = b"\x00" * KEY_BYTES
+
+
+def cache_key(model, task_description, normalize, text):
+    """以 (模型, 任務描述, 是否正規化, 文字) 計算快取鍵"""
+    h = hashlib.blake2b(digest_size=KEY_BYTES)
+    for part in (model, task_description or "", "1" if normalize else "0", text):
+        data = str(part).encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.digest()
+
+
+def _close_at_exit(ref):
+    cache = ref()
+    if cache is not None:
+        cache.close()
+
+
+class EmbeddingCache:
+    """向量存放在 memory-mapped 檔案中，查詢直接回傳矩陣列的 view（不複製）
+
+    - max_rows：最多保留幾筆向量，超過時淘汰最久未使用的 evict_ratio 比例
+    - grow_rows：檔案每次擴充的列數
+    - flush_rows：每寫入幾列才寫回磁碟一次；擴充檔案、close() 與程式結束時也會寫回
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_DIR, max_rows=1_000_000, grow_rows=4096, evict_ratio=0.1,
+                 flush_rows=4096):
+        self.path = path
+        self.max_rows = max_rows
+        self.grow_rows = grow_rows
+        self.evict_ratio = evict_ratio
+        self.flush_rows = flush_rows
+        self._dirty = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._index = {}
+        self._free = []
+        self.dim = None
+        self.capacity = 0
+        self.count = 0
+        self.tick = 0
+        self.vectors = self.keys = self.atime = None
+
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            self.dim, self.capacity = meta["dim"], meta["capacity"]
+            self.count, self.tick = meta["count"], meta["tick"]
+            self._open()
+            for row in range(self.count):
+                key = self.keys[row].tobytes()
+                if key == EMPTY_KEY:
+                    self._free.append(row)
+                else:
+                    self._index[key] = row
+        atexit.register(_close_at_exit, weakref.ref(self))
+
+    # --- 檔案操作 ---
+
+    def _file(self, name):
+        return os.path.join(self.path, name)
+
+    def _open(self):
+        self.vectors = np.memmap(self._file("vectors.f32"), dtype=np.float32, mode="r+", shape=(self.capacity, self.dim))
+        self.keys = np.memmap(self._file("keys.bin"), dtype=f"V{KEY_BYTES}", mode="r+", shape=(self.capacity,))
+        self.atime = np.memmap(self._file("atime.bin"), dtype=np.int64, mode="r+", shape=(self.capacity,))
+
+    def _grow(self, min_capacity):
+        new_cap = min(self.max_rows, max(min_capacity, self.capacity + self.grow_rows))
+        if self.vectors is not None:
+            self.flush()
+            self.vectors = self.keys = self.atime = None
+        # 以 truncate 擴充檔案，新區域自動補 0（即空列）
+        for name, row_bytes in (("vectors.f32", 4 * self.dim), ("keys.bin", KEY_BYTES), ("atime.bin", 8)):
+            with open(self._file(name), "ab") as f:
+                f.truncate(new_cap * row_bytes)
+        self.capacity = new_cap
+        self._open()
+
+    def flush(self):
+        """將 memmap 與中繼資料寫回磁碟"""
+        if self.vectors is None:
+            return
+        self.vectors.flush()
+        self.keys.flush()
+        self.atime.flush()
+        tmp = self._file("meta.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"dim": self.dim, "capacity": self.capacity, "count": self.count, "tick": self.tick}, f)
+        os.replace(tmp, self._file("meta.json"))
+        self._dirty = 0
+
+    def close(self):
+        """寫回尚未同步的資料；之後仍可繼續使用"""
+        with self._lock:
+            if self._dirty:
+                self.flush()
+
+    # --- 淘汰 ---
+
+    def _evict(self, need, protect=()):
+        """淘汰最久未使用的列，至少空出 need 列；protect 中的鍵（本批要覆寫的）不淘汰"""
+        keep = {self._index[k] for k in protect if k in self._index}
+        used = np.fromiter((row for row in self._index.values() if row not in keep), dtype=np.int64)
+        n = min(len(used), max(need, int(self.max_rows * self.evict_ratio)))
+        if n <= 0:
+            return
+        victims = used[np.argpartition(self.atime[used], n - 1)[:n]]
+        for row in victims.tolist():
+            del self._index[self.keys[row].tobytes()]
+            self.keys[row] = np.void(EMPTY_KEY)
+            self._free.append(row)
+        self.evictions += n
+
+    # --- 查詢與寫入 ---
+
+    def get_many(self, keys):
+        """回傳與 keys 對應的向量 view，未命中為 None"""
+        out = []
+        with self._lock:
+            for key in keys:
+                row = self._index.get(key)
+                if row is None:
+                    self.misses += 1
+                    out.append(None)
+                else:
+                    self.hits += 1
+                    self.tick += 1
+                    self.atime[row] = self.tick
+                    out.append(self.vectors[row])
+        return out
+
+    def put_many(self, keys, vectors):
+        """寫入多筆向量（已存在的鍵直接覆寫）"""
+        if not keys:
+            return
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if len(keys) > self.max_rows:
+            keys, vectors = keys[-self.max_rows:], vectors[-self.max_rows:]
+        with self._lock:
+            if self.dim is None:
+                self.dim = vectors.shape[1]
+            elif vectors.shape[1] != self.dim:
+                raise ValueError(f"向量維度 {vectors.shape[1]} 與快取維度 {self.dim} 不符")
+
+            new = sum(1 for k in set(keys) if k not in self._index)
+            short = new - len(self._free) - (self.capacity - self.count)
+            if short > 0 and self.capacity < self.max_rows:
+                self._grow(self.count + short)
+                short = new - len(self._free) - (self.capacity - self.count)
+            if short > 0:
+                # 本批要覆寫的鍵若被淘汰，寫入時又得佔用新列，超出預留的空間
+                self._evict(short, protect=set(keys))
+
+            for key, vec in zip(keys, vectors):
+                row = self._index.get(key)
+                if row is None:
+                    if self._free:
+                        row = self._free.pop()
+                    else:
+                        row = self.count
+                        self.count += 1
+                    self._index[key] = row
+                    self.keys[row] = np.void(key)
+                self.vectors[row] = vec
+                self.tick += 1
+                self.atime[row] = self.tick
+            # 未寫回的部分在異常結束時只會遺失（下次重新 embedding），不會讓快取內容錯亂
+            self._dirty += len(keys)
+            if self._dirty >= self.flush_rows:
+                self.flush()
+
+    def __len__(self):
+        return len(self._index)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._index),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+            "evictions": self.evictions,
+        }
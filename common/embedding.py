@@ -0,0 +1,204 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from common import registry
+from common.embed_cache import cache_key
+
+# ============================================
+# 共用 Embedding 客戶端
+# ============================================
+
+EMBED_API_URL = "https://ws-04.wade0426.me/embed"
+
+
+class EmbeddingError(RuntimeError):
+    """Embedding API 呼叫失敗"""
+
+
+class EmbeddingClient:
+    """/embed 客戶端：連線重用、自動分批、並行送出，結果依輸入順序回傳
+
+    - batch_size：每次請求最多幾段文字
+    - max_batch_chars：每次請求的字元總量上限，避免 payload 過大
+    - max_concurrency：同時送出的請求數上限（同時也是連線池大小）
+    - cache：選用的 EmbeddingCache，命中的文字不再呼叫 /embed
+    - model：快取鍵中的模型名稱，預設使用 url
+    """
+
+    def __init__(self, url=EMBED_API_URL, batch_size=32, max_batch_chars=16000,
+                 max_concurrency=4, max_retries=3, timeout=60, cache=None, model=None):
+        self.url = url
+        self.cache = cache
+        self.model = model or url
+        self.batch_size = batch_size
+        self.max_batch_chars = max_batch_chars
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.timeout = timeout
+
+        self.session = requests.Session()
+        # 連線層錯誤交給 urllib3 重試，HTTP 錯誤碼在 _post_batch 自行重試
+        adapter = HTTPAdapter(
+            pool_connections=max_concurrency,
+            pool_maxsize=max_concurrency,
+            max_retries=Retry(total=max_retries, connect=max_retries, read=0, backoff_factor=0.5),
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def split_batches(self, texts):
+        """依筆數與字元總量切成多個批次，回傳 (起始位置, 文字列表)"""
+        batches = []
+        start, size = 0, 0
+        for i, t in enumerate(texts):
+            full = i - start >= self.batch_size or (size + len(t) > self.max_batch_chars and i > start)
+            if full:
+                batches.append((start, texts[start:i]))
+                start, size = i, 0
+            size += len(t)
+        if start < len(texts):
+            batches.append((start, texts[start:]))
+        return batches
+
+    def _post_batch(self, texts, task_description=None, normalize=True):
+        """送出單一批次，失敗時指數退避重試"""
+        payload = {"texts": texts, "normalize": normalize, "batch_size": self.batch_size}
+        if task_description:
+            payload["task_description"] = task_description
+
+        last_error = None
+        for attempt in range(self.max_retries):
+            try:
+                res = self.session.post(self.url, json=payload, timeout=self.timeout)
+                if res.status_code == 200:
+                    embs = res.json().get("embeddings", [])
+                    if len(embs) != len(texts):
+                        raise EmbeddingError(f"回傳 {len(embs)} 筆向量，預期 {len(texts)} 筆")
+                    return embs
+                last_error = EmbeddingError(f"API 回傳 {res.status_code}")
+            except (requests.RequestException, ValueError, EmbeddingError) as e:
+                last_error = e
+            time.sleep(0.5 * 2 ** attempt)
+        raise EmbeddingError(f"Embedding 失敗，已重試 {self.max_retries} 次: {last_error}")
+
+    def fingerprint(self):
+        """向量來源的識別字串，改變時索引需要重建"""
+        return self.model
+
+    def vector_size(self, default=None):
+        """輸出向量維度：先查模型登錄檔，沒有記錄才實際呼叫一次 /embed 並記下；失敗時回傳 default"""
+        try:
+            return registry.cached(f"embed_dim|{self.fingerprint()}", lambda: len(self._embed_remote(["測試"])[0]))
+        except EmbeddingError:
+            if default is None:
+                raise
+            return default
+
+    def embed(self, texts, task_description=None, normalize=True):
+        """取得多段文字的向量，順序與輸入一致；任一批次失敗則拋出 EmbeddingError"""
+        texts = list(texts)
+        if not texts:
+            return []
+        results, missing = self._lookup(texts, task_description, normalize)
+        if missing:
+            miss_texts = [texts[idx[0]] for idx in missing.values()]
+            embs = self._embed_remote(miss_texts, task_description, normalize)
+            self._store(results, missing, embs)
+        return results
+
+    def embed_partial(self, texts, task_description=None, normalize=True, retry_rounds=2):
+        """容錯版本：回傳 (向量列表, 失敗索引)，失敗的位置為 None
+
+        第一輪全部批次並行送出，之後每輪只重送失敗的批次。
+        """
+        texts = list(texts)
+        if not texts:
+            return [], []
+        results, missing = self._lookup(texts, task_description, normalize)
+        if missing:
+            miss_texts = [texts[idx[0]] for idx in missing.values()]
+            embs = [None] * len(miss_texts)
+            pending = self.split_batches(miss_texts)
+            for _ in range(retry_rounds + 1):
+                if not pending:
+                    break
+                done, pending = self._dispatch(pending, task_description, normalize)
+                for start, batch_embs in done:
+                    embs[start:start + len(batch_embs)] = batch_embs
+            self._store(results, missing, embs)
+        failed = [i for i, v in enumerate(results) if v is None]
+        return results, failed
+
+    def _lookup(self, texts, task_description, normalize):
+        """查快取，回傳 (結果列表, {快取鍵: [未命中的索引]})；未命中的文字已去重"""
+        if self.cache is None:
+            return [None] * len(texts), {i: [i] for i in range(len(texts))}
+        keys = [cache_key(self.model, task_description, normalize, t) for t in texts]
+        results = [None if v is None else v.tolist() for v in self.cache.get_many(keys)]
+        missing = {}
+        for i, (key, vec) in enumerate(zip(keys, results)):
+            if vec is None:
+                missing.setdefault(key, []).append(i)
+        return results, missing
+
+    def _store(self, results, missing, embs):
+        """把遠端取得的向量填回結果，成功的部分寫入快取"""
+        if self.cache is not None:
+            ok = [(k, e) for k, e in zip(missing, embs) if e is not None]
+            self.cache.put_many([k for k, _ in ok], [e for _, e in ok])
+        for idx, emb in zip(missing.values(), embs):
+            for i in idx:
+                results[i] = emb
+
+    def _dispatch(self, batches, task_description, normalize):
+        """並行送出多個批次，回傳 (成功的 (起始位置, 向量), 失敗的批次)"""
+        done, failed = [], []
+        workers = min(self.max_concurrency, len(batches))
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [
+                (start, batch, pool.submit(self._post_batch, batch, task_description, normalize))
+                for start, batch in batches
+            ]
+            for start, batch, fut in futures:
+                try:
+                    done.append((start, fut.result()))
+                except EmbeddingError:
+                    failed.append((start, batch))
+        return done, failed
+
+    def _embed_remote(self, texts, task_description=None, normalize=True):
+        """不經快取，分批並行呼叫 /embed"""
+        batches = self.split_batches(texts)
+        if len(batches) == 1:
+            return self._post_batch(texts, task_description, normalize)
+
+        done, failed = self._dispatch(batches, task_description, normalize)
+        if failed:
+            n = sum(len(b) for _, b in failed)
+            raise EmbeddingError(f"{len(failed)} 個批次（{n} 段文字）Embedding 失敗")
+        results = [None] * len(texts)
+        for start, embs in done:
+            results[start:start + len(embs)] = embs
+        return results
+
+    def embed_one(self, text, task_description=None, normalize=True):
+        """取得單段文字的向量"""
+        return self.embed([text], task_description, normalize)[0]
+
+    def close(self):
+        self.session.close()
+
+
+_default_client = None
+
+
+def get_client():
+    """取得共用的預設客戶端（整個行程共用同一個連線池）"""
+    global _default_client
+    if _default_client is None:
+        _default_client = EmbeddingClient()
+    return _default_client
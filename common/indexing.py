@@ -0,0 +1,217 @@
+import os
+import json
+import uuid
+import hashlib
+
+from qdrant_client import models
+
+from common.embed_cache import REPO_ROOT
+from common.ingest import upsert_in_batches
+from common.aliases import current_target, versioned_name, swap_alias, wait_until_indexed, gc_versions
+
+# ============================================
+# 增量、冪等的索引同步
+# ============================================
+#
+# point id 由 (來源檔名, 切塊內容雜湊) 決定，同樣的切塊每次都得到同一個 id。
+# manifest 記錄每個來源目前已寫入的 id，重跑時只 embed / upsert 新的切塊，
+# 並刪除已不存在的舊切塊。
+#
+# 腳本使用的集合名稱是別名：增量更新直接寫入別名指向的實體集合；
+# 需要全量重建時（rebuild 或設定改變）寫入新版本集合，完成索引後才切換別名，
+# 重建期間查詢不受影響。manifest 依實體集合分開存放，回滾後仍然一致。
+#
+# 來源若是需要昂貴前處理的檔案（PDF 解析、OCR…），可以另外記錄檔案內容雜湊：
+# keep_if_unchanged() 在雜湊相同時直接沿用上次的切塊，不必重新解析。
+
+INDEX_DIR = os.path.join(REPO_ROOT, ".cache", "index")
+ID_NAMESPACE = uuid.UUID("6f1c3f0e-5b1a-4c1e-9a57-2d0f3b9b7a10")
+
+
+def chunk_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def file_hash(path, block_size=1 << 20):
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def point_id(source, text):
+    """由來源與內容雜湊產生固定的 UUID"""
+    return str(uuid.uuid5(ID_NAMESPACE, f"{source}\x00{chunk_hash(text)}"))
+
+
+def manifest_path_for(collection_name):
+    return os.path.join(INDEX_DIR, f"{collection_name}.json")
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        return {"fingerprint": None, "sources": {}}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_manifest(path, manifest):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def config_fingerprint(collection_config, extra=""):
+    """集合設定（維度、距離、sparse 設定…）與額外資訊的雜湊，改變時需要全量重建"""
+    items = sorted((k, repr(v)) for k, v in collection_config.items())
+    return hashlib.sha256(f"{items}|{extra}".encode("utf-8")).hexdigest()[:16]
+
+
+class IncrementalIndex:
+    """增量同步的狀態：準備集合、逐一規劃各來源要新增的切塊、最後刪除舊切塊並寫回 manifest
+
+    - collection_name：查詢用的穩定名稱（別名），實際寫入的集合為 self.target
+    - collection_config：傳給 create_collection 的參數（需要重建時使用）
+    - keep_versions：切換後保留的版本數，供回滾使用
+    """
+
+    def __init__(self, client, collection_name, collection_config, fingerprint_extra="",
+                 rebuild=False, keep_versions=2):
+        self.client = client
+        self.collection_name = collection_name
+        self.keep_versions = keep_versions
+        self.fingerprint = config_fingerprint(collection_config, fingerprint_extra)
+        self.sources = {}
+        self.hashes = {}
+        self.added = 0
+        self.planned = []  # 本次規劃新增的 point id，abort() 時從集合中移除
+
+        current = current_target(client, collection_name)
+        manifest = load_manifest(manifest_path_for(current)) if current else None
+        if current and not rebuild and manifest["fingerprint"] == self.fingerprint:
+            self.target, self.building = current, False
+            self.manifest = manifest
+        else:
+            self.target, self.building = versioned_name(collection_name), True
+            client.create_collection(collection_name=self.target, **collection_config)
+            self.manifest = {"fingerprint": self.fingerprint, "sources": {}}
+        self.manifest.setdefault("hashes", {})
+
+    def keep_if_unchanged(self, source, content_hash):
+        """來源內容雜湊與上次相同時沿用上次的切塊並回傳 True，呼叫端可略過解析與切塊"""
+        if source not in self.manifest["sources"] or self.manifest["hashes"].get(source) != content_hash:
+            return False
+        self.sources[source] = list(self.manifest["sources"][source])
+        self.hashes[source] = content_hash
+        return True
+
+    def keep_previous(self, source):
+        """來源這次無法處理（例如解析失敗）時沿用上次的切塊，commit() 不會刪除；不記錄雜湊，下次會重新處理"""
+        if source in self.manifest["sources"]:
+            self.sources[source] = list(self.manifest["sources"][source])
+
+    def plan_source(self, source, chunks, content_hash=None, id_keys=None):
+        """記錄來源目前的切塊，回傳需要新增的 items：[{"id", "source", "text", "chunk_id"}]
+
+        content_hash 給定時一併記錄，下次可用 keep_if_unchanged() 略過這個來源。
+        id_keys 給定時以其中對應的字串計算 point id（例如 payload 只存位移時須把位移納入 id），預設為切塊文字。
+        """
+        old_ids = set(self.manifest["sources"].get(source, []))
+        ids, seen, new_items = [], set(), []
+        keys = iter(id_keys) if id_keys is not None else None
+        for chunk_id, text in enumerate(chunks):
+            pid = point_id(source, text if keys is None else next(keys))
+            if pid in seen:
+                continue
+            seen.add(pid)
+            ids.append(pid)
+            if pid not in old_ids:
+                new_items.append({"id": pid, "source": source, "text": text, "chunk_id": chunk_id})
+        self.sources[source] = ids
+        if content_hash is not None:
+            self.hashes[source] = content_hash
+        self.added += len(new_items)
+        self.planned.extend(item["id"] for item in new_items)
+        return new_items
+
+    def forget(self, items):
+        """寫入失敗的 items 不記入 manifest，所屬來源的雜湊也不保留，下次會重新處理"""
+        for item in items:
+            ids = self.sources.get(item["source"], [])
+            if item["id"] in ids:
+                ids.remove(item["id"])
+                self.added -= 1
+            self.hashes.pop(item["source"], None)
+
+    def commit(self, prune_missing_sources=True):
+        """刪除已不存在的切塊並寫回 manifest；新版本則等待索引完成後切換別名
+
+        回傳 {"added", "deleted", "unchanged"}。
+        """
+        stale = []
+        for source, old_ids in self.manifest["sources"].items():
+            if source in self.sources:
+                keep = set(self.sources[source])
+                stale.extend(pid for pid in old_ids if pid not in keep)
+            elif prune_missing_sources:
+                stale.extend(old_ids)
+            else:
+                self.sources[source] = old_ids
+                if source in self.manifest["hashes"]:
+                    self.hashes[source] = self.manifest["hashes"][source]
+        if stale:
+            self.client.delete(collection_name=self.target, points_selector=models.PointIdsList(points=stale))
+
+        self.manifest = {"fingerprint": self.fingerprint, "sources": self.sources, "hashes": self.hashes}
+        save_manifest(manifest_path_for(self.target), self.manifest)
+        self.planned = []
+        if self.building:
+            wait_until_indexed(self.client, self.target)
+            swap_alias(self.client, self.collection_name, self.target)
+            gc_versions(self.client, self.collection_name, self.keep_versions, on_delete=_remove_manifest)
+            self.building = False
+
+        total = sum(len(ids) for ids in self.sources.values())
+        return {"added": self.added, "deleted": len(stale), "unchanged": total - self.added}
+
+    def abort(self):
+        """同步失敗時復原：新版本整個刪除（別名維持指向舊版本）；增量模式則刪除本次規劃新增、
+        可能已部分寫入的 point，manifest 不變，集合回到上次 commit 的狀態"""
+        if self.building:
+            self.client.delete_collection(self.target)
+            self.building = False
+        elif self.planned:
+            self.client.delete(collection_name=self.target, points_selector=models.PointIdsList(points=self.planned))
+        self.planned = []
+
+
+def _remove_manifest(collection_name):
+    path = manifest_path_for(collection_name)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+def sync_collection(client, collection_name, docs, build_points, collection_config,
+                    fingerprint_extra="", rebuild=False, upsert_batch=256, prune_missing_sources=True):
+    """把集合同步成 docs 的內容
+
+    - docs：{來源: [切塊文字, ...]}，不在 docs 中的舊來源會被刪除（prune_missing_sources=False 時保留）
+    - build_points(items)：items 為 [{"id", "source", "text", "chunk_id"}]，回傳對應的 PointStruct 列表
+      （只會拿到需要新增的切塊，embedding 在這裡做）
+
+    回傳 {"added", "deleted", "unchanged"} 統計。
+    """
+    index = IncrementalIndex(client, collection_name, collection_config, fingerprint_extra, rebuild)
+    try:
+        new_items = []
+        for source, chunks in docs.items():
+            new_items.extend(index.plan_source(source, chunks))
+        if new_items:
+            upsert_in_batches(client, index.target, build_points(new_items), upsert_batch)
+        return index.commit(prune_missing_sources)
+    except Exception:
+        index.abort()
+        raise
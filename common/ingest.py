@@ -0,0 +1,40 @@
+from qdrant_client.models import PointStruct
+
+# ============================================
+# 批次匯入 Qdrant
+# ============================================
+
+
+def upsert_in_batches(client, collection_name, points, batch_size=256):
+    """分批 upsert，避免單一請求過大"""
+    total = 0
+    for i in range(0, len(points), batch_size):
+        batch = points[i:i + batch_size]
+        client.upsert(collection_name=collection_name, points=batch)
+        total += len(batch)
+    return total
+
+
+def bulk_ingest(client, collection_name, items, embedder, text_key="text",
+                task_description=None, upsert_batch=256, retry_rounds=2, id_key=None, store_text=True):
+    """批次、並行 embedding 後分批寫入集合
+
+    point id 預設為 items 中的索引；id_key 給定時改用 item[id_key]（例如 IncrementalIndex 產生的 id），
+    該欄位不寫入 payload。store_text=False 時 text_key 也不寫入（文字由 ChunkStore 依位移取回）。
+
+    回傳 (成功寫入筆數, 失敗的 items 索引列表)。
+    """
+    texts = [item[text_key] for item in items]
+    vectors, failed = embedder.embed_partial(texts, task_description=task_description, retry_rounds=retry_rounds)
+    skip = {id_key, None if store_text else text_key}
+    points = [
+        PointStruct(
+            id=i if id_key is None else item[id_key],
+            vector=vec,
+            payload={k: v for k, v in item.items() if k not in skip},
+        )
+        for i, (item, vec) in enumerate(zip(items, vectors))
+        if vec is not None
+    ]
+    written = upsert_in_batches(client, collection_name, points, upsert_batch)
+    return written, failed
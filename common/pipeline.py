@@ -0,0 +1,200 @@
+import os
+import queue
+import threading
+import time
+
+# ============================================
+# 串流匯入管線：讀檔 → 切塊 → embedding → upsert
+# ============================================
+#
+# 各階段在各自的執行緒同時執行，階段之間以有界佇列相連（backpressure），
+# 記憶體中最多只有 queue_size 個批次的向量，與語料大小無關。
+
+_DONE = object()
+
+
+class StageStats:
+    """單一階段的處理量與忙碌時間"""
+
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+        self._lock = threading.Lock()
+
+    def record(self, items, seconds):
+        with self._lock:
+            self.items += items
+            self.busy += seconds
+
+    def throughput(self):
+        return self.items / self.busy if self.busy > 0 else 0.0
+
+
+class IngestPipeline:
+    """四階段串流管線
+
+    - split(source, text)：回傳要 embed 的 items 列表（可在此過濾掉已索引的切塊）；
+      run(files=...) 時 text 改為 files 中每筆的第二項（例如 iter_corpus 已切好的切塊列表）
+    - embed(items)：回傳 PointStruct 列表
+    - upsert(points)：寫入向量資料庫
+    - embed_workers：embedding 階段的並行執行緒數
+    """
+
+    def __init__(self, split, embed, upsert, embed_workers=4, embed_batch=32,
+                 upsert_batch=128, queue_size=8):
+        self.split = split
+        self.embed = embed
+        self.upsert = upsert
+        self.embed_workers = embed_workers
+        self.embed_batch = embed_batch
+        self.upsert_batch = upsert_batch
+        self.queue_size = queue_size
+        self.stats = {name: StageStats(name) for name in ("read", "split", "embed", "upsert")}
+        self.wall = 0.0
+        self._stop = threading.Event()
+        self._errors = []
+
+    # --- 佇列操作：出錯時停止等待，避免死結 ---
+
+    def _put(self, q, item):
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _get(self, q):
+        """取出下一筆；管線已停止時回傳結束標記"""
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _DONE
+
+    def _fail(self, e):
+        self._errors.append(e)
+        self._stop.set()
+
+    # --- 各階段 ---
+
+    @staticmethod
+    def _read_files(paths):
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                yield os.path.basename(path), f.read()
+
+    def _read_stage(self, files, out_q):
+        try:
+            files = iter(files)
+            while not self._stop.is_set():
+                t0 = time.perf_counter()
+                item = next(files, _DONE)
+                if item is _DONE:
+                    break
+                self.stats["read"].record(1, time.perf_counter() - t0)
+                if not self._put(out_q, item):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(out_q, _DONE)
+
+    def _split_stage(self, in_q, out_q):
+        try:
+            while True:
+                item = self._get(in_q)
+                if item is _DONE:
+                    break
+                source, text = item
+                t0 = time.perf_counter()
+                items = self.split(source, text)
+                self.stats["split"].record(len(items), time.perf_counter() - t0)
+                for i in range(0, len(items), self.embed_batch):
+                    if not self._put(out_q, items[i:i + self.embed_batch]):
+                        return
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.embed_workers):
+                self._put(out_q, _DONE)
+
+    def _embed_stage(self, in_q, out_q):
+        try:
+            while True:
+                items = self._get(in_q)
+                if items is _DONE:
+                    break
+                t0 = time.perf_counter()
+                points = self.embed(items)
+                self.stats["embed"].record(len(items), time.perf_counter() - t0)
+                if not self._put(out_q, points):
+                    break
+        except Exception as e:
+            self._fail(e)
+        finally:
+            self._put(out_q, _DONE)
+
+    def _upsert_stage(self, in_q):
+        pending = []
+        finished = 0
+
+        def flush():
+            t0 = time.perf_counter()
+            self.upsert(pending)
+            self.stats["upsert"].record(len(pending), time.perf_counter() - t0)
+            pending.clear()
+
+        try:
+            while finished < self.embed_workers:
+                points = self._get(in_q)
+                if self._stop.is_set():
+                    return
+                if points is _DONE:
+                    finished += 1
+                    continue
+                pending.extend(points)
+                if len(pending) >= self.upsert_batch:
+                    flush()
+            if pending and not self._stop.is_set():
+                flush()
+        except Exception as e:
+            self._fail(e)
+
+    def run(self, paths=(), files=None):
+        """執行整條管線，任一階段出錯時拋出第一個錯誤
+
+        files 給定時不讀取 paths，改從 files 取出 (來源, 內容)，例如多行程切塊的 iter_corpus 結果。
+        """
+        if files is None:
+            files = self._read_files(paths)
+        text_q = queue.Queue(self.queue_size)
+        chunk_q = queue.Queue(self.queue_size)
+        point_q = queue.Queue(self.queue_size)
+        threads = [
+            threading.Thread(target=self._read_stage, args=(files, text_q)),
+            threading.Thread(target=self._split_stage, args=(text_q, chunk_q)),
+            threading.Thread(target=self._upsert_stage, args=(point_q,)),
+        ] + [
+            threading.Thread(target=self._embed_stage, args=(chunk_q, point_q))
+            for _ in range(self.embed_workers)
+        ]
+        t0 = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.wall = time.perf_counter() - t0
+        if self._errors:
+            raise self._errors[0]
+        return self.stats
+
+    def report(self):
+        """各階段處理量報告"""
+        lines = [f"⏱️  管線總耗時 {self.wall:.2f}s"]
+        for s in self.stats.values():
+            lines.append(f"   {s.name:7} {s.items:6d} 筆 | 忙碌 {s.busy:7.2f}s | {s.throughput():8.1f} 筆/s")
+        return "\n".join(lines)
@@ -0,0 +1,139 @@
+import os
+import hashlib
+
+import numpy as np
+
+from common.embed_cache import REPO_ROOT
+
+# ============================================
+# 向量降維：Matryoshka 截斷 / PCA
+# ============================================
+#
+# 投影放在 embedding 客戶端與 Qdrant 之間，文件與查詢都經過同一個投影。
+# PCA 需先以語料擬合並存檔（bench/bench_projection.py --fit pca:256），
+# 截斷則不需擬合。投影後一律重新正規化，COSINE / 內積結果一致。
+# PCA 的 signature 含 mean / components 的雜湊：重新擬合（覆寫存檔）後 fingerprint 隨之改變，
+# 以舊投影建立的集合會重建，不會混用新舊投影的向量。
+
+PROJECTION_DIR = os.path.join(REPO_ROOT, ".cache", "projection")
+
+
+def _normalize(x):
+    norms = np.linalg.norm(x, axis=1, keepdims=True)
+    return x / np.maximum(norms, 1e-12)
+
+
+class Projection:
+    """kind 為 "truncate" 或 "pca"，dim 為輸出維度"""
+
+    def __init__(self, kind, dim, mean=None, components=None):
+        if kind not in ("truncate", "pca"):
+            raise ValueError(f"未知的投影方式: {kind}")
+        self.kind = kind
+        self.dim = dim
+        self.mean = mean
+        self.components = components
+
+    @property
+    def name(self):
+        return f"{self.kind}:{self.dim}"
+
+    @property
+    def signature(self):
+        """name 加上擬合結果的短雜湊（截斷不需擬合，即 name）"""
+        if self.kind == "truncate":
+            return self.name
+        if not self.fitted:
+            raise RuntimeError(f"投影 {self.name} 尚未擬合")
+        h = hashlib.sha256(np.ascontiguousarray(self.mean, dtype=np.float32).tobytes())
+        h.update(np.ascontiguousarray(self.components, dtype=np.float32).tobytes())
+        return f"{self.name}@{h.hexdigest()[:12]}"
+
+    @property
+    def fitted(self):
+        return self.kind == "truncate" or self.components is not None
+
+    def fit(self, vectors, max_samples=20000, seed=0):
+        """以文件向量擬合 PCA（截斷不需擬合）"""
+        if self.kind == "truncate":
+            return self
+        x = np.asarray(vectors, dtype=np.float32)
+        if len(x) > max_samples:
+            x = x[np.random.default_rng(seed).choice(len(x), max_samples, replace=False)]
+        if len(x) < self.dim:
+            raise ValueError(f"PCA 需要至少 {self.dim} 筆向量，目前只有 {len(x)} 筆")
+        self.mean = x.mean(axis=0)
+        _, _, vt = np.linalg.svd(x - self.mean, full_matrices=False)
+        self.components = np.ascontiguousarray(vt[:self.dim].T, dtype=np.float32)
+        return self
+
+    def transform(self, vectors):
+        """投影並重新正規化，回傳 float32 矩陣"""
+        if not self.fitted:
+            raise RuntimeError(f"投影 {self.name} 尚未擬合")
+        x = np.asarray(vectors, dtype=np.float32)
+        if self.kind == "truncate":
+            return _normalize(x[:, :self.dim])
+        return _normalize((x - self.mean) @ self.components)
+
+    def path(self):
+        return os.path.join(PROJECTION_DIR, f"{self.kind}_{self.dim}.npz")
+
+    def save(self, path=None):
+        path = path or self.path()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.savez(path, kind=self.kind, dim=self.dim, mean=self.mean, components=self.components)
+        return path
+
+    @classmethod
+    def load(cls, name):
+        """由 "truncate:512" / "pca:256" 建立投影，PCA 從存檔載入"""
+        kind, dim = name.split(":")
+        proj = cls(kind, int(dim))
+        if kind == "pca":
+            if not os.path.exists(proj.path()):
+                raise FileNotFoundError(f"找不到 {proj.path()}，請先執行 bench/bench_projection.py --fit {name}")
+            data = np.load(proj.path())
+            proj.mean, proj.components = data["mean"], data["components"]
+        return proj
+
+
+class ProjectedEmbedder:
+    """包裝 EmbeddingClient，回傳投影後的向量；其餘屬性轉交原客戶端"""
+
+    def __init__(self, client, projection):
+        self.client = client
+        self.projection = projection
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+    def fingerprint(self):
+        return f"{self.client.fingerprint()}|{self.projection.signature}"
+
+    def vector_size(self, default=None):
+        return self.projection.dim
+
+    def embed(self, texts, task_description=None, normalize=True):
+        embs = self.client.embed(texts, task_description, normalize)
+        return self.projection.transform(embs).tolist() if embs else []
+
+    def embed_one(self, text, task_description=None, normalize=True):
+        return self.embed([text], task_description, normalize)[0]
+
+    def embed_partial(self, texts, task_description=None, normalize=True, retry_rounds=2):
+        embs, failed = self.client.embed_partial(texts, task_description, normalize, retry_rounds)
+        ok = [i for i, e in enumerate(embs) if e is not None]
+        if ok:
+            projected = self.projection.transform([embs[i] for i in ok]).tolist()
+            for i, vec in zip(ok, projected):
+                embs[i] = vec
+        return embs, failed
+
+
+def with_projection(client, name=None):
+    """依 name 或環境變數 EMBED_PROJECTION（如 "truncate:512"、"pca:256"）包裝客戶端，未設定則原樣回傳"""
+    name = name or os.environ.get("EMBED_PROJECTION", "")
+    if not name or name == "none":
+        return client
+    return ProjectedEmbedder(client, Projection.load(name))
@@ -0,0 +1,53 @@
+import os
+import json
+import threading
+
+from common.embed_cache import REPO_ROOT
+
+# ============================================
+# 模型中繼資料登錄檔（向量維度…）
+# ============================================
+#
+# 第一次需要時計算並寫入 .cache/model_registry.json，之後啟動直接讀檔，
+# 不再為了得知維度而呼叫一次 /embed。只記錄能省下實際工作的值：reranker 計分本來就需要 tokenizer，
+# yes / no 的 token id 直接由已載入的 tokenizer 取得，不記在這裡。
+
+REGISTRY_PATH = os.environ.get("MODEL_REGISTRY", os.path.join(REPO_ROOT, ".cache", "model_registry.json"))
+_lock = threading.Lock()
+_data = None
+
+
+def _load():
+    global _data
+    if _data is None:
+        try:
+            with open(REGISTRY_PATH, "r", encoding="utf-8") as f:
+                _data = json.load(f)
+        except (OSError, ValueError):
+            _data = {}
+    return _data
+
+
+def get(key, default=None):
+    with _lock:
+        return _load().get(key, default)
+
+
+def put(key, value):
+    with _lock:
+        data = _load()
+        data[key] = value
+        os.makedirs(os.path.dirname(REGISTRY_PATH), exist_ok=True)
+        tmp = REGISTRY_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(tmp, REGISTRY_PATH)
+
+
+def cached(key, compute):
+    """登錄檔有值就直接回傳，否則呼叫 compute() 並記錄"""
+    value = get(key)
+    if value is None:
+        value = compute()
+        put(key, value)
+    return value
@@ -0,0 +1,93 @@
+import os
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+from common.embed_cache import REPO_ROOT
+
+# ============================================
+# Reranker 分數快取：記憶體 LRU + 選用的 SQLite 磁碟快取
+# ============================================
+
+DEFAULT_RERANK_CACHE = os.path.join(REPO_ROOT, ".cache", "rerank_scores.sqlite")
+
+
+def score_key(model_path, instruction, query, doc):
+    """以 (模型路徑, 指令, 查詢, 文件雜湊) 計算快取鍵"""
+    doc_hash = hashlib.sha256(doc.encode("utf-8")).hexdigest()
+    raw = "\x00".join([model_path, instruction, query, doc_hash])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class RerankScoreCache:
+    """maxsize 為記憶體 LRU 筆數；path 給定時同時寫入 SQLite，重新啟動後仍可命中"""
+
+    def __init__(self, maxsize=50000, path=None):
+        self.maxsize = maxsize
+        self.path = path
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._lru = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute("CREATE TABLE IF NOT EXISTS scores (key TEXT PRIMARY KEY, score REAL)")
+            self._db.commit()
+
+    def _remember(self, key, score):
+        self._lru[key] = score
+        self._lru.move_to_end(key)
+        while len(self._lru) > self.maxsize:
+            self._lru.popitem(last=False)
+
+    def get_many(self, keys):
+        """回傳與 keys 對應的分數，未命中為 None"""
+        out = [None] * len(keys)
+        with self._lock:
+            disk_lookup = []
+            for i, key in enumerate(keys):
+                if key in self._lru:
+                    self._lru.move_to_end(key)
+                    out[i] = self._lru[key]
+                    self.memory_hits += 1
+                else:
+                    disk_lookup.append(i)
+            if self._db is not None and disk_lookup:
+                wanted = list({keys[i] for i in disk_lookup})
+                found = {}
+                for j in range(0, len(wanted), 500):
+                    part = wanted[j:j + 500]
+                    rows = self._db.execute(
+                        f"SELECT key, score FROM scores WHERE key IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+                    found.update(rows)
+                for i in disk_lookup:
+                    if keys[i] in found:
+                        out[i] = found[keys[i]]
+                        self._remember(keys[i], out[i])
+                        self.disk_hits += 1
+                disk_lookup = [i for i in disk_lookup if out[i] is None]
+            self.misses += len(disk_lookup)
+        return out
+
+    def put_many(self, keys, scores):
+        with self._lock:
+            for key, score in zip(keys, scores):
+                self._remember(key, score)
+            if self._db is not None:
+                self._db.executemany("INSERT OR REPLACE INTO scores (key, score) VALUES (?, ?)", list(zip(keys, scores)))
+                self._db.commit()
+
+    def stats(self):
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
@@ -0,0 +1,252 @@
+import os
+import json
+import time
+import queue
+import socket
+import argparse
+import threading
+import http.client
+from concurrent.futures import Future
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from common.reranker import RerankerBase, RerankerError, Qwen3Reranker, BACKENDS
+from common.rerank_cache import RerankScoreCache, DEFAULT_RERANK_CACHE
+
+# ============================================
+# 本機 Reranker 服務：模型只載入一次，多個行程共用
+# ============================================
+#
+# 啟動：python -m common.rerank_server --model ~/AI/Models/Qwen3-Reranker-0.6B --port 8765
+#       python -m common.rerank_server --model ... --socket /tmp/reranker.sock
+# 客戶端：RerankClient("http://127.0.0.1:8765") 或 RerankClient("unix:///tmp/reranker.sock")
+#
+# 各連線的請求先放進佇列，由單一批次執行緒在 window_ms 內收集後合併成一次 score_many，
+# 不同客戶端的候選因此能共用同一組 padding 批次；模型也只會被這個執行緒呼叫。
+
+DEFAULT_PORT = 8765
+
+
+class RerankServiceError(RerankerError):
+    """rerank 服務回傳錯誤或無法連線"""
+
+
+class Coalescer:
+    """把 window_ms 內到達的請求合併成一次 score_many"""
+
+    def __init__(self, reranker, window_ms=10, max_pairs=512):
+        self.reranker = reranker
+        self.window = window_ms / 1000
+        self.max_pairs = max_pairs
+        self.requests = 0
+        self.batches = 0
+        self.pairs = 0
+        self._queue = queue.Queue()
+        threading.Thread(target=self._loop, daemon=True).start()
+
+    def submit(self, requests):
+        future = Future()
+        self._queue.put((requests, future))
+        return future.result()
+
+    def _loop(self):
+        while True:
+            items = [self._queue.get()]
+            n_pairs = sum(len(docs) for _, docs in items[0][0])
+            deadline = time.monotonic() + self.window
+            while n_pairs < self.max_pairs:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                items.append(item)
+                n_pairs += sum(len(docs) for _, docs in item[0])
+
+            merged = [r for reqs, _ in items for r in reqs]
+            try:
+                results = self.reranker.score_many(merged)
+            except Exception as e:
+                for _, future in items:
+                    future.set_exception(e)
+                continue
+            self.requests += len(items)
+            self.batches += 1
+            self.pairs += n_pairs
+            pos = 0
+            for reqs, future in items:
+                future.set_result(results[pos:pos + len(reqs)])
+                pos += len(reqs)
+
+    def stats(self):
+        out = {
+            "requests": self.requests,
+            "batches": self.batches,
+            "pairs": self.pairs,
+            "requests_per_batch": self.requests / self.batches if self.batches else 0.0,
+        }
+        if getattr(self.reranker, "cache", None) is not None:
+            out["cache"] = self.reranker.cache.stats()
+        return out
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def _reply(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == "/health":
+            self._reply(200, {"status": "ok", "model": self.server.coalescer.reranker.model_path})
+        elif self.path == "/stats":
+            self._reply(200, self.server.coalescer.stats())
+        else:
+            self._reply(404, {"error": f"未知路徑: {self.path}"})
+
+    def do_POST(self):
+        if self.path != "/score":
+            return self._reply(404, {"error": f"未知路徑: {self.path}"})
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+            requests = [(q, list(docs)) for q, docs in body["requests"]]
+        except (ValueError, KeyError, TypeError) as e:
+            return self._reply(400, {"error": f"請求格式錯誤: {e}"})
+        try:
+            self._reply(200, {"scores": self.server.coalescer.submit(requests)})
+        except Exception as e:
+            self._reply(500, {"error": str(e)})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_UNIX
+
+    def server_bind(self):
+        if os.path.exists(self.server_address):
+            os.remove(self.server_address)
+        self.socket.bind(self.server_address)
+        self.server_name, self.server_port = "localhost", 0
+
+    def get_request(self):
+        conn, _ = self.socket.accept()
+        return conn, ("unix", 0)
+
+
+def make_server(reranker, host="127.0.0.1", port=DEFAULT_PORT, socket_path=None, window_ms=10):
+    """建立（尚未啟動的）服務；socket_path 給定時改用 Unix socket"""
+    if socket_path:
+        server = _UnixHTTPServer(socket_path, _Handler)
+    else:
+        server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.coalescer = Coalescer(reranker, window_ms=window_ms)
+    return server
+
+
+# ============================================
+# 客戶端：與 Qwen3Reranker 相同的 score / score_many / rerank 介面
+# ============================================
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, path, timeout):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+class RerankClient(RerankerBase):
+    """url 為 http://host:port 或 unix:///path/to/socket"""
+
+    def __init__(self, url, timeout=300):
+        self.url = url
+        self.timeout = timeout
+        self.model_path = url
+        self.cache = None  # 快取在服務端
+        self.device = None
+
+    def _connect(self):
+        if self.url.startswith("unix://"):
+            return _UnixConnection(self.url[len("unix://"):], self.timeout)
+        host = self.url.split("://", 1)[-1].rstrip("/")
+        return http.client.HTTPConnection(host, timeout=self.timeout)
+
+    def _call(self, method, path, body=None):
+        conn = self._connect()
+        try:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else None
+            conn.request(method, path, body=data, headers={"Content-Type": "application/json"})
+            resp = conn.getresponse()
+            payload = json.loads(resp.read() or b"{}")
+        except (OSError, ValueError, http.client.HTTPException) as e:
+            raise RerankServiceError(f"無法連線 rerank 服務 {self.url}: {e}") from e
+        finally:
+            conn.close()
+        if resp.status != 200:
+            raise RerankServiceError(f"rerank 服務錯誤 ({resp.status}): {payload.get('error')}")
+        return payload
+
+    def load(self):
+        """確認服務可用（與 Qwen3Reranker.load 對應，第一次計分時自動呼叫）"""
+        if self.device is None:
+            self.device = f"{self.url}（{self._call('GET', '/health')['model']}）"
+            print(f"✅ 使用 Reranker 服務: {self.device}")
+        return self
+
+    def stats(self):
+        return self._call("GET", "/stats")
+
+    def score_many(self, requests):
+        requests = [(q, list(docs)) for q, docs in requests]
+        if not requests:
+            return []
+        self.load()
+        return self._call("POST", "/score", {"requests": requests})["scores"]
+
+    def score_pairs(self, pairs):
+        return [s for (s,) in self.score_many([(q, [d]) for q, d in pairs])]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本機 Reranker 服務")
+    parser.add_argument("--model", default=os.path.expanduser("~/AI/Models/Qwen3-Reranker-0.6B"))
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--socket", help="改用 Unix socket 路徑")
+    parser.add_argument("--window-ms", type=float, default=10, help="合併請求的等待時間")
+    parser.add_argument("--backend", choices=BACKENDS, default="torch")
+    parser.add_argument("--threads", type=int, default=None)
+    parser.add_argument("--no-prefix-cache", action="store_true")
+    parser.add_argument("--no-score-cache", action="store_true")
+    args = parser.parse_args()
+
+    reranker = Qwen3Reranker(
+        args.model, prefix_cache=not args.no_prefix_cache, backend=args.backend, num_threads=args.threads,
+        cache=None if args.no_score_cache else RerankScoreCache(path=DEFAULT_RERANK_CACHE),
+    )
+    reranker.load()
+    server = make_server(reranker, args.host, args.port, args.socket, args.window_ms)
+    where = f"unix://{args.socket}" if args.socket else f"http://{args.host}:{args.port}"
+    print(f"✅ Reranker 服務已啟動: {where}（backend: {args.backend}，合併視窗 {args.window_ms}ms）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print(f"\n📊 統計: {server.coalescer.stats()}")
+    finally:
+        server.server_close()
+        if args.socket and os.path.exists(args.socket):
+            os.remove(args.socket)
+
+
+if __name__ == "__main__":
+    main()
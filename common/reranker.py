@@ -0,0 +1,383 @@
+import os
+import copy
+import hashlib
+import importlib.util
+from abc import ABC, abstractmethod
+
+from common import startup
+from common.embed_cache import REPO_ROOT
+from common.rerank_cache import score_key
+
+# ============================================
+# Qwen3 Reranker：批次、padding 後的前向計算
+# ============================================
+#
+# 所有 (query, document) 配對一起 tokenize，依長度排序後以 token 預算切成批次，
+# 每批 left padding 後做一次前向計算，一次取出整批的 yes / no logits。
+# score_many() 可以把多個問題的候選合併成同一批（動態批次）。
+#
+# prefix_cache=True 時，同一問題的候選共用「指令 + 查詢」前綴：前綴只計算一次並保留
+# past_key_values，之後每批只計算文件部分的 token。前綴取所有候選 token 序列的
+# 最長共同前綴，因此 tokenize 結果與逐筆計算完全相同。
+#
+# backend 選擇計算方式（介面與回傳的 yes 機率相同）：
+#   torch  float16 原始模型（有 GPU 時使用）
+#   int8   CPU 上以 float32 載入後對 Linear 做動態 int8 量化：優先使用 torchao 的 quantize_；
+#          未安裝 torchao 時退回 torch.ao.quantization.quantize_dynamic（torch 2.x 已標示 deprecated、
+#          將被移除，僅在移除前的 torch 版本可用），兩者分數略有差異，快取鍵分開
+#   onnx   匯出只輸出最後位置 yes / no logits 的 ONNX 圖，以 onnxruntime 多執行緒計算
+#          （匯出檔快取在 .cache/onnx，檔名含模型路徑、權重修改時間與 yes/no token id 的雜湊；不支援 prefix_cache）
+
+INSTRUCTION = "根據查詢檢索相關的技術文件"
+BACKENDS = ("torch", "int8", "onnx")
+ONNX_DIR = os.path.join(REPO_ROOT, ".cache", "onnx")
+
+
+def format_pair(query, doc, instruction=INSTRUCTION):
+    return f"<Instruct>: {instruction}\n<Query>: {query}\n<Document>: {doc}"
+
+
+def _expand_cache(past, batch_size):
+    """複製前綴的 KV cache 並擴展成 batch_size 份（前向計算會改寫 cache，所以每批都要複製）"""
+    if hasattr(past, "batch_repeat_interleave"):
+        cache = copy.deepcopy(past)
+        cache.batch_repeat_interleave(batch_size)
+        return cache
+    return tuple(tuple(t.expand(batch_size, *t.shape[1:]).contiguous() for t in layer) for layer in past)
+
+
+def _int8_quantizer():
+    return "torchao" if importlib.util.find_spec("torchao") is not None else "torch.ao"
+
+
+def _quantize_int8(model):
+    """Linear 層動態 int8 量化（activation 動態量化、weight int8）"""
+    if _int8_quantizer() == "torchao":
+        from torchao.quantization import quantize_, Int8DynamicActivationInt8WeightConfig
+        quantize_(model, Int8DynamicActivationInt8WeightConfig())
+        return model
+    import torch
+    print("⚠️  未安裝 torchao，改用即將移除的 torch.ao.quantization.quantize_dynamic（pip install torchao）")
+    return torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+def _model_signature(model_path):
+    """模型路徑 + config / 權重檔的修改時間與大小；同名目錄換了 checkpoint 時會不同"""
+    h = hashlib.sha256(os.path.abspath(model_path).encode("utf-8"))
+    if os.path.isdir(model_path):
+        for name in sorted(os.listdir(model_path)):
+            if name == "config.json" or name.endswith((".safetensors", ".bin")):
+                st = os.stat(os.path.join(model_path, name))
+                h.update(f"\x00{name}:{st.st_mtime_ns}:{st.st_size}".encode("utf-8"))
+    return h
+
+
+def _export_onnx(model, path, token_ids):
+    """匯出只回傳最後位置 [no, yes] logits 的計算圖，輸出比整個詞表小得多"""
+    import torch
+
+    class YesNoHead(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, position_ids):
+            logits = self.model(input_ids=input_ids, attention_mask=attention_mask,
+                                position_ids=position_ids, use_cache=False).logits
+            return logits[:, -1, token_ids]
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    dummy = torch.ones(2, 8, dtype=torch.long)
+    axes = {0: "batch", 1: "seq"}
+    torch.onnx.export(
+        YesNoHead().eval(), (dummy, dummy, dummy.cumsum(-1) - 1), path + ".tmp",
+        input_names=["input_ids", "attention_mask", "position_ids"], output_names=["logits"],
+        dynamic_axes={"input_ids": axes, "attention_mask": axes, "position_ids": axes, "logits": {0: "batch"}},
+        opset_version=17, dynamo=False,
+    )
+    os.replace(path + ".tmp", path)
+
+
+class RerankerError(RuntimeError):
+    """reranker 無法使用：模型載入失敗、rerank 服務無法連線或回傳錯誤"""
+
+
+class RerankerBase(ABC):
+    """score / score_many / rerank 的共用邏輯，子類別只需實作 score_pairs（本機模型與 rerank 服務客戶端共用）"""
+
+    @abstractmethod
+    def score_pairs(self, pairs):
+        """pairs 為 [(query, doc), ...]，回傳同順序的分數列表"""
+
+    def score(self, query, docs):
+        return self.score_pairs([(query, d) for d in docs])
+
+    def score_many(self, requests):
+        """requests 為 [(query, [doc, ...]), ...]，所有問題的配對合併成同一組批次計算"""
+        pairs = [(q, d) for q, docs in requests for d in docs]
+        flat = self.score_pairs(pairs)
+        out, pos = [], 0
+        for _, docs in requests:
+            out.append(flat[pos:pos + len(docs)])
+            pos += len(docs)
+        return out
+
+    def rerank(self, query, docs, limit=3, scores=None):
+        """依分數排序，回傳前 limit 個文件"""
+        scores = self.score(query, docs) if scores is None else scores
+        combined = sorted(zip(docs, scores), key=lambda x: x[1], reverse=True)
+        return [d for d, _ in combined[:limit]]
+
+
+class Qwen3Reranker(RerankerBase):
+    """回傳每個候選文件「相關（yes）」的機率
+
+    - token_budget：每次前向計算的 token 數上限（批次大小 × padding 後長度）
+    - max_batch：每次前向計算最多幾個配對
+    - prefix_cache：同一查詢的候選共用前綴的 KV cache
+    - cache：選用的 RerankScoreCache，批次前先查快取，只有未命中的配對才送進模型
+    - backend：torch / int8 / onnx，num_threads 為 CPU 計算的執行緒數（None 表示預設）
+    """
+
+    def __init__(self, model_path, instruction=INSTRUCTION, max_length=2048,
+                 token_budget=8192, max_batch=32, device=None, prefix_cache=False, cache=None,
+                 backend="torch", num_threads=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"未知的 reranker backend: {backend}（可用：{', '.join(BACKENDS)}）")
+        self.model_path = model_path
+        self.backend = backend
+        self.num_threads = num_threads
+        self.session = None
+        self.prefix_cache = prefix_cache
+        self.cache = cache
+        self.instruction = instruction
+        self.max_length = max_length
+        self.token_budget = token_budget
+        self.max_batch = max_batch
+        self.device = device
+        self.requested_device = device  # load() 會把 device 改成實際裝置，快取鍵使用呼叫端指定的值
+        self.tokenizer = None
+        self.model = None
+
+    @property
+    def cache_id(self):
+        """分數快取鍵的模型部分：backend、精度、裝置類型與截斷長度都會影響分數，分開快取
+
+        裝置類型在載入模型前就要決定（完全命中快取時不載入模型），未指定 device 時記為 auto。
+        """
+        dtype = {"torch": "fp16", "int8": f"int8-{_int8_quantizer()}"}.get(self.backend, "fp32")
+        device = (self.requested_device or "auto").split(":")[0] if self.backend == "torch" else "cpu"
+        return f"{self.model_path}#{self.backend}|{dtype}|{device}|max_length={self.max_length}"
+
+    @property
+    def loaded(self):
+        return self.model is not None or self.session is not None
+
+    def load(self):
+        """第一次需要計算（分數快取未命中）時才匯入 torch / transformers 並載入模型，失敗時拋出 RerankerError"""
+        if self.loaded:
+            return self
+        print("⌛ 正在載入 Reranker 模型...")
+        try:
+            with startup.stage("載入 Reranker"):
+                self._load()
+        except Exception as e:
+            self.model = self.session = None
+            raise RerankerError(f"Reranker 模型載入失敗: {e}") from e
+        print(f"✅ 模型載入成功，運行於: {self.device}（backend: {self.backend}）")
+        return self
+
+    def _load(self):
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        os.environ.setdefault("TRANSFORMERS_OFFLINE", "1")
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            self.model_path, local_files_only=True, trust_remote_code=True, use_fast=False
+        )
+        self.tokenizer.padding_side = "left"
+        self.token_false_id = self.tokenizer.convert_tokens_to_ids("no")
+        self.token_true_id = self.tokenizer.convert_tokens_to_ids("yes")
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+
+        # CPU 上 float16 矩陣乘法很慢，int8 / onnx 都從 float32 權重開始
+        dtype = torch.float16 if self.backend == "torch" else torch.float32
+        self.model = AutoModelForCausalLM.from_pretrained(
+            self.model_path, local_files_only=True, trust_remote_code=True,
+            dtype=dtype, low_cpu_mem_usage=True
+        ).eval()
+        if self.backend == "torch":
+            self.device = self.device or ("cuda" if torch.cuda.is_available() else "cpu")
+            self.model.to(self.device)
+        elif self.backend == "int8":
+            self.device = "cpu"
+            self.model = _quantize_int8(self.model)
+        else:
+            self.device = "cpu"
+            self._load_onnx()
+
+    def _load_onnx(self):
+        import onnxruntime as ort
+
+        name = os.path.basename(os.path.normpath(self.model_path))
+        h = _model_signature(self.model_path)
+        h.update(f"|{self.token_false_id},{self.token_true_id}".encode("utf-8"))
+        path = os.path.join(ONNX_DIR, f"{name}-{h.hexdigest()[:16]}.onnx")
+        if not os.path.exists(path):
+            print(f"⌛ 匯出 ONNX 計算圖: {path}")
+            _export_onnx(self.model, path, [self.token_false_id, self.token_true_id])
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads:
+            options.intra_op_num_threads = self.num_threads
+        self.session = ort.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        # 匯出後即可釋放 PyTorch 權重
+        self.model = None
+
+    # --- 批次規劃 ---
+
+    def plan_batches(self, lengths):
+        """依長度排序後切批：padding 後 token 數不超過 token_budget，回傳索引批次列表"""
+        order = sorted(range(len(lengths)), key=lambda i: lengths[i])
+        batches, current, longest = [], [], 0
+        for i in order:
+            longest_if_added = max(longest, lengths[i])
+            if current and (len(current) >= self.max_batch or longest_if_added * (len(current) + 1) > self.token_budget):
+                batches.append(current)
+                current, longest_if_added = [], lengths[i]
+            current.append(i)
+            longest = longest_if_added
+        if current:
+            batches.append(current)
+        return batches
+
+    # --- 計分 ---
+
+    def _forward(self, input_ids):
+        """一批已 tokenize 的輸入做一次前向計算，回傳 yes 機率列表"""
+        import torch
+
+        if self.session is not None:
+            return self._forward_onnx(input_ids)
+        enc = self.tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="pt")
+        attention_mask = enc["attention_mask"].to(self.model.device)
+        # left padding 時位置編號從第一個真實 token 起算，與單筆計算一致
+        position_ids = (attention_mask.long().cumsum(-1) - 1).clamp(min=0)
+        with torch.no_grad():
+            logits = self.model(
+                input_ids=enc["input_ids"].to(self.model.device),
+                attention_mask=attention_mask,
+                position_ids=position_ids,
+            ).logits[:, -1, :]
+            batch_scores = torch.stack([logits[:, self.token_false_id], logits[:, self.token_true_id]], dim=1)
+            probs = torch.nn.functional.softmax(batch_scores.float(), dim=1)[:, 1]
+        return probs.tolist()
+
+    def _forward_onnx(self, input_ids):
+        import numpy as np
+
+        enc = self.tokenizer.pad({"input_ids": input_ids}, padding=True, return_tensors="np")
+        attention_mask = enc["attention_mask"].astype(np.int64)
+        position_ids = np.clip(attention_mask.cumsum(-1) - 1, 0, None)
+        logits = self.session.run(["logits"], {
+            "input_ids": enc["input_ids"].astype(np.int64),
+            "attention_mask": attention_mask,
+            "position_ids": position_ids,
+        })[0].astype(np.float64)
+        # 兩類 softmax：yes 機率 = sigmoid(yes - no)
+        return (1.0 / (1.0 + np.exp(logits[:, 0] - logits[:, 1]))).tolist()
+
+    def _forward_with_prefix(self, prefix_ids, suffixes):
+        """前綴計算一次後保留 KV cache，各批只計算文件部分；suffixes 為各候選前綴之後的 token"""
+        import torch
+
+        device = self.model.device
+        with torch.no_grad():
+            prefix = self.model(input_ids=torch.tensor([prefix_ids], device=device), use_cache=True)
+            past = prefix.past_key_values
+        p_len = len(prefix_ids)
+        pad_id = self.tokenizer.pad_token_id or 0
+
+        scores = [0.0] * len(suffixes)
+        for batch in self.plan_batches([len(s) for s in suffixes]):
+            rows = [suffixes[i] for i in batch]
+            width = max(len(r) for r in rows)
+            # right padding：真實 token 的位置連續接在前綴之後，padding 不影響前面的 token
+            input_ids = torch.tensor([r + [pad_id] * (width - len(r)) for r in rows], device=device)
+            suffix_mask = torch.tensor([[1] * len(r) + [0] * (width - len(r)) for r in rows], device=device)
+            attention_mask = torch.cat([torch.ones(len(rows), p_len, dtype=suffix_mask.dtype, device=device), suffix_mask], dim=1)
+            position_ids = torch.arange(p_len, p_len + width, device=device).unsqueeze(0).expand(len(rows), -1)
+            with torch.no_grad():
+                logits = self.model(
+                    input_ids=input_ids,
+                    attention_mask=attention_mask,
+                    position_ids=position_ids,
+                    past_key_values=_expand_cache(past, len(rows)),
+                ).logits
+                last = torch.tensor([len(r) - 1 for r in rows], device=device)
+                logits = logits[torch.arange(len(rows), device=device), last]
+                batch_scores = torch.stack([logits[:, self.token_false_id], logits[:, self.token_true_id]], dim=1)
+                probs = torch.nn.functional.softmax(batch_scores.float(), dim=1)[:, 1].tolist()
+            for i, s in zip(batch, probs):
+                scores[i] = s
+        return scores
+
+    def _score_encoded(self, encoded):
+        """已 tokenize 的輸入依 token 預算切批計算"""
+        scores = [0.0] * len(encoded)
+        for batch in self.plan_batches([len(ids) for ids in encoded]):
+            for i, s in zip(batch, self._forward([encoded[i] for i in batch])):
+                scores[i] = s
+        return scores
+
+    def _score_encoded_prefix(self, encoded):
+        """同一查詢的候選：取最長共同前綴做 KV cache（每個候選至少保留 1 個 token）"""
+        p_len = min(len(ids) for ids in encoded) - 1
+        first = encoded[0]
+        for ids in encoded[1:]:
+            n = 0
+            while n < p_len and ids[n] == first[n]:
+                n += 1
+            p_len = n
+        if p_len <= 0:
+            return self._score_encoded(encoded)
+        return self._forward_with_prefix(first[:p_len], [ids[p_len:] for ids in encoded])
+
+    def score_pairs(self, pairs):
+        """pairs 為 [(query, doc), ...]，回傳同順序的 yes 機率"""
+        if not pairs:
+            return []
+        if self.cache is None:
+            return self._score_uncached(pairs)
+
+        keys = [score_key(self.cache_id, self.instruction, q, d) for q, d in pairs]
+        scores = self.cache.get_many(keys)
+        # 同一配對只計算一次
+        missing = {}
+        for i, (key, s) in enumerate(zip(keys, scores)):
+            if s is None:
+                missing.setdefault(key, []).append(i)
+        if missing:
+            computed = self._score_uncached([pairs[idx[0]] for idx in missing.values()])
+            self.cache.put_many(list(missing), computed)
+            for idx, s in zip(missing.values(), computed):
+                for i in idx:
+                    scores[i] = s
+        return scores
+
+    def _score_uncached(self, pairs):
+        self.load()
+        texts = [format_pair(q, d, self.instruction) for q, d in pairs]
+        encoded = self.tokenizer(texts, truncation=True, max_length=self.max_length)["input_ids"]
+        if not self.prefix_cache or self.session is not None:
+            return self._score_encoded(encoded)
+
+        groups = {}
+        for i, (q, _) in enumerate(pairs):
+            groups.setdefault(q, []).append(i)
+        scores = [0.0] * len(pairs)
+        for idx in groups.values():
+            for i, s in zip(idx, self._score_encoded_prefix([encoded[i] for i in idx])):
+                scores[i] = s
+        return scores
@@ -0,0 +1,84 @@
+from qdrant_client import models
+
+# ============================================
+# 批次檢索：一次送出多個查詢
+# ============================================
+
+SPARSE_MODEL = "Qdrant/bm25"
+RRF_K = 2  # 與 Qdrant FusionQuery(RRF) 相同：1 / (k + 名次)，名次從 0 起算
+
+
+def _run_batches(client, collection_name, requests, chunk_size):
+    """分段呼叫 query_batch_points，回傳與 requests 同順序的 points 列表"""
+    results = []
+    for i in range(0, len(requests), chunk_size):
+        res = client.query_batch_points(collection_name=collection_name, requests=requests[i:i + chunk_size])
+        results.extend(r.points for r in res)
+    return results
+
+
+def batch_dense_search(client, collection_name, vectors, limit=5, using=None,
+                       query_filter=None, search_params=None, chunk_size=64):
+    """多個 dense 向量的批次檢索，第 i 個結果對應 vectors[i]"""
+    requests = [
+        models.QueryRequest(
+            query=vec, using=using, limit=limit, filter=query_filter,
+            params=search_params, with_payload=True,
+        )
+        for vec in vectors
+    ]
+    return _run_batches(client, collection_name, requests, chunk_size)
+
+
+def batch_hybrid_search(client, collection_name, texts, vectors, limit=15, prefetch_limit=15,
+                        dense_name="dense", sparse_name="sparse", sparse_model=SPARSE_MODEL,
+                        search_params=None, chunk_size=32, sparse_queries=None):
+    """sparse + dense prefetch 後以 RRF 融合的批次檢索，第 i 個結果對應 texts[i] / vectors[i]
+
+    sparse_queries 給定時（例如本機 BM25 匯出的 SparseVector）直接作為 sparse 查詢，不經 Qdrant 的 bm25 模型。
+    """
+    if sparse_queries is None:
+        sparse_queries = [models.Document(text=text, model=sparse_model) for text in texts]
+    requests = [
+        models.QueryRequest(
+            prefetch=[
+                models.Prefetch(query=sparse, using=sparse_name, limit=prefetch_limit),
+                models.Prefetch(query=vec, using=dense_name, limit=prefetch_limit, params=search_params),
+            ],
+            query=models.FusionQuery(fusion=models.Fusion.RRF),
+            limit=limit,
+            with_payload=True,
+        )
+        for sparse, vec in zip(sparse_queries, vectors)
+    ]
+    return _run_batches(client, collection_name, requests, chunk_size)
+
+
+def rrf_fuse(ranked_lists, limit=15, k=RRF_K):
+    """ranked_lists 為多個依名次排列的 id 列表，回傳 [(id, RRF 分數), ...]（由高到低）"""
+    scores = {}
+    for ranked in ranked_lists:
+        for rank, pid in enumerate(ranked):
+            scores[pid] = scores.get(pid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores.items(), key=lambda x: x[1], reverse=True)[:limit]
+
+
+def batch_local_hybrid_search(client, collection_name, texts, vectors, bm25, bm25_points, limit=15,
+                              prefetch_limit=15, dense_name="dense", search_params=None, chunk_size=64):
+    """dense 由 Qdrant 檢索、sparse 由本機 BM25Index 計算，再於本機以 RRF 融合
+
+    bm25_points[i] 為 BM25 文件 i 對應的 (point id, payload)；回傳與 batch_hybrid_search 相同的 ScoredPoint 列表。
+    """
+    dense_hits = batch_dense_search(client, collection_name, vectors, limit=prefetch_limit, using=dense_name,
+                                    search_params=search_params, chunk_size=chunk_size)
+    results = []
+    for text, hits in zip(texts, dense_hits):
+        payloads = {p.id: p.payload for p in hits}
+        sparse_ids = []
+        for i in bm25.search(text, prefetch_limit)[0]:
+            pid, payload = bm25_points[i]
+            payloads.setdefault(pid, payload)
+            sparse_ids.append(pid)
+        fused = rrf_fuse([sparse_ids, [p.id for p in hits]], limit)
+        results.append([models.ScoredPoint(id=pid, version=0, score=score, payload=payloads[pid]) for pid, score in fused])
+    return results
@@ -0,0 +1,83 @@
+import re
+
+import numpy as np
+
+# ============================================
+# 語意切塊：相鄰句子的向量相似度低處切開
+# ============================================
+#
+# 句子向量透過 EmbeddingClient 取得（分批、並行、依內容雜湊快取），重跑時全部命中快取；
+# 相鄰句子的相似度以一次向量化運算算出。切點的選法：
+#   threshold   相似度低於 threshold 處切開
+#   percentile  相似度最低的 percentile% 處切開（與文件整體的相似度分布相對）
+# min_chars / max_chars 限制區塊長度：未達 min_chars 不切，超過 max_chars 時強制切開。
+# embedding 失敗時直接拋出 EmbeddingError，不會默默改用固定長度切塊。
+
+BREAKPOINT_MODES = ("threshold", "percentile")
+
+_SENTENCE_RE = re.compile(r"([。！？\n]+)")
+
+
+def split_sentences(text, min_len=5):
+    """依中文句末標點與換行切句，標點保留在句尾；過短的片段捨棄"""
+    parts = _SENTENCE_RE.split(text)
+    sentences = ["".join(parts[i:i + 2]).strip() for i in range(0, len(parts) - 1, 2)]
+    return [s for s in sentences if len(s) > min_len]
+
+
+def adjacent_similarities(vectors):
+    """第 i 個值為句子 i 與 i+1 的餘弦相似度"""
+    v = np.asarray(vectors, dtype=np.float32)
+    v = v / np.maximum(np.linalg.norm(v, axis=1, keepdims=True), 1e-12)
+    return np.einsum("ij,ij->i", v[:-1], v[1:])
+
+
+class SemanticChunker:
+    """embedder 需提供 embed(texts, task_description=...)，例如 EmbeddingClient / ProjectedEmbedder"""
+
+    def __init__(self, embedder, mode="threshold", threshold=0.5, percentile=10.0,
+                 min_chars=0, max_chars=None, task_description=None):
+        if mode not in BREAKPOINT_MODES:
+            raise ValueError(f"未知的切點模式: {mode}（可用：{', '.join(BREAKPOINT_MODES)}）")
+        self.embedder = embedder
+        self.mode = mode
+        self.threshold = threshold
+        self.percentile = percentile
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+        self.task_description = task_description
+
+    def breakpoints(self, sims, lengths):
+        """回傳切點（句子索引，區塊從該句開始）"""
+        if self.mode == "threshold":
+            candidate = sims < self.threshold
+        else:
+            candidate = sims <= np.percentile(sims, self.percentile)
+
+        cuts, current = [], lengths[0]
+        for i in range(1, len(lengths)):
+            too_long = self.max_chars is not None and current + lengths[i] > self.max_chars
+            if too_long or (candidate[i - 1] and current >= self.min_chars):
+                cuts.append(i)
+                current = 0
+            current += lengths[i]
+        return cuts
+
+    def chunk(self, text):
+        sentences = split_sentences(text)
+        if not sentences:
+            return [text]
+        if len(sentences) == 1:
+            return sentences
+        vectors = self.embedder.embed(sentences, task_description=self.task_description)
+        sims = adjacent_similarities(vectors)
+        cuts = self.breakpoints(sims, [len(s) for s in sentences])
+        bounds = [0] + cuts + [len(sentences)]
+        chunks = ["".join(sentences[a:b]) for a, b in zip(bounds, bounds[1:])]
+        return [c for c in chunks if c.strip()] or [text]
+
+    def chunk_files(self, paths):
+        """逐檔讀取、切塊並產生 (路徑, 區塊列表)，一次只保留一個檔案的內容"""
+        for path in paths:
+            with open(path, "r", encoding="utf-8") as f:
+                yield path, self.chunk(f.read())
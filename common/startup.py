@@ -0,0 +1,70 @@
+import sys
+import time
+import builtins
+from contextlib import contextmanager
+
+# ============================================
+# 啟動時間分析（--startup-profile）
+# ============================================
+#
+# 以 --startup-profile 執行腳本時，記錄每個頂層套件第一次匯入的耗時（含其子模組）
+# 以及 stage() 標記的階段，在 finish() 印出報告後結束程式。
+
+enabled = "--startup-profile" in sys.argv
+_t0 = time.perf_counter()
+_imports = {}
+_stages = []
+_depth = 0
+
+
+def install():
+    """替換 __import__ 以記錄匯入耗時（只在 --startup-profile 時啟用）"""
+    if not enabled or getattr(builtins.__import__, "_startup_profile", False):
+        return
+    original = builtins.__import__
+
+    def timed_import(name, globals=None, locals=None, fromlist=(), level=0):
+        global _depth
+        top = name.split(".")[0]
+        if level or _depth or top in sys.modules:
+            return original(name, globals, locals, fromlist, level)
+        _depth += 1
+        t0 = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            _depth -= 1
+            _imports[top] = _imports.get(top, 0.0) + time.perf_counter() - t0
+
+    timed_import._startup_profile = True
+    builtins.__import__ = timed_import
+
+
+@contextmanager
+def stage(name):
+    """記錄一個啟動階段的耗時"""
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        _stages.append((name, time.perf_counter() - t0))
+
+
+def report():
+    total = time.perf_counter() - _t0
+    lines = [f"⏱️  啟動耗時 {total * 1000:.1f} ms", "   匯入："]
+    for name, sec in sorted(_imports.items(), key=lambda x: -x[1]):
+        if sec >= 0.001:
+            lines.append(f"     {name:24} {sec * 1000:8.1f} ms")
+    if _stages:
+        lines.append("   階段：")
+        for name, sec in _stages:
+            lines.append(f"     {name:24} {sec * 1000:8.1f} ms")
+    return "\n".join(lines)
+
+
+def finish():
+    """啟動完成：--startup-profile 時印出報告並結束"""
+    if enabled:
+        print(report())
+        sys.exit(0)
@@ -0,0 +1,55 @@
+from qdrant_client import models
+
+# ============================================
+# 向量儲存設定：float32 / float16 / int8 / binary
+# ============================================
+#
+# int8、binary 量化時原始向量放在磁碟（on_disk），量化向量常駐記憶體，
+# 查詢時先以量化向量取 limit * oversampling 個候選，再用原始向量重新計分（rescore）。
+
+STORAGE_PROFILES = ("float32", "float16", "int8", "binary")
+DEFAULT_OVERSAMPLING = {"int8": 2.0, "binary": 3.0}
+
+
+def vector_params(dim, profile="float32", distance=models.Distance.COSINE):
+    """依儲存設定產生 VectorParams"""
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f"未知的儲存設定: {profile}，可用: {', '.join(STORAGE_PROFILES)}")
+    if profile == "float16":
+        return models.VectorParams(size=dim, distance=distance, datatype=models.Datatype.FLOAT16)
+    if profile == "int8":
+        return models.VectorParams(
+            size=dim, distance=distance, on_disk=True,
+            quantization_config=models.ScalarQuantization(
+                scalar=models.ScalarQuantizationConfig(type=models.ScalarType.INT8, quantile=0.99, always_ram=True)
+            ),
+        )
+    if profile == "binary":
+        return models.VectorParams(
+            size=dim, distance=distance, on_disk=True,
+            quantization_config=models.BinaryQuantization(binary=models.BinaryQuantizationConfig(always_ram=True)),
+        )
+    return models.VectorParams(size=dim, distance=distance)
+
+
+def search_params(profile="float32", oversampling=None, rescore=True):
+    """查詢參數：量化設定使用 oversampling + rescore，其他設定回傳 None"""
+    if profile not in DEFAULT_OVERSAMPLING:
+        return None
+    return models.SearchParams(
+        quantization=models.QuantizationSearchParams(
+            rescore=rescore, oversampling=oversampling or DEFAULT_OVERSAMPLING[profile],
+        )
+    )
+
+
+def bytes_per_point(dim, profile="float32"):
+    """每個 point 的向量大小估算（不含 HNSW 索引與 payload），回傳 (RAM, 磁碟)"""
+    full = 4 * dim
+    if profile == "float16":
+        return 2 * dim, 2 * dim
+    if profile == "int8":
+        return dim, full + dim
+    if profile == "binary":
+        return dim // 8, full + dim // 8
+    return full, full
@@ -0,0 +1,126 @@
+import numpy as np
+
+# ============================================
+# 單次編碼的 token 視窗切塊
+# ============================================
+#
+# 文字只 tokenize 一次，直接在 token 位置上切出 chunk_size 個 token、重疊 chunk_overlap 個的視窗，
+# 每塊回傳 (文字, token 數, (起始字元, 結束字元))，不必再為了計算 token 數重新編碼。
+#
+# 輸入可以是字串或檔案物件：每次讀取 block_chars 個字元，在「字母 / 數字 + 含換行的空白」之間截斷後編碼
+# （見 _safe_cut），尚未湊滿視窗的尾端 token 連同原始位元組留到下一段，記憶體用量與檔案大小無關。
+#
+# token 可能只包含中文字的部分 UTF-8 位元組；字元範圍會向外擴到完整的字，文字不會出現亂碼。
+
+
+def _read_blocks(source, block_chars):
+    if isinstance(source, str):
+        for i in range(0, len(source), block_chars):
+            yield source[i:i + block_chars]
+        return
+    while True:
+        block = source.read(block_chars)
+        if not block:
+            return
+        yield block
+
+
+def _safe_cut(text):
+    """回傳不影響編碼結果的截斷位置（0 表示找不到）
+
+    cl100k / o200k 的預切分規則中，連續空白會合併（"\n\n" 是一個 token），標點也會吸收其後的換行，
+    因此只在「字母或數字」之後、含換行的整段空白之前截斷：前段以字母 / 數字結尾，空白整段留給下一段。
+    """
+    pos = len(text)
+    while True:
+        nl = text.rfind("\n", 0, pos)
+        if nl < 0:
+            return 0
+        i = nl
+        while i > 0 and text[i - 1].isspace():
+            i -= 1
+        if i > 0 and text[i - 1].isalnum():
+            return i
+        pos = i
+
+
+class TokenChunker:
+    """encoding 為 tiktoken 的 Encoding；total_tokens 在走訪 chunks() 時累計整份輸入的 token 數"""
+
+    def __init__(self, encoding, chunk_size=80, chunk_overlap=10, block_chars=1 << 20):
+        if not 0 <= chunk_overlap < chunk_size:
+            raise ValueError(f"chunk_overlap 必須介於 0 與 chunk_size 之間（收到 {chunk_overlap} / {chunk_size}）")
+        self.encoding = encoding
+        self.chunk_size = chunk_size
+        self.step = chunk_size - chunk_overlap
+        self.block_chars = block_chars
+        self.total_tokens = 0
+
+    def _windows(self, n, final):
+        """回傳 (視窗列表, 下一個未輸出視窗的起始 token)"""
+        windows, i = [], 0
+        while i < n:
+            end = min(i + self.chunk_size, n)
+            if end == n and not final:
+                break
+            windows.append((i, end))
+            if end == n:
+                return windows, n
+            i += self.step
+        return windows, i
+
+    def chunks(self, source):
+        """產生 (文字, token 數, (起始字元, 結束字元))，字元位置相對於整份輸入"""
+        pending = ""
+        carry_tokens, carry_lengths = [], np.empty(0, dtype=np.int64)
+        carry_bytes, skip, base = b"", 0, 0  # carry_bytes 從字元起點開始，前 skip 個位元組不屬於 carry_tokens
+        blocks = _read_blocks(source, self.block_chars)
+        block = next(blocks, None)
+        while block is not None:
+            nxt = next(blocks, None)
+            final = nxt is None
+            pending += block
+            cut = len(pending) if final else _safe_cut(pending)
+            if not cut:
+                block = nxt  # 找不到安全的截斷處，先累積到下一段
+                continue
+            # 只編碼新的文字（截斷處前後段的編碼與一次編碼相同）；之前的 token 原樣沿用
+            piece, pending = pending[:cut], pending[cut:]
+            new_tokens = self.encoding.encode(piece, disallowed_special=())
+            new_lengths = np.fromiter((len(b) for b in self.encoding.decode_tokens_bytes(new_tokens)),
+                                      dtype=np.int64, count=len(new_tokens))
+            tokens = carry_tokens + new_tokens
+            lengths = np.concatenate([carry_lengths, new_lengths])
+            data = carry_bytes + piece.encode("utf-8")
+            text = data.decode("utf-8")
+
+            # 位元組位置 → 字元位置；token 起點落在字元中間時向前對齊、終點向後對齊
+            is_start = (np.frombuffer(data, dtype=np.uint8) & 0xC0) != 0x80
+            chars_before = np.concatenate([[0], np.cumsum(is_start)])
+            byte_end = skip + np.cumsum(lengths)
+            byte_start = byte_end - lengths
+            starts = chars_before[byte_start] - ~np.append(is_start, True)[byte_start]
+            ends = chars_before[byte_end]
+
+            windows, next_token = self._windows(len(tokens), final)
+            for i, j in windows:
+                s, e = int(starts[i]), int(ends[j - 1])
+                yield text[s:e], j - i, (base + s, base + e)
+            self.total_tokens += next_token
+            if final:
+                break
+
+            # 尚未輸出的 token 連同對應位元組留到下一段
+            bs = int(byte_start[next_token]) if next_token < len(tokens) else len(data)
+            cs = bs
+            while cs > 0 and cs < len(data) and not is_start[cs]:
+                cs -= 1
+            carry_tokens, carry_lengths = tokens[next_token:], lengths[next_token:]
+            carry_bytes, skip = data[cs:], bs - cs
+            base += int(chars_before[cs])
+            block = nxt
+
+
+def token_chunks(source, encoding, chunk_size=80, chunk_overlap=10):
+    """TokenChunker 的簡便版本，直接回傳產生器"""
+    return TokenChunker(encoding, chunk_size, chunk_overlap).chunks(source)
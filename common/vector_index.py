@@ -0,0 +1,112 @@
+import os
+import json
+import hashlib
+
+import numpy as np
+
+from common.embed_cache import REPO_ROOT
+
+# ============================================
+# 本機向量索引：切塊只 embed 一次，查詢為一次矩陣乘法
+# ============================================
+#
+# 目錄結構：
+#   meta.json    筆數、維度、內容指紋（embedding 模型 + 任務描述 + 全部切塊文字）
+#   vectors.npy  (n, dim) float32、已正規化的連續矩陣，讀取時 memory-map
+#
+# 指紋不同（切塊或模型變動）時才重新 embed；查詢只需 embed 問題本身，
+# 相似度為 vectors @ query，前 k 名以 argpartition 取出後再排序。
+
+VECTOR_DIR = os.path.join(REPO_ROOT, ".cache", "vectors")
+
+
+def _normalize(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+def corpus_fingerprint(texts, model="", task_description=None):
+    h = hashlib.sha256()
+    for part in (model or "", task_description or ""):
+        h.update(part.encode("utf-8") + b"\x00")
+    for t in texts:
+        data = t.encode("utf-8")
+        h.update(len(data).to_bytes(8, "little"))
+        h.update(data)
+    return h.hexdigest()
+
+
+def top_k(scores, k):
+    """回傳分數最高的 k 個索引（由高到低）；scores 可為 1 維或 (查詢數, n) 的 2 維"""
+    scores = np.asarray(scores)
+    n = scores.shape[-1]
+    k = min(k, n)
+    if k <= 0:
+        return np.empty(scores.shape[:-1] + (0,), dtype=np.int64)
+    part = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+    order = np.argsort(-np.take_along_axis(scores, part, axis=-1), axis=-1, kind="stable")
+    return np.take_along_axis(part, order, axis=-1)
+
+
+class LocalVectorIndex:
+    """vectors 為 (n, dim) 已正規化矩陣，列號即切塊在原列表中的索引"""
+
+    def __init__(self, vectors, path=None, fingerprint=None):
+        self.vectors = vectors
+        self.path = path
+        self.fingerprint = fingerprint
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @classmethod
+    def load(cls, path):
+        """讀取已存在的索引；不存在或損壞時回傳 None"""
+        try:
+            with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+                meta = json.load(f)
+            vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if vectors.shape[0] != meta["count"]:
+            return None
+        return cls(vectors, path, meta["fingerprint"])
+
+    def save(self, path):
+        os.makedirs(path, exist_ok=True)
+        tmp = os.path.join(path, "vectors.tmp.npy")
+        np.save(tmp, np.ascontiguousarray(self.vectors, dtype=np.float32))
+        os.replace(tmp, os.path.join(path, "vectors.npy"))
+        meta = {"count": len(self.vectors), "dim": int(self.vectors.shape[1]), "fingerprint": self.fingerprint}
+        with open(os.path.join(path, "meta.json.tmp"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(os.path.join(path, "meta.json.tmp"), os.path.join(path, "meta.json"))
+        self.path = path
+        # 存檔後改用 memory-map，避免同時保留兩份矩陣
+        self.vectors = np.load(os.path.join(path, "vectors.npy"), mmap_mode="r")
+        return self
+
+    @classmethod
+    def open_or_build(cls, path, texts, embedder, task_description=None):
+        """指紋相同時直接 memory-map 既有矩陣，否則以 embedder 重新計算並存檔"""
+        fingerprint = corpus_fingerprint(texts, embedder.fingerprint(), task_description)
+        index = cls.load(path)
+        if index is not None and index.fingerprint == fingerprint:
+            print(f"✅ 載入本機向量索引：{len(index)} 個區塊（{path}）")
+            return index
+        print(f"⌛ 建立本機向量索引：{len(texts)} 個區塊...")
+        vectors = embedder.embed(texts, task_description=task_description)
+        return cls(_normalize(vectors), fingerprint=fingerprint).save(path)
+
+    def search(self, query_vector, k=5):
+        """回傳 (索引陣列, 分數陣列)，皆由高到低"""
+        scores = self.vectors @ _normalize(query_vector)
+        idx = top_k(scores, k)
+        return idx, scores[idx]
+
+    def search_many(self, query_vectors, k=5):
+        """多個查詢一次以矩陣乘法計算，回傳 (查詢數, k) 的索引與分數"""
+        scores = _normalize(query_vectors) @ self.vectors.T
+        idx = top_k(scores, k)
+        return idx, np.take_along_axis(scores, idx, axis=-1)
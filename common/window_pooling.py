@@ -0,0 +1,84 @@
+import re
+
+import numpy as np
+
+# ============================================
+# 滑動視窗向量池化：句子只 embed 一次
+# ============================================
+#
+# 重疊的滑動視窗（如 500/250）會讓每個字被送去 /embed 約兩次。這裡改把原文切成句子單位
+# （句末標點 / 換行，過長的句子再按 max_unit_chars 切開），每個單位只 embed 一次（並進 EmbeddingCache），
+# 視窗向量取其涵蓋單位的加權平均再正規化，權重為單位落在視窗內的字元數。
+#
+# 池化向量與直接 embed 視窗文字不同，集合應使用 fingerprint() 區分；品質以 bench/eval_window_pooling.py 評估。
+
+_UNIT_END_RE = re.compile(r"[。！？!?\n]+")
+
+
+class WindowPooler:
+    """embedder 需提供 embed(texts, task_description=...)，例如 EmbeddingClient / ProjectedEmbedder"""
+
+    def __init__(self, embedder, max_unit_chars=100, task_description=None):
+        self.embedder = embedder
+        self.max_unit_chars = max_unit_chars
+        self.task_description = task_description
+        self.unit_chars = 0    # 實際送出 embed 的單位字元數
+        self.window_chars = 0  # 若直接 embed 視窗需要送出的字元數
+
+    def fingerprint(self):
+        return f"{self.embedder.fingerprint()}|pooled:{self.max_unit_chars}"
+
+    def units(self, text):
+        """把整份文字切成首尾相接的單位，回傳 (starts, ends) 陣列"""
+        cuts = [m.end() for m in _UNIT_END_RE.finditer(text)]
+        bounds, prev = [0], 0
+        for end in cuts + [len(text)]:
+            bounds.extend(range(prev + self.max_unit_chars, end, self.max_unit_chars))
+            if end > prev:
+                bounds.append(end)
+            prev = end
+        bounds = np.asarray(bounds, dtype=np.int64)
+        return bounds[:-1], bounds[1:]
+
+    @staticmethod
+    def locate(text, chunks):
+        """找出每個切塊在原文中的 (start, end)；切塊須為原文的子字串（如 RecursiveCharacterTextSplitter 的輸出）"""
+        spans, pos = [], 0
+        for chunk in chunks:
+            i = text.find(chunk, pos)
+            if i < 0:
+                i = text.find(chunk)
+            if i < 0:
+                raise ValueError(f"切塊不在原文中，無法池化：{chunk[:30]}...")
+            spans.append((i, i + len(chunk)))
+            pos = i + 1
+        return spans
+
+    def embed_windows(self, text, chunks):
+        """回傳 chunks 的池化向量 (len(chunks), dim)；只 embed 被這些視窗涵蓋到的單位"""
+        if not chunks:
+            return np.empty((0, 0), dtype=np.float32)
+        starts, ends = self.units(text)
+        spans = self.locate(text, chunks)
+        ranges = [(int(np.searchsorted(ends, s, "right")), int(np.searchsorted(starts, e, "left"))) for s, e in spans]
+
+        needed = sorted({u for a, b in ranges for u in range(a, b) if text[starts[u]:ends[u]].strip()})
+        unit_texts = [text[starts[u]:ends[u]].strip() for u in needed]
+        vectors = np.asarray(self.embedder.embed(unit_texts, task_description=self.task_description),
+                             dtype=np.float32)
+        row = {u: i for i, u in enumerate(needed)}
+        self.unit_chars += sum(len(t) for t in unit_texts)
+        self.window_chars += sum(len(c) for c in chunks)
+
+        out = np.zeros((len(chunks), vectors.shape[1]), dtype=np.float32)
+        for w, ((s, e), (a, b)) in enumerate(zip(spans, ranges)):
+            units = [u for u in range(a, b) if u in row]
+            if not units:
+                continue
+            overlap = np.minimum(ends[units], e) - np.maximum(starts[units], s)
+            out[w] = overlap.astype(np.float32) @ vectors[[row[u] for u in units]]
+        return out / np.maximum(np.linalg.norm(out, axis=1, keepdims=True), 1e-12)
+
+    def stats(self):
+        saved = 1 - self.unit_chars / self.window_chars if self.window_chars else 0.0
+        return {"unit_chars": self.unit_chars, "window_chars": self.window_chars, "saved": saved}
@@ -1,26 +1,20 @@
-from langchain_text_splitters import RecursiveCharacterTextSplitter
 import tiktoken
 
-with open("text.txt", "r", encoding="utf-8") as f:
-    text = f.read()
-
-text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-    model_name = "gpt-4",
-    chunk_size = 80,
-    chunk_overlap = 10,
-    separators = [""]
-)
+from common.token_chunker import TokenChunker
 
 encoding = tiktoken.encoding_for_model("gpt-4")
 
-chunks = text_splitter.split_text(text)
+# 只編碼一次：直接在 token 位置切塊，每塊附帶 token 數與字元範圍
+chunker = TokenChunker(encoding, chunk_size=80, chunk_overlap=10)
+
+with open("text.txt", "r", encoding="utf-8") as f:
+    chunks = list(chunker.chunks(f))
 
-print(f"原始文本長度:{len(encoding.encode(text))}tokens")
+print(f"原始文本長度:{chunker.total_tokens}tokens")
 print(f"分塊數量:{len(chunks)}\n")
 
-for i,chunk in enumerate(chunks,1):
-    token_count = len(encoding.encode(chunk))
+for i, (chunk, token_count, span) in enumerate(chunks, 1):
     print(f"分塊:{i}")
     print(f"長度:{token_count}tokens")
     print(f"內容: {chunk[:50]}...")
-    print("-" * 20)
\ No newline at end of file
+    print("-" * 20)
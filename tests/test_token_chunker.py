@@ -0,0 +1,56 @@
+import os
+import sys
+
+import pytest
+
+tiktoken = pytest.importorskip("tiktoken")
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.token_chunker import TokenChunker
+
+# cl100k_base 的預切分規則；詞表改用位元組 + 少量合併，測試不需下載 BPE 檔
+CL100K_PATTERN = (r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}++|\p{N}{1,3}+| ?[^\s\p{L}\p{N}]++[\r\n]*+"""
+                  r"""|\s++$|\s*[\r\n]|\s+(?!\S)|\s""")
+
+
+def make_encoding():
+    ranks = {bytes([i]): i for i in range(256)}
+    for merged in [b"\n\n", b"  ", b"th", b"he", b"in", b"\xe4\xb8", b"\xe6\x96", b"\xe3\x80", b"\xe3\x80\x82"]:
+        ranks[merged] = len(ranks)
+    return tiktoken.Encoding("cl100k-pattern-test", pat_str=CL100K_PATTERN, mergeable_ranks=ranks,
+                             special_tokens={})
+
+
+def make_text(lines=3000):
+    parts = ["the quick brown fox 12345", "中文句子結尾。", "", "  indented line\tend", "標點結尾！\n",
+             "trailing spaces   ", "word's end", "數字 2024 年"]
+    return "\n".join(parts[i % len(parts)] + (str(i) if i % 5 == 0 else "") for i in range(lines))
+
+
+def reference_windows(encoding, text, size, overlap):
+    tokens = encoding.encode(text, disallowed_special=())
+    windows, i = [], 0
+    while i < len(tokens):
+        end = min(i + size, len(tokens))
+        windows.append(encoding.decode_bytes(tokens[i:end]))
+        if end == len(tokens):
+            break
+        i += size - overlap
+    return tokens, windows
+
+
+@pytest.mark.parametrize("text", ["abc\n\ndef", make_text()], ids=["blank-line", "mixed-3000-lines"])
+@pytest.mark.parametrize("block_chars", [4, 37, 100, 1000])
+def test_streamed_matches_single_encode(text, block_chars):
+    encoding = make_encoding()
+    tokens, expected = reference_windows(encoding, text, 80, 10)
+    chunker = TokenChunker(encoding, 80, 10, block_chars=block_chars)
+    chunks = list(chunker.chunks(text))
+
+    assert chunker.total_tokens == len(tokens)
+    assert len(chunks) == len(expected)
+    for (chunk, count, (start, end)), window in zip(chunks, expected):
+        assert chunk == text[start:end]
+        assert window in chunk.encode("utf-8")  # 視窗邊界可能落在字的中間，文字向外擴到完整的字
+    single = list(TokenChunker(encoding, 80, 10, block_chars=len(text) + 1).chunks(text))
+    assert chunks == single